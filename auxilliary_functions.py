@@ -1,5 +1,4 @@
 import os
-import platform
 
 # def blinking_dots():
 #     pass
@@ -8,6 +7,7 @@ def clear_console():
     os.system('cls' if os.name == 'nt' else 'clear')
 
 def flush_input():
+    import platform
     if platform.system() != 'Windows':
         import sys, termios
         termios.tcflush(sys.stdin, termios.TCIOFLUSH)
@@ -0,0 +1,195 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from document import (Document, DocumentRegistry, Email, Letter, Slideshow, Spreadsheet,
+                      SearchIndex, save_search_index, sync_search_index)
+from storage import open_store
+
+WORDS = ("budget report invoice meeting quarterly review roadmap summary draft "
+         "update sales forecast project launch team notes agenda payment").split()
+
+
+def sentence(rng, words=8):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def make_document(rng, number):
+    # Cycles through the four types so every corpus has the same mix.
+    kind = number % 4
+    title, author = sentence(rng, 3), f"author{rng.randrange(100)}"
+    if kind == 0:
+        sheet = Spreadsheet(title, author, sentence(rng), rows=20, cols=8)
+        for row in range(20):
+            sheet.table[row] = [str(rng.randrange(1000)) for _ in range(6)] + ["=SUM(A{0}:F{0})".format(row + 1)]
+        return sheet
+    if kind == 1:
+        deck = Slideshow(title, author, sentence(rng), 5)
+        deck.slides = [sentence(rng, 12) for _ in range(5)]
+        return deck
+    if kind == 2:
+        return Email(title, author, f"{author}@mail.com", "team@corp.com", sentence(rng, 60),
+                     sentence(rng, 4), "Team", "boss@corp.com")
+    return Letter(title, author, "Batangas City", "Alangilan", sentence(rng, 60),
+                  sentence(rng, 4), "Sir", True)
+
+
+def corpus(size, seed=0):
+    rng = random.Random(seed)
+    return [make_document(rng, number) for number in range(size)]
+
+
+def summarize(samples):
+    # Latencies in milliseconds.
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": ordered[-1] * 1000,
+        "total_s": sum(ordered),
+    }
+
+
+def timed(function, items):
+    samples = []
+    clock = time.perf_counter
+    for item in items:
+        started = clock()
+        function(item)
+        samples.append(clock() - started)
+    return summarize(samples)
+
+
+def timed_once(function):
+    started = time.perf_counter()
+    function()
+    return summarize([time.perf_counter() - started])
+
+
+def peak_memory(function):
+    # Traced separately from the timings, tracemalloc slows everything down.
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@contextlib.contextmanager
+def scratch_store(path):
+    saved = Document.store, Document.saved_documents, Document.search_index
+    Document.store = open_store(path)
+    Document.saved_documents = DocumentRegistry(store=Document.store)
+    Document.search_index = SearchIndex()
+    try:
+        yield
+    finally:
+        Document.store, Document.saved_documents, Document.search_index = saved
+
+
+def load():
+    # What init() does, minus the messages and the atexit hooks.
+    Document.store = open_store(Document.store.path)
+    Document.saved_documents = DocumentRegistry(Document.store.load_headers(), Document.store)
+    Document.search_index = SearchIndex()
+    sync_search_index()
+
+
+def remove(doc_id):
+    Document.saved_documents.remove(doc_id)
+    Document.discard(doc_id)
+
+
+def run(size, seed=0, directory=None, backend="log"):
+    documents = corpus(size, seed)
+    ids = [document.id for document in documents]
+    rng = random.Random(seed)
+    sample = rng.sample(ids, min(len(ids), 1000))
+
+    with tempfile.TemporaryDirectory(dir=directory) as tmp, \
+            scratch_store(os.path.join(tmp, "docs.db" if backend == "sqlite" else "docs")):
+        results = {"documents": size, "backend": backend}
+        # save() is persist() plus a confirmation message.
+        results["save"] = timed(Document.persist, documents)
+        results["store_bytes"] = sum(os.path.getsize(path) for path in
+                                     (Document.store.path, Document.store.path + "-wal")
+                                     if os.path.exists(path))
+
+        results["load_cold"] = timed_once(load)
+        Document.store.checkpoint()
+        save_search_index()
+        results["load_checkpointed"] = timed_once(load)
+
+        results["lookup_cold"] = timed(Document.saved_documents.get, sample)
+        results["lookup_warm"] = timed(Document.saved_documents.get, sample)
+
+        loaded = [Document.saved_documents.get(doc_id) for doc_id in sample]
+        results["render_cold"] = timed(Document.render, loaded)
+        results["render_cached"] = timed(Document.render, loaded)
+
+        removed = sample[:max(1, len(sample) // 10)]
+        results["remove"] = timed(remove, removed)
+
+        # Building documents under tracemalloc is slow, so the in-memory
+        # footprint is taken from the first thousand and scaled.
+        traced = min(size, 1000)
+        results["peak_memory_bytes"] = {
+            "document_average": peak_memory(lambda: corpus(traced, seed)) // traced,
+            "loaded_document_average": peak_memory(
+                lambda: [Document.store.read(doc_id) for doc_id in sample[len(removed):]])
+            // max(1, len(sample) - len(removed)),
+            "load_checkpointed": peak_memory(load),
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time saving, loading, lookups, rendering and removal on synthetic corpora.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="corpus sizes to run, e.g. 1000 10000 100000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=("log", "sqlite"), default="log")
+    parser.add_argument("--output", default="benchmark.json", help="where to write the JSON results")
+    args = parser.parse_args(argv)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "runs": [],
+    }
+    for size in args.sizes:
+        results = run(size, args.seed, backend=args.backend)
+        report["runs"].append(results)
+        print(f"{size} documents: save p50 {results['save']['p50_ms']:.3f}ms, "
+              f"load {results['load_checkpointed']['total_s']:.3f}s "
+              f"(cold {results['load_cold']['total_s']:.3f}s), "
+              f"lookup p50 {results['lookup_cold']['p50_ms']:.3f}ms, "
+              f"render p50 {results['render_cold']['p50_ms']:.3f}ms", file=sys.stderr)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
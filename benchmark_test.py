@@ -0,0 +1,25 @@
+import json
+
+import benchmark
+from document import Document
+
+
+def test_benchmark_reports_every_operation(tmp_path):
+    store = Document.store
+    output = tmp_path / "results.json"
+    benchmark.main(["--sizes", "40", "--output", str(output)])
+    assert Document.store is store
+
+    run, = json.loads(output.read_text())["runs"]
+    assert run["documents"] == 40
+    assert run["save"]["count"] == 40
+    assert run["lookup_cold"]["count"] == run["render_cached"]["count"] == 40
+    assert run["remove"]["count"] == 4
+    assert run["load_cold"]["p50_ms"] > 0
+    assert run["peak_memory_bytes"]["document_average"] > 0
+    assert run["peak_memory_bytes"]["loaded_document_average"] > 0
+
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    test_benchmark_reports_every_operation(pathlib.Path(tempfile.mkdtemp()))
@@ -0,0 +1,124 @@
+import argparse
+import csv
+import json
+import os
+import time
+
+from document import Document, Email, Letter, Slideshow, Spreadsheet, init
+
+DOCUMENT_TYPES = {cls.__name__.lower(): cls for cls in (Email, Letter, Slideshow, Spreadsheet)}
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def read_json_lines(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_json_array(path, chunk_size=1 << 16):
+    # Decodes the objects of a top-level JSON array one at a time instead of
+    # loading the whole file.
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not contain a JSON array.")
+        buffer = buffer[1:]
+        eof = False
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(chunk_size)
+                eof = not more
+                buffer += more
+                continue
+            yield record
+            buffer = buffer[end:]
+
+
+def read_records(path, fmt=None):
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    readers = {
+        "csv": read_csv,
+        "jsonl": read_json_lines,
+        "ndjson": read_json_lines,
+        "json": read_json_array,
+    }
+    if fmt not in readers:
+        raise ValueError(f"Unsupported import format {fmt!r}, use csv, json or jsonl.")
+    return readers[fmt](path)
+
+
+def build_document(record):
+    kind = str(record.get("type", "")).strip().lower()
+    if kind not in DOCUMENT_TYPES:
+        raise ValueError(f"Unknown document type {record.get('type')!r}.")
+    return DOCUMENT_TYPES[kind].from_record(record)
+
+
+def import_records(records, progress_every=10000, report=print):
+    # Every document of the batch goes to the store in one put_many() call,
+    # so the whole import costs a single append to files/docs.
+    imported = []
+    started = time.perf_counter()
+
+    def documents():
+        for number, record in enumerate(records, 1):
+            try:
+                document = build_document(record)
+            except (ValueError, TypeError) as error:
+                raise ValueError(f"Record {number}: {error}") from None
+            Document.search_index.add(document)
+            imported.append(document.id)
+            if progress_every and number % progress_every == 0:
+                rate = number / max(time.perf_counter() - started, 1e-9)
+                report(f"{number} records read ({rate:.0f} records/s)")
+            yield document
+
+    try:
+        headers = Document.store.put_many(documents())
+    except BaseException:
+        for doc_id in imported:
+            Document.search_index.remove(doc_id)
+        raise
+    for header in headers:
+        Document.saved_documents.put(header)
+
+    elapsed = time.perf_counter() - started
+    report(f"Imported {len(headers)} documents in {elapsed:.2f}s "
+           f"({len(headers) / max(elapsed, 1e-9):.0f} documents/s)")
+    return len(headers)
+
+
+def import_file(path, fmt=None, progress_every=10000, report=print):
+    return import_records(read_records(path, fmt), progress_every, report)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Import Email, Letter, Slideshow and Spreadsheet records in one batch.")
+    parser.add_argument("path", help="CSV, JSON array or JSON lines file; each record needs a 'type'")
+    parser.add_argument("--format", choices=("csv", "json", "jsonl"),
+                        help="input format, guessed from the file extension by default")
+    parser.add_argument("--progress-every", type=int, default=10000,
+                        help="report throughput every N records (0 to disable)")
+    args = parser.parse_args(argv)
+
+    init()
+    import_file(args.path, args.format, args.progress_every)
+
+
+if __name__ == "__main__":
+    main()
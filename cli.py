@@ -0,0 +1,304 @@
+import argparse
+import json
+import os
+import sys
+
+from bulk_import import DOCUMENT_TYPES, build_document, import_file
+from document import (Document, DocumentRegistry, Spreadsheet, ensure_search_index,
+                      refresh_documents, save_search_index)
+from history import FULL, open_history
+import storage
+
+
+# Headless access to the document store: every subcommand works on the store
+# directly and prints JSON, without prompts, sleeps or console clearing.
+def open_store(path, **options):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    Document.store = storage.open_store(path, **options)
+    open_history(path, **options)
+    Document.saved_documents = DocumentRegistry(Document.store.load_headers(), Document.store)
+
+
+def store_options(args):
+    return storage.compression_options(args.codec, args.compress_min_bytes)
+
+
+def parse_fields(pairs, data):
+    record = json.loads(data) if data else {}
+    for pair in pairs or ():
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise ValueError(f"Expected NAME=VALUE, got {pair!r}.")
+        record[name] = value
+    return record
+
+
+def find(doc_id):
+    document = Document.saved_documents.get(doc_id)
+    if document is None:
+        raise LookupError(f"No document with id {doc_id!r}.")
+    return document
+
+
+def header_record(header):
+    return {"id": header.id, "type": header.type_name,
+            "title": header.title, "author": header.author}
+
+
+def run_list(args):
+    type_name = None
+    if args.type:
+        if args.type.lower() not in DOCUMENT_TYPES:
+            raise ValueError(f"Unknown document type {args.type!r}.")
+        type_name = DOCUMENT_TYPES[args.type.lower()].__name__
+    headers = Document.store.query(type_name=type_name, author=args.author,
+                                   title_prefix=args.title)
+    if args.search:
+        ensure_search_index()
+        matches = Document.search_index.search(args.search)
+        headers = [header for header in headers if header.id in matches]
+    return [header_record(header) for header in headers]
+
+
+def run_show(args):
+    document = find(args.id)
+    if args.revision is None:
+        return document.to_record()
+    record = document.revision_record(args.revision)
+    if record is None:
+        raise LookupError(f"Revision {args.revision} of {args.id!r} is not in the history.")
+    return record
+
+
+def run_history(args):
+    find(args.id)
+    history = open_history(Document.store.path)
+    return [{"revision": entry.revision, "stored": "full" if entry.kind == FULL else "delta",
+             "bytes": entry.length} for entry in history.revisions(args.id)]
+
+
+def run_create(args):
+    record = parse_fields(args.field, args.data)
+    document = build_document(dict(record, type=args.type))
+    document.persist()
+    return {"id": document.id, "status": "created"}
+
+
+def run_update(args):
+    document = find(args.id)
+    document.apply_record(parse_fields(args.field, args.data))
+    document.persist()
+    return {"id": document.id, "status": "updated"}
+
+
+def run_delete(args):
+    find(args.id)
+    Document.saved_documents.remove(args.id)
+    Document.discard(args.id)
+    return {"id": args.id, "status": "deleted"}
+
+
+def run_import(args):
+    count = import_file(args.path, args.format, progress_every=0, report=lambda message: None)
+    return {"imported": count}
+
+
+def find_spreadsheet(doc_id):
+    document = find(doc_id)
+    if not isinstance(document, Spreadsheet):
+        raise ValueError(f"Document {doc_id!r} is a {document.type_name}, not a Spreadsheet.")
+    return document
+
+
+def run_import_csv(args):
+    import sheet_csv
+    sheet = find_spreadsheet(args.id)
+    count = sheet_csv.import_csv(sheet, args.path, replace=not args.append, progress_every=0,
+                                 report=lambda message: None)
+    sheet.persist()
+    return {"id": sheet.id, "rows": count, "status": "imported"}
+
+
+def run_export_csv(args):
+    import sheet_csv
+    count = sheet_csv.export_csv(find_spreadsheet(args.id), args.path, values=args.values,
+                                 progress_every=0, report=lambda message: None)
+    return {"id": args.id, "rows": count, "status": "exported"}
+
+
+def run_export(args):
+    import export
+    count, failed = export.export_documents(args.directory, args.format, ids=args.id,
+                                            processes=args.processes, chunk_size=args.chunk_size,
+                                            progress_every=0, report=lambda message: None)
+    return {"exported": count, "failed": [{"id": doc_id, "error": error} for doc_id, error in failed],
+            "directory": args.directory, "format": args.format}
+
+
+def run_compact(args):
+    size = os.path.getsize(Document.store.path) if os.path.exists(Document.store.path) else 0
+    if len(Document.store):
+        Document.store.compact(recode=args.recode)
+    # Revisions of documents removed since are dropped with the store's.
+    open_history(Document.store.path).compact(keep={header.id for header in Document.store.headers()},
+                                              recode=args.recode)
+    return {"bytes_before": size, "bytes_after": os.path.getsize(Document.store.path) if size else 0}
+
+
+def run_copy(args):
+    # E.g. from files/docs into files/docs.db to switch to the SQLite backend.
+    target = storage.open_store(args.target, **store_options(args))
+    target.load_headers()
+    headers = target.put_many(Document.store.read(header.id) for header in Document.store.headers())
+    target.checkpoint()
+    return {"copied": len(headers), "target": args.target}
+
+
+def run_batch(args):
+    # One JSON command per input line, e.g. {"command": "show", "id": "..."};
+    # one JSON result per output line. Saves the process start-up per call.
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            # Other processes may have written since the last command.
+            refresh_documents()
+            request = json.loads(line)
+            command = request.pop("command")
+            defaults = dict(COMMAND_DEFAULTS[command], codec=args.codec,
+                            compress_min_bytes=args.compress_min_bytes)
+            namespace = argparse.Namespace(**dict(defaults, **request))
+            result = {"ok": True, "result": COMMANDS[command](namespace)}
+        except (KeyError, LookupError, ValueError, TypeError, storage.StaleWriteError) as error:
+            result = {"ok": False, "error": str(error)}
+        print(json.dumps(result, default=str), flush=True)
+
+
+COMMANDS = {
+    "list": run_list,
+    "show": run_show,
+    "history": run_history,
+    "create": run_create,
+    "update": run_update,
+    "delete": run_delete,
+    "import": run_import,
+    "import-csv": run_import_csv,
+    "export-csv": run_export_csv,
+    "export": run_export,
+    "compact": run_compact,
+    "copy": run_copy,
+}
+
+COMMAND_DEFAULTS = {
+    "list": {"type": None, "author": None, "title": None, "search": None},
+    "show": {"revision": None},
+    "history": {},
+    "create": {"field": None, "data": None},
+    "update": {"field": None, "data": None},
+    "delete": {},
+    "import": {"format": None},
+    "import-csv": {"append": False},
+    "export-csv": {"values": False},
+    "export": {"format": "txt", "id": None, "processes": None, "chunk_size": 256},
+    "compact": {"recode": False},
+    "copy": {},
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="document.py", description="Headless document manager.")
+    parser.add_argument("--store", default=os.environ.get("DOCUMENT_MANAGER_STORE", "files/docs"),
+                        help="path of the document store; .db, .sqlite or .sqlite3 use SQLite")
+    parser.add_argument("--codec", choices=(*storage.CODECS, "none"),
+                        help="compression of saved records (default: $DOCUMENT_MANAGER_CODEC or zlib)")
+    parser.add_argument("--compress-min-bytes", type=int, metavar="BYTES",
+                        help="smallest record body that is compressed (default: "
+                             "$DOCUMENT_MANAGER_COMPRESS_MIN_BYTES or 512)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="list documents")
+    list_parser.add_argument("--type", help="only documents of this type")
+    list_parser.add_argument("--author", help="only documents by this author")
+    list_parser.add_argument("--title", help="only documents whose title starts with this")
+    list_parser.add_argument("--search", help="only documents matching this query")
+
+    show_parser = commands.add_parser("show", help="print one document")
+    show_parser.add_argument("id")
+    show_parser.add_argument("--revision", type=int, help="the document as it was at this revision")
+
+    history_parser = commands.add_parser("history", help="list a document's saved revisions")
+    history_parser.add_argument("id")
+
+    for name, help_text in (("create", "create a document"), ("update", "change a document")):
+        command = commands.add_parser(name, help=help_text)
+        if name == "create":
+            command.add_argument("type", choices=sorted(DOCUMENT_TYPES), type=str.lower)
+        else:
+            command.add_argument("id")
+        command.add_argument("--field", "-f", action="append", metavar="NAME=VALUE",
+                             help="field to set, may be repeated")
+        command.add_argument("--data", help="fields as a JSON object")
+
+    delete_parser = commands.add_parser("delete", help="remove a document")
+    delete_parser.add_argument("id")
+
+    import_parser = commands.add_parser("import", help="bulk import a CSV or JSON file")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=("csv", "json", "jsonl"))
+
+    import_csv_parser = commands.add_parser("import-csv", help="load a spreadsheet's cells from CSV")
+    import_csv_parser.add_argument("id")
+    import_csv_parser.add_argument("path")
+    import_csv_parser.add_argument("--append", action="store_true",
+                                   help="add the rows below the existing ones")
+
+    export_csv_parser = commands.add_parser("export-csv", help="write a spreadsheet's cells to CSV")
+    export_csv_parser.add_argument("id")
+    export_csv_parser.add_argument("path")
+    export_csv_parser.add_argument("--values", action="store_true",
+                                   help="write formula results instead of the formulas")
+
+    export_parser = commands.add_parser("export", help="render documents to text, Markdown or HTML files")
+    export_parser.add_argument("directory", help="where <id>.<format> files are written")
+    export_parser.add_argument("--format", choices=("txt", "md", "html"), default="txt")
+    export_parser.add_argument("--id", action="append",
+                               help="only this document, may be repeated; every document by default")
+    export_parser.add_argument("--processes", type=int,
+                               help="worker processes, up to one per core by default")
+    export_parser.add_argument("--chunk-size", type=int, default=256,
+                               help="documents handed to a worker at a time")
+
+    compact_parser = commands.add_parser("compact", help="drop superseded records from the store")
+    compact_parser.add_argument("--recode", action="store_true",
+                                help="also compress records saved without compression")
+
+    copy_parser = commands.add_parser("copy", help="copy every document into another store")
+    copy_parser.add_argument("target", help="path of the target store, e.g. files/docs.db")
+
+    commands.add_parser("batch", help="run JSON commands read from stdin, one per line")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        open_store(args.store, **store_options(args))
+    except ValueError as error:
+        print(json.dumps({"error": str(error)}), file=sys.stderr)
+        return 1
+    try:
+        if args.command == "batch":
+            run_batch(args)
+        else:
+            print(json.dumps(COMMANDS[args.command](args), indent=2, default=str))
+    except (LookupError, ValueError, storage.StaleWriteError) as error:
+        print(json.dumps({"error": str(error)}), file=sys.stderr)
+        return 1
+    finally:
+        Document.store.maybe_checkpoint()
+        save_search_index()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import io
+import json
+
+import cli
+import document
+from document import Document
+from search import SearchIndex
+
+
+def run(capsys, *argv):
+    assert cli.main(list(argv)) == 0
+    return json.loads(capsys.readouterr().out)
+
+
+def test_cli_create_update_delete(tmp_path, monkeypatch, capsys):
+    for name in ("store", "saved_documents"):
+        monkeypatch.setattr(Document, name, getattr(Document, name))
+    monkeypatch.setattr(Document, "search_index", SearchIndex())
+    monkeypatch.setattr(document, "_search_synced", False)
+    store = ["--store", str(tmp_path / "docs")]
+
+    doc_id = run(capsys, *store, "create", "email", "-f", "title=Budget", "-f", "author=Ann")["id"]
+    run(capsys, *store, "update", doc_id, "--data", '{"text": "quarterly numbers"}')
+    shown = run(capsys, *store, "show", doc_id)
+    assert (shown["type"], shown["title"], shown["text"]) == ("Email", "Budget", "quarterly numbers")
+    assert [row["id"] for row in run(capsys, *store, "list", "--search", "quarterly")] == [doc_id]
+
+    # A misspelled field is an error, not an update that changes nothing
+    assert cli.main([*store, "update", doc_id, "-f", "titel=Other", "-f", "title=Other"]) == 1
+    assert "'titel'" in json.loads(capsys.readouterr().err)["error"]
+    assert run(capsys, *store, "show", doc_id)["title"] == "Budget"
+
+    commands = [{"command": "create", "type": "letter", "data": '{"title": "Hi"}'},
+                {"command": "show", "id": "missing"},
+                {"command": "delete", "id": doc_id}]
+    monkeypatch.setattr("sys.stdin", io.StringIO("".join(json.dumps(c) + "\n" for c in commands)))
+    assert cli.main([*store, "batch"]) == 0
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [result["ok"] for result in results] == [True, False, True]
+
+    listed = run(capsys, *store, "list")
+    assert [(row["type"], row["title"]) for row in listed] == [("Letter", "Hi")]
+    assert cli.main([*store, "show", doc_id]) == 1
+
+
+def test_cli_compression_options(tmp_path, monkeypatch, capsys):
+    for name in ("store", "saved_documents"):
+        monkeypatch.setattr(Document, name, getattr(Document, name))
+    monkeypatch.setattr(Document, "search_index", SearchIndex())
+    monkeypatch.setattr(document, "_search_synced", False)
+    path = str(tmp_path / "docs")
+    text = "quarterly budget numbers " * 100
+
+    monkeypatch.setenv("DOCUMENT_MANAGER_CODEC", "none")
+    doc_id = run(capsys, "--store", path, "create", "email", "-f", f"text={text}")["id"]
+    for suffix in ("", ".history"):
+        assert b"budget numbers quarterly budget" in open(path + suffix, "rb").read()
+
+    # The option wins over the environment, and compact --recode applies it
+    run(capsys, "--store", path, "--codec", "lzma", "compact", "--recode")
+    for suffix in ("", ".history"):
+        data = open(path + suffix, "rb").read()
+        assert b"budget numbers quarterly budget" not in data and b"\xfd7zXZ" in data
+    assert run(capsys, "--store", path, "show", doc_id)["text"].startswith("quarterly budget")
+    assert run(capsys, "--store", path, "show", doc_id, "--revision", "1")["text"].startswith("quarterly")
+
+    monkeypatch.setenv("DOCUMENT_MANAGER_COMPRESS_MIN_BYTES", "many")
+    assert cli.main(["--store", path, "list"]) == 1
+    assert "compress_min_bytes" in json.loads(capsys.readouterr().err)["error"]
@@ -0,0 +1,27 @@
+import pytest
+
+from document import Document
+from registry import DocumentRegistry
+from search import SearchIndex
+from storage import LogStore
+
+
+@pytest.fixture
+def use_store(monkeypatch):
+    # Points Document at a store for the rest of the test, with a registry
+    # over it (a new one unless given), an empty search index and no
+    # deferred releases.
+    def use(store, registry=None):
+        monkeypatch.setattr(Document, "store", store)
+        monkeypatch.setattr(Document, "saved_documents",
+                            DocumentRegistry(store=store) if registry is None else registry)
+        monkeypatch.setattr(Document, "search_index", SearchIndex())
+        monkeypatch.setattr(Document, "deferred_releases", set())
+        return store
+    return use
+
+
+@pytest.fixture
+def store(tmp_path, use_store):
+    # A new log store in tmp_path that documents are saved to.
+    return use_store(LogStore(str(tmp_path / "docs")))
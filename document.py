@@ -1,31 +1,164 @@
 from abc import ABC, abstractmethod
 from auxilliary_functions import clear_console, flush_input
+from picker import Picker
+from registry import DocumentRegistry
+from search import SearchIndex
+from storage import DocumentHeader, StaleWriteError, compression_options, open_store
+from formulas import FormulaEngine, cell_name, parse_cell
+from history import open_history
+from table import NUMBER, SparseTable, aggregate
+from viewport import Viewport, cell_text
+from writer import WriteBehind
+import atexit
+import collections
+import functools
+import instrumentation
 import os
-import pickle
-import textwrap
-import datetime
-import keyboard
-import uuid
+import sys
+import keys
 import time
 
 CLEAR = "\033[K"
 
+UNDONE = "The last saved change has been undone."
+NOTHING_TO_UNDO = "There is nothing to undo."
+
+
+@functools.lru_cache(maxsize=None)
+def state_fields(cls):
+    # Every slot of cls and its bases; these are what gets pickled. Derived
+    # state is left out and rebuilt on load.
+    return tuple(name for klass in reversed(cls.__mro__)
+                 for name in klass.__dict__.get("__slots__", ())
+                 if name not in ("_rendered", "_base", "_undo_to", "_formulas"))
+
+
+def today():
+    import datetime
+    return datetime.date.today()
+
+
+def parse_date(value):
+    import datetime
+    return datetime.date.fromisoformat(str(value))
+
+
+def record_cells(value):
+    # Spreadsheet cells by name, e.g. {"B3": "=A1*2"}, as (row, col) keys.
+    if not value:
+        return {}
+    if isinstance(value, str):
+        import json
+        value = json.loads(value)
+    return {parse_cell(name): str(cell) for name, cell in value.items()
+            if cell not in (None, "")}
+
+
+def record_list(value):
+    # Lists arrive as real lists from JSON and as JSON text from CSV cells.
+    if not value:
+        return []
+    if isinstance(value, str):
+        import json
+        value = json.loads(value)
+    return list(value)
+
+
+def merge_records(base, mine, theirs):
+    # The fields of theirs that mine has to take over in a three-way merge,
+    # or None if both changed the same field. Fields holding dicts, like a
+    # spreadsheet's cells, are merged key by key; a key missing on one side
+    # is one that side removed.
+    taken = {}
+    for name in list(theirs) + [name for name in base if name not in theirs]:
+        original, own, value = base.get(name), mine.get(name), theirs.get(name)
+        if value == original or value == own:
+            continue
+        if all(isinstance(field, dict) for field in (original, own, value)):
+            changes = merge_records(original, own, value)
+            if changes is None:
+                return None
+            merged = dict(own)
+            for key, cell in changes.items():
+                if cell is None:
+                    merged.pop(key, None)
+                else:
+                    merged[key] = cell
+            taken[name] = merged
+        elif own != original:
+            return None
+        else:
+            taken[name] = value
+    return taken
 
+
+# Documents use __slots__ so that each one carries a fixed set of fields
+# instead of a per-instance dict; with a few hundred thousand documents
+# resident the dicts used to dominate memory.
 class Document(ABC):
 
-    saved_documents = []
+    __slots__ = ("_title", "_author", "_text", "_id", "_version", "_rendered",
+                 "_revision", "_base", "_undo_to")
+
+    RECORD_FIELDS = ("title", "author", "text")
+    # Record keys apply_record() accepts besides RECORD_FIELDS.
+    EXTRA_FIELDS = ("id", "type")
+    # Whether print() is show_text(render()).
+    PLAIN_PRINT = False
+
+    # DOCUMENT_MANAGER_STORE=files/docs.db switches to the SQLite backend.
+    # DOCUMENT_MANAGER_CODEC and DOCUMENT_MANAGER_COMPRESS_MIN_BYTES choose
+    # how record bodies are compressed.
+    store = open_store(os.environ.get("DOCUMENT_MANAGER_STORE", "files/docs"),
+                       **compression_options())
+    search_index = SearchIndex()
+    saved_documents = DocumentRegistry(store=store)
+    # A WriteBehind while the interactive menu runs; saves go straight to
+    # the store otherwise.
+    writer = None
+    # Ids release() had to leave loaded because their save was still
+    # pending; they are released once the writer has written them.
+    deferred_releases = set()
 
     def __init__(self, title=None, author=None, text=""):
         self._title = title
         self._author = author
+        import textwrap
+        import uuid
         self._text = textwrap.fill(text, width=100)
         self._id = str(uuid.uuid4())
+        self._version = 0
+        self._rendered = None
+        self._revision = 0
+        self._base = None
+        self._undo_to = None
+
+    def __getstate__(self):
+        # A plain dict, the same shape stores written before slots used, so
+        # records keep loading in both directions. The rendered text is
+        # rebuilt on demand and never goes to disk.
+        return {name: getattr(self, name) for name in state_fields(type(self))}
+
+    def __setstate__(self, state):
+        # Older records may lack fields added since; those start out empty.
+        for name in state_fields(type(self)):
+            setattr(self, name, state.get(name))
+        if self._version is None:
+            self._version = 0
+        if self._revision is None:
+            self._revision = 0
+        self._rendered = None
+        self._base = None
+        self._undo_to = None
 
     def __eq__(self, other):
         if not isinstance(other, Document):
             return False
         return self._id == other._id
 
+    def __hash__(self):
+        return hash(self._id)
+
     @property
     def title(self):
         return self._title
@@ -42,17 +175,188 @@ class Document(ABC):
     def id(self):
         return self._id
 
+    @property
+    def type_name(self):
+        return type(self).__name__
+
     @title.setter
     def title(self, title):
         self._title = title
+        self.changed()
 
     @author.setter
     def author(self, author):
         self._author = author
+        self.changed()
 
     @text.setter
     def text(self, text):
         self._text = text
+        self.changed()
+
+    @classmethod
+    def from_record(cls, record):
+        # Builds a document from a flat mapping, e.g. a CSV row or a JSON
+        # object, keyed by the constructor's parameter names.
+        document = cls(**{name: record[name] for name in cls.RECORD_FIELDS
+                          if record.get(name) not in (None, "")})
+        if record.get("id"):
+            document._id = record["id"]
+        return document
+
+    @classmethod
+    def _record_attribute(cls, name):
+        # title, author and text are properties, the other fields are stored
+        # under their parameter name with a leading underscore.
+        return name if isinstance(getattr(cls, name, None), property) else "_" + name
+
+    def to_record(self):
+        record = {"id": self.id, "type": self.type_name}
+        for name in self.RECORD_FIELDS:
+            record[name] = getattr(self, self._record_attribute(name), None)
+        return record
+
+    def apply_record(self, record):
+        # Raises ValueError, before anything changes, for a field this type
+        # does not have.
+        for name in record:
+            if name not in self.RECORD_FIELDS and name not in self.EXTRA_FIELDS:
+                raise ValueError(f"A {self.type_name} has no field {name!r}.")
+        for name in self.RECORD_FIELDS:
+            if name in record:
+                setattr(self, self._record_attribute(name), record[name])
+        self.changed()
+
+    def search_fields(self):
+        return [self.title, self.author, self.text]
+
+    def changed(self):
+        # Every edit bumps the version, which invalidates the cached render().
+        self._version += 1
+
+    def _render_version(self):
+        return self._version
+
+    @instrumentation.timed("render")
+    def render(self):
+        # The document's printed form, rebuilt only after it has changed.
+        version = self._render_version()
+        if self._rendered is None or self._rendered[0] != version:
+            self._rendered = (version, self._render())
+        return self._rendered[1]
+
+    def display(self):
+        sys.stdout.write(self.render())
+        sys.stdout.flush()
+
+    @staticmethod
+    def show_text(text):
+        # The reading screen of emails and letters: the text, until 'esc'.
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        print("Press 'esc' to exit.")
+        keys.dispatch({"esc": lambda: True})
+
+    def opened(self):
+        # Remembers the stored fields for merge(); the registry calls this
+        # when a document is loaded for the session.
+        self._base = self.to_record()
+
+    def merge(self, theirs):
+        # Three-way merge with the version another session saved: fields
+        # only they changed are taken over, fields only this session changed
+        # are kept. Both sessions changing the same field, or the same cell
+        # of a spreadsheet, is a conflict.
+        other = theirs.to_record()
+        taken = None if self._base is None else merge_records(self._base, self.to_record(), other)
+        if taken is None:
+            raise StaleWriteError(self.id, self._revision, theirs._revision)
+        self.apply_record(taken)
+        self._revision = theirs._revision
+        self._base = other
+
+    def persist(self):
+        # With a writer the save is handed to its thread and this returns
+        # right away; the document is listed and searchable either way.
+        if Document.writer is not None:
+            Document.writer.submit(self)
+        else:
+            self.write_to(Document.store)
+        Document.saved_documents.put(self)
+        Document.search_index.add(self)
+
+    def write_to(self, store, attempts=3):
+        # Optimistic: the save only goes through if the stored revision is
+        # still the one this document was opened at, otherwise the other
+        # session's changes are merged in first. Raises StaleWriteError if
+        # they conflict or the document was removed elsewhere.
+        for attempt in range(attempts):
+            previous = self._base
+            try:
+                store.put(self, expected=self._revision)
+                break
+            except StaleWriteError:
+                if attempt == attempts - 1 or self.id not in store:
+                    raise
+                self.merge(store.read(self.id))
+        record = self.to_record()
+        open_history(store.path).record(self.id, self._revision, record, previous)
+        self._base = record
+        self._undo_to = None
+
+    def undo(self):
+        # Unsaved edits are dropped first, after that every call goes back
+        # one more saved revision. Saving stores the result as a new
+        # revision. Returns False if there is nothing older to go back to.
+        if self._undo_to is None and self._base is not None and self.to_record() != self._base:
+            record, target = self._base, self._revision
+        else:
+            target = (self._undo_to or self._revision) - 1
+            record = self.revision_record(target) if target > 0 else None
+        if record is None:
+            return False
+        self.apply_record(record)
+        self._undo_to = target
+        return True
+
+    def revision_record(self, revision):
+        # The record this document had at a saved revision, or None if the
+        # history does not go back that far.
+        return open_history(Document.store.path).load(self.id, revision)
+
+    @staticmethod
+    def settle(doc_id):
+        # Waits for a pending background save of doc_id, so the document is
+        # not changed while it is being written.
+        if Document.writer is not None:
+            Document.writer.wait(doc_id)
+        Document.deferred_releases.discard(doc_id)
+
+    @staticmethod
+    def release(doc_id):
+        # Documents still waiting to be written stay loaded, the store
+        # would hand back the previous revision. They are released by a
+        # later call once written, along with any others left over.
+        Document.deferred_releases.add(doc_id)
+        Document.release_written()
+
+    @staticmethod
+    def release_written():
+        writer = Document.writer
+        for doc_id in list(Document.deferred_releases):
+            if writer is None or not writer.pending(doc_id):
+                Document.deferred_releases.discard(doc_id)
+                if doc_id in Document.saved_documents:
+                    Document.saved_documents.release(doc_id)
+
+    @staticmethod
+    @instrumentation.timed("remove")
+    def discard(doc_id):
+        if Document.writer is not None:
+            Document.writer.flush()
+        Document.store.delete(doc_id)
+        Document.search_index.remove(doc_id)
+        open_history(Document.store.path).drop(doc_id)
 
     @abstractmethod
     def create(self):
@@ -66,6 +370,10 @@ class Document(ABC):
     def save(self):
         pass
 
+    @abstractmethod
+    def _render(self):
+        pass
+
     @abstractmethod
     def print(self):
         pass
@@ -73,11 +381,15 @@ class Document(ABC):
 
 class Slideshow(Document):
 
+    __slots__ = ("_size", "_slides")
+
+    RECORD_FIELDS = ("title", "author", "text", "size")
+    EXTRA_FIELDS = Document.EXTRA_FIELDS + ("slides",)
+
     def __init__(self, title=None, author=None, text="", size=None):
         super().__init__(title, author, text)
         self._size = size
-        if size:
-            self._slides = ["" for slide in range(size)]
+        self._slides = ["" for slide in range(size or 0)]
 
     @property
     def slides(self):
@@ -90,6 +402,29 @@ class Slideshow(Document):
         for i in range(self._size):
             if content[i] is not None:
                 self._slides[i] = content[i]
+        self.changed()
+
+    @classmethod
+    def from_record(cls, record):
+        slides = [str(slide) for slide in record_list(record.get("slides"))]
+        slideshow = super().from_record(dict(record, size=int(record.get("size") or len(slides))))
+        slideshow.slides = slides + [None] * (slideshow._size - len(slides))
+        return slideshow
+
+    def to_record(self):
+        return dict(super().to_record(), slides=list(self._slides))
+
+    def apply_record(self, record):
+        record = dict(record)
+        record.pop("size", None)
+        super().apply_record(record)
+        if "slides" in record:
+            self._slides = [str(slide) for slide in record_list(record["slides"])]
+            self._size = len(self._slides)
+            self.changed()
+
+    def search_fields(self):
+        return super().search_fields() + list(self._slides)
 
     def create(self):
         self.title = input("Enter the slideshow's title: ")
@@ -100,6 +435,7 @@ class Slideshow(Document):
             if self._size.isdigit():
                 self._size = int(self._size)
                 self._slides = ["" for slide in range(self._size)]
+                self.changed()
                 break
             else:
                 clear_console()
@@ -131,8 +467,12 @@ class Slideshow(Document):
                 print("Press 3 to Modify Description")
                 print("Press 4 to Modify Slides")
                 print("Press 5 to Exit")
+                print("Press u to Undo the last saved change")
                 choice = input("Choose: ")
-                if choice.isdigit():
+                if choice.strip().lower() == "u":
+                    clear_console()
+                    print(UNDONE if self.undo() else NOTHING_TO_UNDO)
+                elif choice.isdigit():
                     num = int(choice)
                     if num == 4:
                         break
@@ -154,7 +494,6 @@ class Slideshow(Document):
         clear_console()
         print("Modifying slides...")
         time.sleep(1)
-        index = 0
         while True:
             choice = input(
                 "Which slides would you like to modify? "
@@ -164,38 +503,9 @@ class Slideshow(Document):
             if choice == "a":
                 clear_console()
                 print("You chose to modify all slides. ")
-                print(
-                    "Use arrow keys to navigate. Press 'esc' to exit. Press 'enter' to edit the slide.")
-                print(
-                    f"{CLEAR}Currently at Slide {index}: {self.slides[index]}", end='\r', flush=True)
-                while True:
-                    if keyboard.is_pressed("left"):
-                        if index > 0:
-                            index -= 1
-                            print(
-                                f"{CLEAR}Currently at Slide {index}: {self.slides[index]}", end='\r', flush=True)
-                        while keyboard.is_pressed("left"):
-                            pass
-                    elif keyboard.is_pressed("right"):
-                        if index < self._size - 1:
-                            index += 1
-                            print(
-                                f"{CLEAR}Currently at Slide {index}: {self.slides[index]}", end='\r', flush=True)
-                        while keyboard.is_pressed("right"):
-                            pass
-                    elif keyboard.is_pressed("enter"):
-                        print(CLEAR, end='\r', flush=True)
-                        while keyboard.is_pressed("enter"):
-                            pass
-                        flush_input()
-                        self._slides[index] = input("Enter new content: ")
-                        while keyboard.is_pressed("enter"):
-                            pass
-                        print(
-                            f"{CLEAR}Currently at Slide {index}: {self.slides[index]}", end='\r', flush=True)
-                    elif keyboard.is_pressed("esc"):
-                        print("You have exited editing the slideshow")
-                        return
+                self._navigate_slides(0, self._size - 1)
+                print("You have exited editing the slideshow")
+                return
 
             elif "-" in choice:
                 clear_console()
@@ -207,40 +517,9 @@ class Slideshow(Document):
                             f"Invalid range. Start must be <= end, and both must be between 0 and {self._size - 1}.")
                         continue
                     print(f"You chose to modify slides {start} to {end}.")
-                    index = start
-                    print(
-                        "Use arrow keys to navigate. Press 'esc' to exit. Press 'enter' to edit the slide.")
-                    print(
-                        f"{CLEAR}Currently at Slide {index}: {self.slides[index]}", end='\r', flush=True)
-                    while True:
-                        if keyboard.is_pressed("left"):
-                            if index > start:
-                                index -= 1
-                                print(
-                                    f"{CLEAR}Currently at Slide {index}: {self.slides[index]}", end='\r', flush=True)
-                            while keyboard.is_pressed("left"):
-                                pass
-                        elif keyboard.is_pressed("right"):
-                            if index < end - 1:
-                                index += 1
-                                print(
-                                    f"{CLEAR}Currently at Slide {index}: {self.slides[index]}", end='\r', flush=True)
-                            while keyboard.is_pressed("right"):
-                                pass
-                        elif keyboard.is_pressed("enter"):
-                            print(CLEAR, end='\r', flush=True)
-                            while keyboard.is_pressed("enter"):
-                                pass
-                            flush_input()
-                            print("Enter new content: ", end='', flush=True)
-                            self._slides[index] = input()
-                            while keyboard.is_pressed("enter"):
-                                pass
-                            print(
-                                f"{CLEAR}Currently at Slide {index}: {self.slides[index]}", end='\r', flush=True)
-                        elif keyboard.is_pressed("esc"):
-                            print("You have exited slideshow modification")
-                            return
+                    self._navigate_slides(start, end)
+                    print("You have exited slideshow modification")
+                    return
                 else:
                     clear_console()
                     print("Invalid range format. Use the form x-y (e.g., 2-5).")
@@ -248,60 +527,115 @@ class Slideshow(Document):
             elif choice.isdigit():
                 clear_console()
                 slide_num = int(choice)
+                if slide_num > self._size - 1:
+                    print(f"Slide must be between 0 and {self._size - 1}.")
+                    continue
                 print(f"You chose to modify slide {slide_num}.")
-                self._slides[index] = input("Enter new content: ")
+                self._slides[slide_num] = input("Enter new content: ")
+                self.changed()
                 break
             else:
                 clear_console()
                 print("Please input a valid option!")
 
-    def save(self):
-        for i in range(len(Document.saved_documents)):
-            if Document.saved_documents[i].id == self.id:
-                Document.saved_documents[i] = self
-                break
-        else:
-            Document.saved_documents.append(self)
+    def _navigate_slides(self, start, end):
+        index = start
+
+        def show():
+            print(
+                f"{CLEAR}Currently at Slide {index}: {self.slides[index]}", end='\r', flush=True)
+
+        def left():
+            nonlocal index
+            if index > start:
+                index -= 1
+                show()
+
+        def right():
+            nonlocal index
+            if index < end:
+                index += 1
+                show()
+
+        def enter():
+            print(CLEAR, end='\r', flush=True)
+            flush_input()
+            self._slides[index] = input("Enter new content: ")
+            self.changed()
+            show()
 
-        with open("files/docs", "wb") as f:
-            pickle.dump(Document.saved_documents, f)
+        print(
+            "Use arrow keys to navigate. Press 'esc' to exit. Press 'enter' to edit the slide.")
+        show()
+        keys.dispatch({
+            "left": left,
+            "right": right,
+            "enter": enter,
+            "esc": lambda: True,
+        })
+
+    @instrumentation.timed("Slideshow.save")
+    def save(self):
+        self.persist()
         print("Your Slideshow has been saved.")
 
+    def _render(self):
+        return (
+            f"{(self.title or '').title()}\n"
+            f"{self.author or ''}\n\n"
+            f"{self.text or ''}\n\n"
+        )
+
     def print(self):
         index = 0
-        print(
-            f"{self.title.title()}\n"
-            f"{self.author}\n\n"
-            f"{self.text}\n"
-        )
+        self.display()
         print(f"{self._slides[index]}", end='\r', flush=True)
-        while True:
-            if keyboard.is_pressed("left"):
-                if index > 0:
-                    index -= 1
-                    print(
-                        f"{CLEAR}{self._slides[index]}", end='\r', flush=True)
-                    while keyboard.is_pressed("left"):
-                        pass
-            elif keyboard.is_pressed("right"):
-                if index < self._size - 1:
-                    index += 1
-                    print(
-                        f"{CLEAR}{self._slides[index]}", end='\r', flush=True)
-                    while keyboard.is_pressed("right"):
-                        pass
-            elif keyboard.is_pressed("esc"):
-                print("You have exited the slideshow")
-                break
+
+        def left():
+            nonlocal index
+            if index > 0:
+                index -= 1
+                print(
+                    f"{CLEAR}{self._slides[index]}", end='\r', flush=True)
+
+        def right():
+            nonlocal index
+            if index < self._size - 1:
+                index += 1
+                print(
+                    f"{CLEAR}{self._slides[index]}", end='\r', flush=True)
+
+        def esc():
+            print("You have exited the slideshow")
+            return True
+
+        keys.dispatch({"left": left, "right": right, "esc": esc})
 
 
 class Spreadsheet(Document):
 
-    def __init__(self, title=None, author=None, text="", size=None):
+    __slots__ = ("_rows", "_cols", "_table", "_formulas")
+
+    RECORD_FIELDS = ("title", "author", "text", "rows", "cols")
+    EXTRA_FIELDS = Document.EXTRA_FIELDS + ("cells", "table")
+
+    def __init__(self, title=None, author=None, text="", size=None, rows=None, cols=None):
         super().__init__(title, author, text)
-        self._size = size
-        if size:
-            self._table = [["" for col in range(size)] for row in range(size)]
+        self._rows = (rows if rows is not None else size) or 0
+        self._cols = (cols if cols is not None else size) or 0
+        self._table = SparseTable(self._rows, self._cols)
+        self._formulas = FormulaEngine(self._table)
+
+    def __setstate__(self, state):
+        # Spreadsheets saved before sparse tables kept a dense size x size grid.
+        if "_rows" not in state:
+            size = state.pop("_size", None) or 0
+            state["_rows"] = state["_cols"] = size
+            state["_table"] = SparseTable.from_rows(state.get("_table", []), size)
+        super().__setstate__(state)
+        # Formulas are parsed and evaluated again rather than stored, so
+        # records do not depend on the engine's internals.
+        self._formulas = FormulaEngine(self._table)
 
     @property
     def table(self):
@@ -309,23 +643,134 @@ class Spreadsheet(Document):
 
     @table.setter
     def table(self, content):
-        if len(content) != self._size:
+        if len(content) != self._rows:
             raise ValueError(
-                f"Content must be a list of {self._size}x{self._size} table.")
-        for i in range(self._size):
+                f"Content must be a list of {self._rows}x{self._cols} table.")
+        for i in range(self._rows):
             if content[i] is not None:
                 self._table[i] = content[i]
+        self.changed()
+
+    def column_type(self, col):
+        return self._table.column_type(col)
+
+    def set_column_type(self, col, kind):
+        self._table.set_column_type(col, kind)
+
+    def column_values(self, col):
+        return self._table.column_array(col)
+
+    def column_stat(self, col, stat):
+        return aggregate(self._table.column_array(col), stat)
+
+    def row_stat(self, row, stat):
+        return aggregate(self._table.row_array(row), stat)
+
+    def row_stats(self, stat):
+        # One result per row, computed over the numeric columns in one pass.
+        if not self._table.numeric_columns():
+            raise ValueError("The spreadsheet has no numeric columns.")
+        return aggregate(self._table.numeric_block(), stat, axis=1)
+
+    def combine_columns(self, left, op, right, out):
+        import numpy
+        operations = {
+            "+": numpy.add,
+            "-": numpy.subtract,
+            "*": numpy.multiply,
+            "/": numpy.divide,
+        }
+        if op not in operations:
+            raise ValueError(f"Unknown operator {op!r}.")
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            result = operations[op](self.column_values(left), self.column_values(right))
+        self._table.set_column_array(out, result)
+        return result
+
+    def import_rows(self, rows, replace=True):
+        # Streams rows into the table; replace=True drops the old cells but
+        # keeps the column types. Returns the number of rows read.
+        if replace:
+            # Filled before it replaces the old table, so a failed import
+            # loses nothing.
+            table = SparseTable(0, self._cols)
+            for col in self._table.numeric_columns():
+                table.set_column_type(col, NUMBER)
+            count = table.append_rows(rows)
+            self._table = table
+            self._formulas = FormulaEngine(table)
+        else:
+            count = self._table.append_rows(rows)
+        self._rows, self._cols = self._table.rows, self._table.cols
+        self.changed()
+        return count
+
+    def export_rows(self, values=False):
+        return self._table.iter_rows(values)
+
+    @classmethod
+    def from_record(cls, record):
+        # The cells come either as a "table" list of rows or as "cells" by
+        # name; without rows and cols the sheet is sized to fit them.
+        table = [["" if cell is None else str(cell) for cell in row]
+                 for row in record_list(record.get("table"))]
+        cells = record_cells(record.get("cells"))
+        size = record.get("size")
+        rows = int(record.get("rows") or size
+                   or max(len(table), max((row + 1 for row, col in cells), default=0)))
+        cols = int(record.get("cols") or size
+                   or max(max(map(len, table), default=0), max((col + 1 for row, col in cells), default=0)))
+        spreadsheet = super().from_record(dict(record, rows=rows, cols=cols))
+        for row, values in enumerate(table):
+            spreadsheet.table[row] = values
+        for (row, col), value in cells.items():
+            spreadsheet.table.set(row, col, value)
+        return spreadsheet
+
+    def to_record(self):
+        # Only the populated cells, so the record of a large, mostly empty
+        # sheet stays as small as the sheet's own storage.
+        return dict(super().to_record(),
+                    cells={cell_name(row, col): value for row, col, value in self._table.cells()})
+
+    def _replace_cells(self, cells):
+        # cells by (row, col); every cell not among them is cleared.
+        for row, col, _ in list(self._table.cells()):
+            if (row, col) not in cells:
+                self._table.set(row, col, "")
+        for (row, col), value in cells.items():
+            if self._table.get(row, col) != value:
+                self._table.set(row, col, value)
+
+    def apply_record(self, record):
+        record = dict(record)
+        rows = int(record.pop("rows", None) or self._rows)
+        cols = int(record.pop("cols", None) or self._cols)
+        super().apply_record(record)
+        if (rows, cols) != (self._rows, self._cols):
+            self._rows, self._cols = rows, cols
+            self._table.resize(rows, cols)
+        if "table" in record:
+            for row, cells in enumerate(record_list(record["table"])):
+                self._table[row] = ["" if cell is None else str(cell) for cell in cells]
+        if "cells" in record:
+            self._replace_cells(record_cells(record["cells"]))
+
+    def search_fields(self):
+        return super().search_fields() + [value for row, col, value in self._table.cells()]
 
     def create(self):
         self.title = input("Enter the spreadsheet's title: ")
         self.author = input("Enter the spreadsheet's author: ")
         self.text = input("Enter the spreadsheet's description: ")
         while True:
-            self._size = input("Enter the size of the table: ")
-            if self._size.isdigit():
-                self._size = int(self._size)
-                self._table = [["" for col in range(
-                    self._size)] for row in range(self._size)]
+            rows = input("Enter the number of rows: ")
+            cols = input("Enter the number of columns: ")
+            if rows.isdigit() and cols.isdigit():
+                self._rows, self._cols = int(rows), int(cols)
+                self._table = SparseTable(self._rows, self._cols)
+                self._formulas = FormulaEngine(self._table)
+                self.changed()
                 break
             else:
                 print("Please enter a valid number.")
@@ -355,8 +800,12 @@ class Spreadsheet(Document):
                 print("Press 3 to Modify Description")
                 print("Press 4 to Modify Table")
                 print("Press 5 to Exit")
+                print("Press u to Undo the last saved change")
                 choice = input("Choose: ")
-                if choice.isdigit():
+                if choice.strip().lower() == "u":
+                    clear_console()
+                    print(UNDONE if self.undo() else NOTHING_TO_UNDO)
+                elif choice.isdigit():
                     num = int(choice)
                     if num == 4:
                         break
@@ -379,136 +828,119 @@ class Spreadsheet(Document):
         clear_console()
         print("Modifying table...")
         time.sleep(1)
-        row, col = 0, 0
-        print(
+        clear_console()
+        view = Viewport(self._table)
+        view.status(
             "Use arrow keys to navigate. Press 'esc' to exit. Press 'enter' to edit cell.")
-        print(
-            f"{CLEAR}Currently at cell ({row}, {col}): {self._table[row][col]}", end='\r', flush=True)
-        while True:
-            if keyboard.is_pressed("left"):
-                if col > 0:
-                    col -= 1
-                    print(
-                        f"{CLEAR}Currently at cell ({row}, {col}): {self._table[row][col]}", end='\r', flush=True)
-                while keyboard.is_pressed("left"):
-                    pass
-            elif keyboard.is_pressed("right"):
-                if col < self._size - 1:
-                    col += 1
-                    print(
-                        f"{CLEAR}Currently at cell ({row}, {col}): {self._table[row][col]}", end='\r', flush=True)
-                while keyboard.is_pressed("right"):
-                    pass
-            elif keyboard.is_pressed("up"):
-                if row > 0:
-                    row -= 1
-                    print(
-                        f"{CLEAR}Currently at cell ({row}, {col}): {self._table[row][col]}", end='\r', flush=True)
-                while keyboard.is_pressed("up"):
-                    pass
-            elif keyboard.is_pressed("down"):
-                if row < self._size - 1:
-                    row += 1
-                    print(
-                        f"{CLEAR}Currently at cell ({row}, {col}): {self._table[row][col]}", end='\r', flush=True)
-                while keyboard.is_pressed("down"):
-                    pass
-            elif keyboard.is_pressed("enter"):
-                print(CLEAR, end='\r', flush=True)
-                while keyboard.is_pressed("enter"):
-                    pass
-                flush_input()
-                new_content = input(
-                    f"Enter new content for cell ({row}, {col}): ")
-                while keyboard.is_pressed("enter"):
-                    pass
-                self._table[row][col] = new_content
-                print(
-                    f"{CLEAR}Currently at cell ({row}, {col}): {self._table[row][col]}", end='\r', flush=True)
-                flush_input()
-            elif keyboard.is_pressed("esc"):
-                print("You have exited table modification.")
-                break
+        self._navigate_cells(editable=True, view=view)
+        print("You have exited table modification.")
+
+    def _navigate_cells(self, editable=False, view=None):
+        # Only the part of the sheet that fits the terminal is drawn. The
+        # hint sits on the first line below it, the current cell on the
+        # second.
+        if view is None:
+            view = Viewport(self._table)
+        row, col = 0, 0
 
+        def show():
+            view.follow(row, col)
+            view.draw(cursor=(row, col))
+            content = self._table.value(row, col)
+            if self._formulas.is_formula((row, col)):
+                content = f"{content} ({self._table.get(row, col)})"
+            view.status(f"Currently at cell ({row}, {col}): {content}", offset=1)
+
+        def move(d_row, d_col):
+            def handler():
+                nonlocal row, col
+                if 0 <= row + d_row < self._rows and 0 <= col + d_col < self._cols:
+                    row += d_row
+                    col += d_col
+                    show()
+            return handler
+
+        def enter():
+            view.status_line(offset=1)
+            flush_input()
+            new_content = input(
+                f"Enter new content for cell ({row}, {col}): ")
+            try:
+                self._table[row][col] = new_content
+            except ValueError as error:
+                view.status(str(error), offset=2)
+            show()
+
+        handlers = {
+            "left": move(0, -1),
+            "right": move(0, 1),
+            "up": move(-1, 0),
+            "down": move(1, 0),
+            "esc": lambda: True,
+        }
+        if editable:
+            handlers["enter"] = enter
+        show()
+        keys.dispatch(handlers)
+        view.status_line(offset=2)
+        print()
+
+    @instrumentation.timed("Spreadsheet.save")
     def save(self):
-        for i in range(len(Document.saved_documents)):
-            if Document.saved_documents[i].id == self.id:
-                Document.saved_documents[i] = self
-                break
-        else:
-            Document.saved_documents.append(self)
-
-        with open("files/docs", "wb") as f:
-            pickle.dump(Document.saved_documents, f)
+        self.persist()
         print("Your Spreadsheet has been saved.")
 
-    def print(self):
-        print(
-            f"{self.title.title()}\n"
-            f"{self.author}\n\n"
-            f"{self.text}\n\n"
-        )
+    def _render_version(self):
+        # Cell edits go straight to the table, which counts its own changes.
+        return self._version, self._table.version
 
-        for row in range(self._size):
-            for column in range(self._size):
-                cell = self._table[row][column]
-                if len(cell) > 10:
-                    short = textwrap.shorten(cell, width=10, placeholder="...")
-                    print(f"|{short:<10}|", end=" ")
-                else:
-                    print(f"|{cell:<10}|", end="")
-            print()
+    def _header(self):
+        return (f"{(self.title or '').title()}\n"
+                f"{self.author or ''}\n\n"
+                f"{self.text or ''}\n\n")
 
+    def _render(self):
+        lines = [self._header()]
+        for row in range(self._rows):
+            lines.append("".join(cell_text(self._table.value(row, column))
+                                 for column in range(self._cols)))
+        return "\n".join(lines) + "\n"
+
+    def print(self):
+        # Draws the header and the part of the sheet that fits the terminal;
+        # render() still has the whole sheet for anything that wants it.
+        clear_console()
+        header = self._header()
+        sys.stdout.write(header)
+        import shutil
+        width = shutil.get_terminal_size().columns
+        view = Viewport(self._table, top=1 + sum(
+            max(1, -(-len(line) // width)) for line in header.split("\n")[:-1]))
+        view.draw()
+
+        prompt = "Do you want to navigate the cells? Y/N: "
         while True:
-            choice = input(
-                "Do you want to navigate the cells? Y/N: ").strip().lower()
+            view.status(prompt)
+            choice = input().strip().lower()
             if choice == "y":
                 break
             elif choice == "n":
                 return
             else:
-                clear_console()
-                print("Please enter a valid input")
+                prompt = "Please enter a valid input. Do you want to navigate the cells? Y/N: "
 
-        print("Use arrow keys to navigate. Press 'esc' to exit.")
-        row, col = 0, 0
-        print(f"Currently at cell ({row}, {col}): {self._table[row][col]}")
-        while True:
-            if keyboard.is_pressed("left"):
-                if col > 0:
-                    col -= 1
-                    print(
-                        f"{CLEAR}Currently at cell ({row}, {col}): {self._table[row][col]}", end='\r', flush=True)
-                while keyboard.is_pressed("left"):
-                    pass
-            elif keyboard.is_pressed("right"):
-                if col < self._size - 1:
-                    col += 1
-                    print(
-                        f"{CLEAR}Currently at cell ({row}, {col}): {self._table[row][col]}", end='\r', flush=True)
-                while keyboard.is_pressed("right"):
-                    pass
-            elif keyboard.is_pressed("up"):
-                if row > 0:
-                    row -= 1
-                    print(
-                        f"{CLEAR}Currently at cell ({row}, {col}): {self._table[row][col]}", end='\r', flush=True)
-                while keyboard.is_pressed("up"):
-                    pass
-            elif keyboard.is_pressed("down"):
-                if row < self._size - 1:
-                    row += 1
-                    print(
-                        f"{CLEAR}Currently at cell ({row}, {col}): {self._table[row][col]}", end='\r', flush=True)
-                while keyboard.is_pressed("down"):
-                    pass
-            elif keyboard.is_pressed("esc"):
-                print("You have exited cell navigation.")
-                break
+        view.status("Use arrow keys to navigate. Press 'esc' to exit.")
+        self._navigate_cells(view=view)
+        print("You have exited cell navigation.")
 
 
 class Email(Document):
 
+    __slots__ = ("_s_from", "_r_to", "_subject", "_recipient", "_cc")
+
+    RECORD_FIELDS = ("title", "author", "s_from", "r_to", "text", "subject", "recipient", "cc")
+    PLAIN_PRINT = True
+
     def __init__(self, title=None, author=None, s_from=None, r_to=None, text="", subject=None, recipient=None, cc=None):
         super().__init__(title, author, text)
         self._s_from = s_from
@@ -517,6 +949,10 @@ class Email(Document):
         self._recipient = recipient
         self._cc = cc
 
+    def search_fields(self):
+        return super().search_fields() + [
+            self._subject, self._recipient, self._s_from, self._r_to, self._cc]
+
     def create(self):
         self.title = input("Enter the email's title: ")
         self.author = input("Enter the email's author: ")
@@ -526,6 +962,7 @@ class Email(Document):
         self._subject = input("Enter the email's subject: ")
         self._recipient = input("Enter the recipient's name: ")
         self._cc = input("Enter the CC (optional): ")
+        self.changed()
 
     def modify(self):
         fields = {
@@ -549,14 +986,19 @@ class Email(Document):
             print("Enter 7 to change recipient's name")
             print("Enter 8 to change CC")
             print("Enter 9 to exit")
+            print("Enter u to undo the last saved change")
             choice = input("Choose: ")
-            if choice.isdigit():
+            if choice.strip().lower() == "u":
+                clear_console()
+                print(UNDONE if self.undo() else NOTHING_TO_UNDO)
+            elif choice.isdigit():
                 num = int(choice)
                 if num == 9:
                     break
                 elif num in fields:
                     attr, prompt = fields[num]
                     setattr(self, attr, input(prompt))
+                    self.changed()
                     print("The Email has been modified...")
                     time.sleep(1)
                     clear_console()
@@ -567,49 +1009,65 @@ class Email(Document):
                 clear_console()
                 print("Please enter a valid number.")
 
+    @instrumentation.timed("Email.save")
     def save(self):
-        for i in range(len(Document.saved_documents)):
-            if Document.saved_documents[i].id == self.id:
-                Document.saved_documents[i] = self
-                break
-        else:
-            Document.saved_documents.append(self)
-
-        with open("files/docs", "wb") as f:
-            pickle.dump(Document.saved_documents, f)
+        self.persist()
         print("Your Email has been saved.")
 
-    def print(self):
-        print(
-            f"From: {self._s_from}\n"
-            f"To: {self._r_to}\n"
+    def _render(self):
+        return (
+            f"From: {self._s_from or ''}\n"
+            f"To: {self._r_to or ''}\n"
             f"{'CC: ' + self._cc if self._cc else ''}\n"
-            f"Subject: {self._subject}\n\n"
-            f"{self.title.title()}\n\n"
-            f"Dear {self._recipient},\n\n"
-            f"{self.text}\n\n"
+            f"Subject: {self._subject or ''}\n\n"
+            f"{(self.title or '').title()}\n\n"
+            f"Dear {self._recipient or ''},\n\n"
+            f"{self.text or ''}\n\n"
             f"{'Sincerely,':>100}\n"
-            f"{self.author:>100}"
+            f"{self.author or '':>100}\n"
         )
-        print("Press 'esc' to exit.")
-        while True:
-            if keyboard.is_pressed("esc"):
-                while keyboard.is_pressed("left"):
-                    pass
-                break
+
+    def print(self):
+        self.show_text(self.render())
 
 
 class Letter(Document):
 
+    __slots__ = ("_s_address", "_r_address", "_subject", "_recipient", "_date")
+
+    RECORD_FIELDS = ("title", "author", "s_address", "r_address", "text", "subject", "recipient")
+    EXTRA_FIELDS = Document.EXTRA_FIELDS + ("date",)
+    PLAIN_PRINT = True
+
     def __init__(self, title=None, author=None, s_address=None, r_address=None, text="", subject=None, recipient=None, includeDate=False):
         super().__init__(title, author, text)
         self._s_address = s_address
-        if includeDate:
-            self._date = datetime.date.today()
+        self._date = today() if includeDate else None
         self._r_address = r_address
         self._subject = subject
         self._recipient = recipient
 
+    @classmethod
+    def from_record(cls, record):
+        letter = super().from_record(record)
+        if record.get("date"):
+            letter._date = parse_date(record["date"])
+        else:
+            letter._date = today()
+        return letter
+
+    def to_record(self):
+        return dict(super().to_record(), date=self._date.isoformat() if self._date else None)
+
+    def apply_record(self, record):
+        super().apply_record(record)
+        if record.get("date"):
+            self._date = parse_date(record["date"])
+
+    def search_fields(self):
+        return super().search_fields() + [
+            self._subject, self._recipient, self._s_address, self._r_address]
+
     def create(self):
         self.title = input("Enter the letter's title: ")
         self.author = input("Enter the letter's author: ")
@@ -618,7 +1076,8 @@ class Letter(Document):
         self._r_address = input("Enter the recipient's address: ")
         self._subject = input("Enter the letter's subject: ")
         self._recipient = input("Enter the recipient's name: ")
-        self._date = datetime.date.today()
+        self._date = today()
+        self.changed()
 
     def modify(self):
         fields = {
@@ -640,14 +1099,19 @@ class Letter(Document):
             print("Enter 6 to change letter's subject")
             print("Enter 7 to change recipient's name")
             print("Enter 8 to exit")
+            print("Enter u to undo the last saved change")
             choice = input("Choose: ")
-            if choice.isdigit():
+            if choice.strip().lower() == "u":
+                clear_console()
+                print(UNDONE if self.undo() else NOTHING_TO_UNDO)
+            elif choice.isdigit():
                 num = int(choice)
                 if num == 8:
                     break
                 elif num in fields:
                     attr, prompt = fields[num]
                     setattr(self, attr, input(prompt))
+                    self.changed()
                     print("The Letter has been modified...")
                     time.sleep(1)
                     clear_console()
@@ -658,36 +1122,32 @@ class Letter(Document):
                 clear_console()
                 print("Please enter a valid number.")
 
+    @instrumentation.timed("Letter.save")
     def save(self):
-        for i in range(len(Document.saved_documents)):
-            if Document.saved_documents[i].id == self.id:
-                Document.saved_documents[i] = self
-                break
-        else:
-            Document.saved_documents.append(self)
-
-        with open("files/docs", "wb") as f:
-            pickle.dump(Document.saved_documents, f)
+        self.persist()
         print("Your Letter has been saved.")
 
-    def print(self):
-        print(
-            f"{self._s_address}\n"
-            f"{self._date}\n"
-            f"{self._r_address}\n\n"
-            f"{self.title.title()}\n"
-            f"Subject: {self._subject}\n\n"
-            f"Dear {self._recipient},\n\n"
-            f"{self.text}\n\n"
+    def _render(self):
+        return (
+            f"{self._s_address or ''}\n"
+            f"{self._date or ''}\n"
+            f"{self._r_address or ''}\n\n"
+            f"{(self.title or '').title()}\n"
+            f"Subject: {self._subject or ''}\n\n"
+            f"Dear {self._recipient or ''},\n\n"
+            f"{self.text or ''}\n\n"
             f"{'Yours truly,':>100}\n"
-            f"{self.author:>100}"
+            f"{self.author or '':>100}\n"
         )
-        print("Press 'esc' to exit.")
-        while True:
-            if keyboard.is_pressed("esc"):
-                while keyboard.is_pressed("left"):
-                    pass
-                break
+
+    def print(self):
+        self.show_text(self.render())
+
+
+def document_picker(heading):
+    # Headers are enough here, the documents themselves stay on disk.
+    registry = Document.saved_documents
+    return Picker((registry.header_for(doc_id) for doc_id in registry.ids()), heading)
 
 
 def create_document():
@@ -739,166 +1199,219 @@ def edit_document():
     clear_console()
     print("Editing a Document...")
     time.sleep(1)
-    size = len(Document.saved_documents)
-    index = 0
+    refresh_documents()
 
-    if size == 0:
+    if len(Document.saved_documents) == 0:
         print("You have no documents to edit")
         return
 
-    print("Choose a document to edit.")
-    print("Use arrow keys to navigate. Press 'esc' to exit. Press 'enter' to edit document.")
-    print(
-        f"{CLEAR}Currently at Document {index}: {Document.saved_documents[index].title} Type: {type(Document.saved_documents[index]).__name__}", end='\r', flush=True)
-    while True:
-        if keyboard.is_pressed("left"):
-            if index > 0:
-                index -= 1
-                print(
-                    f"{CLEAR}Currently at Document {index}: {Document.saved_documents[index].title} Type: {type(Document.saved_documents[index]).__name__}", end='\r', flush=True)
-                while keyboard.is_pressed("left"):
-                    pass
-        elif keyboard.is_pressed("right"):
-            if index < size - 1:
-                index += 1
-                print(
-                    f"{CLEAR}Currently at Document {index}: {Document.saved_documents[index].title} Type: {type(Document.saved_documents[index]).__name__}", end='\r', flush=True)
-                while keyboard.is_pressed("right"):
-                    pass
-        elif keyboard.is_pressed("enter"):
-            print(CLEAR, end='\r', flush=True)
-            while keyboard.is_pressed("enter"):
-                pass
-            flush_input()
-            clear_console()
-            Document.saved_documents[index].modify()
-            while keyboard.is_pressed("enter"):
-                pass
-            flush_input()
-            clear_console()
-            Document.saved_documents[index].save()
-            print(
-                f"{CLEAR}Currently at Document {index}: {Document.saved_documents[index].title} Type: {type(Document.saved_documents[index]).__name__}", end='\r', flush=True)
-        elif keyboard.is_pressed("esc"):
-            return
+    def enter(doc_id):
+        flush_input()
+        clear_console()
+        Document.settle(doc_id)
+        document = Document.saved_documents.get(doc_id)
+        document.modify()
+        flush_input()
+        clear_console()
+        try:
+            document.save()
+        except StaleWriteError:
+            print("Another session changed the same fields of this document. "
+                  "Your changes were not saved.")
+        Document.release(doc_id)
+        picker.update(Document.saved_documents.header_for(doc_id))
+
+    picker = document_picker(["Choose a document to edit. Press 'enter' to edit document."])
+    picker.run(enter)
 
 
 def remove_document():
     clear_console()
     print("Removing a Document...")
     time.sleep(1)
-    size = len(Document.saved_documents)
-    index = 0
+    refresh_documents()
 
-    if size == 0:
+    if len(Document.saved_documents) == 0:
         print("You have no documents to remove")
         return
 
-    print("Choose a document to remove.")
-    print("Use arrow keys to navigate. Press 'esc' to exit. Press 'enter' to remove document.")
-    print(
-        f"{CLEAR}Currently at Document {index}: {Document.saved_documents[index].title} Type: {type(Document.saved_documents[index]).__name__}", end='\r', flush=True)
-    while True:
-        size = len(Document.saved_documents)
-
-        if keyboard.is_pressed("left"):
-            if index > 0:
-                index -= 1
-                print(
-                    f"{CLEAR}Currently at Document {index}: {Document.saved_documents[index].title} Type: {type(Document.saved_documents[index]).__name__}", end='\r', flush=True)
-                while keyboard.is_pressed("left"):
-                    pass
-        elif keyboard.is_pressed("right"):
-            if index < size - 1:
-                index += 1
-                print(
-                    f"{CLEAR}Currently at Document {index}: {Document.saved_documents[index].title} Type: {type(Document.saved_documents[index]).__name__}", end='\r', flush=True)
-                while keyboard.is_pressed("right"):
-                    pass
-        elif keyboard.is_pressed("enter"):
-            print(CLEAR, end='\r', flush=True)
-            while keyboard.is_pressed("enter"):
-                pass
-            flush_input()
-            clear_console()
-            removed_document = Document.saved_documents.pop(index)
-            print(f"{CLEAR}Removed Document: {removed_document.title} Type: {type(removed_document).__name__}", end='\r', flush=True)
-            time.sleep(1)
-            with open("files/docs", "wb") as f:
-                pickle.dump(Document.saved_documents, f)
-            while keyboard.is_pressed("enter"):
-                pass
-            flush_input()
+    def enter(doc_id):
+        flush_input()
+        clear_console()
+        removed_document = Document.saved_documents.remove(doc_id)
+        print(f"{CLEAR}Removed Document: {removed_document.title} Type: {removed_document.type_name}", end='\r', flush=True)
+        time.sleep(1)
+        Document.discard(doc_id)
+        picker.remove(doc_id)
+        if len(Document.saved_documents) == 0:
             clear_console()
-            index -= 1
-            if len(Document.saved_documents) > 0:
-                print(
-                    f"{CLEAR}Currently at Document {index}: {Document.saved_documents[index].title} Type: {type(Document.saved_documents[index]).__name__}", end='\r', flush=True)
-            else:
-                print("You have no documents")
-                return
-        elif keyboard.is_pressed("esc"):
-            return
+            print("You have no documents")
+            return True
+
+    picker = document_picker(["Choose a document to remove. Press 'enter' to remove document."])
+    picker.run(enter)
+
+
+# Rendered text of recently read documents by (id, revision), oldest first.
+# It outlives release(), which drops the documents themselves.
+RECENT_RENDERS = 64
+_recent_renders = collections.OrderedDict()
+
+
+def show_document(doc_id):
+    # Prints a document for reading, then releases it. Reading an email or
+    # letter again before it changes is a single write, without loading it.
+    registry = Document.saved_documents
+    key = (doc_id, Document.store.revision(doc_id))
+    if key in _recent_renders and isinstance(registry.header_for(doc_id), DocumentHeader):
+        _recent_renders.move_to_end(key)
+        Document.show_text(_recent_renders[key])
+        return
+    document = registry.get(doc_id)
+    document.print()
+    if document.PLAIN_PRINT and document._revision == key[1]:
+        _recent_renders[key] = document.render()
+        while len(_recent_renders) > RECENT_RENDERS:
+            _recent_renders.popitem(last=False)
+    Document.release(doc_id)
 
 
 def read_document():
     clear_console()
     print("Reading a Document...")
     time.sleep(1)
-    size = len(Document.saved_documents)
-    index = 0
+    refresh_documents()
 
-    if size == 0:
+    if len(Document.saved_documents) == 0:
         print("You have no documents to read")
         return
 
-    print("Choose a document to read.")
-    print("Use arrow keys to navigate. Press 'esc' to exit. Press 'enter' to read document.")
-    print(
-        f"{CLEAR}Currently at Document {index}: {Document.saved_documents[index].title} Type: {type(Document.saved_documents[index]).__name__}", end='\r', flush=True)
-    while True:
-        if keyboard.is_pressed("left"):
-            if index > 0:
-                index -= 1
-                print(
-                    f"{CLEAR}Currently at Document {index}: {Document.saved_documents[index].title} Type: {type(Document.saved_documents[index]).__name__}", end='\r', flush=True)
-                while keyboard.is_pressed("left"):
-                    pass
-        elif keyboard.is_pressed("right"):
-            if index < size - 1:
-                index += 1
-                print(
-                    f"{CLEAR}Currently at Document {index}: {Document.saved_documents[index].title} Type: {type(Document.saved_documents[index]).__name__}", end='\r', flush=True)
-                while keyboard.is_pressed("right"):
-                    pass
-        elif keyboard.is_pressed("enter"):
-            print(CLEAR, end='\r', flush=True)
-            while keyboard.is_pressed("enter"):
-                pass
-            flush_input()
-            clear_console()
-            Document.saved_documents[index].print()
-            while keyboard.is_pressed("enter"):
-                pass
-            flush_input()
-            clear_console()
-            print(
-                f"{CLEAR}Currently at Document {index}: {Document.saved_documents[index].title} Type: {type(Document.saved_documents[index]).__name__}", end='\r', flush=True)
-        elif keyboard.is_pressed("esc"):
-            return
+    def enter(doc_id):
+        flush_input()
+        clear_console()
+        show_document(doc_id)
+        flush_input()
 
+    document_picker(["Choose a document to read. Press 'enter' to read document."]).run(enter)
 
-def init():
-    if not os.path.exists("files"):
-        os.makedirs("files")
 
-    if os.path.exists("files/docs"):
-        with open("files/docs", "rb") as f:
-            try:
-                Document.saved_documents = pickle.load(f)
-                print("Documents loaded successfully.")
-            except EOFError:
-                print("No data to load.")
+def search_document():
+    clear_console()
+    query = input("Search for: ").strip()
+    refresh_documents()
+    ensure_search_index()
+    registry = Document.saved_documents
+    results = [doc_id for doc_id in Document.search_index.search(query) if doc_id in registry]
+    clear_console()
+
+    if not results:
+        print(f"No documents match '{query}'")
+        return
+
+    def enter(doc_id):
+        flush_input()
+        clear_console()
+        show_document(doc_id)
+        flush_input()
+
+    Picker((registry.header_for(doc_id) for doc_id in results),
+           [f"Found {len(results)} document(s) matching '{query}'. Press 'enter' to read document."]).run(enter)
+
+
+_search_synced = False
+
+
+def sync_search_index():
+    # Catch the persisted index up with records saved since it was written,
+    # or rebuild it if the log has been compacted in the meantime.
+    global _search_synced
+    changes = None
+    if Document.search_index.load(Document.store.path + ".search"):
+        changes = Document.store.changes_since(Document.search_index.position)
+    apply_search_changes(changes)
+    _search_synced = True
+
+
+def ensure_search_index():
+    # Only queries need the search index, so it is caught up on first use
+    # and only written back at exit if it was.
+    if not _search_synced:
+        sync_search_index()
+
+
+def apply_search_changes(changes):
+    # changes as returned by changes_since(); None rebuilds the whole index.
+    index = Document.search_index
+    if changes is None:
+        index.clear()
+        changed = [header.id for header in Document.store.headers()]
+    else:
+        changed = list(dict.fromkeys(doc_id for op, doc_id in changes))
+    for doc_id in changed:
+        if doc_id in Document.store:
+            index.add(Document.store.read(doc_id))
+        else:
+            index.remove(doc_id)
+
+
+def refresh_documents():
+    # Picks up what other sessions saved or removed since this one last
+    # looked at the store. Documents open in this session stay as they are;
+    # saving them merges or rejects through persist().
+    Document.release_written()
+    position = Document.store.position()
+    if not Document.store.refresh():
+        return
+    registry = Document.saved_documents
+    for doc_id in registry.ids():
+        if doc_id not in Document.store and not (
+                Document.writer is not None and Document.writer.pending(doc_id)):
+            registry.remove(doc_id)
+    for header in Document.store.headers():
+        if header.id not in registry or isinstance(registry.header_for(header.id), DocumentHeader):
+            registry.put(header)
+    if _search_synced:
+        apply_search_changes(Document.store.changes_since(position))
+
+
+def save_search_index():
+    if _search_synced:
+        Document.search_index.save(Document.store.path + ".search", Document.store.position())
+
+
+def report_write_errors():
+    if Document.writer is None:
+        return
+    while Document.writer.errors:
+        document, error = Document.writer.errors.pop(0)
+        if isinstance(error, StaleWriteError):
+            print(f"Another session changed the same fields of '{document.title}'. "
+                  "Your changes were not saved.")
+        else:
+            print(f"Could not save '{document.title}': {error}")
+
+
+@instrumentation.timed("init")
+def init():
+    os.makedirs(os.path.dirname(Document.store.path) or ".", exist_ok=True)
+
+    atexit.register(Document.store.checkpoint)
+    atexit.register(save_search_index)
+    # Runs after the final flush below, which may fail like any other save.
+    atexit.register(report_write_errors)
+    # Registered last so it runs first: everything is on disk before the
+    # checkpoint and the search index are written.
+    Document.writer = WriteBehind(lambda document: document.write_to(Document.store))
+    atexit.register(Document.writer.close)
+    if os.path.exists(Document.store.path):
+        Document.saved_documents = DocumentRegistry(
+            Document.store.load_headers(), Document.store)
+        if Document.store.recovered_bytes:
+            print(f"Discarded {Document.store.recovered_bytes} bytes of an incomplete save.")
+        if Document.saved_documents:
+            print("Documents loaded successfully.")
+        else:
+            print("No data to load.")
 
 
 def handle_choice(choice):
@@ -906,13 +1419,15 @@ def handle_choice(choice):
         1: read_document,
         2: create_document,
         3: edit_document,
-        4: remove_document
+        4: remove_document,
+        5: search_document
     }
 
+    report_write_errors()
     action = actions.get(choice)
     if action:
         action()
-    elif choice == 5:
+    elif choice == 6:
         return False
     else:
         clear_console()
@@ -936,7 +1451,11 @@ def handle_choice(choice):
 
 
 # For Implementing A Menu Option
-if __name__ == "__main__":
+def main():
+    if len(sys.argv) > 1:
+        # Subcommands run headless, see cli.py
+        import cli
+        return cli.main()
     init()
     while True:
         print("Welcome to the Document Manager. What do you want to do today?")
@@ -944,7 +1463,16 @@ if __name__ == "__main__":
         print("Enter 2 to Create Documents")
         print("Enter 3 to Modify Documents")
         print("Enter 4 to Remove Documents")
-        print("Enter 5 to Exit")
+        print("Enter 5 to Search Documents")
+        print("Enter 6 to Exit")
         choice = int(input("Enter your choice: "))
         if not handle_choice(choice):
             break
+    return 0
+
+
+if __name__ == "__main__":
+    # Run through the imported module, so documents are saved as
+    # document.Email and so on rather than as classes of __main__.
+    import document
+    sys.exit(document.main())
@@ -0,0 +1,189 @@
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from document import Document, Slideshow, Spreadsheet
+from formulas import cell_name
+import storage
+
+FORMATS = ("txt", "md", "html")
+
+
+def field(value):
+    # Fields left empty, e.g. by `create email -f title=hi`, are None.
+    return "" if value is None else str(value)
+
+
+def heading(document):
+    return [f"# {field(document.title).title()}", "", field(document.author), "",
+            field(document.text), ""]
+
+
+def column_names(count):
+    return [cell_name(0, col)[:-1] for col in range(count)]
+
+
+def slide_text(document):
+    # Slideshow.render() is the deck's cover; print() walks the slides.
+    return "".join(f"Slide {number}\n{field(slide)}\n\n"
+                   for number, slide in enumerate(document.slides, 1))
+
+
+def sheet_text(document):
+    # render() cuts cells to the screen's column width, so the export
+    # writes every value whole, one tab-separated line per row.
+    lines = [field(document.title).title(), field(document.author), "", field(document.text), ""]
+    for cells in document.export_rows(values=True):
+        lines.append("\t".join(cell.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+                               for cell in cells))
+    return "\n".join(lines) + "\n"
+
+
+def to_text(document):
+    if isinstance(document, Spreadsheet):
+        return sheet_text(document)
+    if isinstance(document, Slideshow):
+        return document.render() + slide_text(document)
+    return document.render()
+
+
+def to_markdown(document):
+    if isinstance(document, Spreadsheet):
+        lines = heading(document)
+        names = column_names(document.table.cols)
+        lines.append("| | " + " | ".join(names) + " |")
+        lines.append("|---|" + "---|" * len(names))
+        for row, cells in enumerate(document.export_rows(values=True), 1):
+            cells = [cell.replace("|", "\\|").replace("\r\n", "<br>").replace("\n", "<br>")
+                     for cell in cells]
+            lines.append(f"| {row} | " + " | ".join(cells) + " |")
+        return "\n".join(lines) + "\n"
+    if isinstance(document, Slideshow):
+        lines = heading(document)
+        for number, slide in enumerate(document.slides, 1):
+            lines += [f"## Slide {number}", "", field(slide), ""]
+        return "\n".join(lines)
+    # Emails and letters keep their layout, right-aligned signature included.
+    return f"# {field(document.title).title()}\n\n```text\n{to_text(document)}```\n"
+
+
+def to_html(document):
+    title = html.escape(field(document.title).title())
+    about = (f"<h1>{title}</h1>\n<p>{html.escape(field(document.author))}</p>\n"
+             f"<p>{html.escape(field(document.text))}</p>\n")
+    if isinstance(document, Spreadsheet):
+        head = "".join(f"<th>{name}</th>" for name in column_names(document.table.cols))
+        rows = "".join(
+            f"<tr><th>{row}</th>" + "".join(f"<td>{html.escape(cell)}</td>" for cell in cells) + "</tr>\n"
+            for row, cells in enumerate(document.export_rows(values=True), 1))
+        body = f"{about}<table>\n<tr><th></th>{head}</tr>\n{rows}</table>\n"
+    elif isinstance(document, Slideshow):
+        slides = "".join(f"<section>\n<h2>Slide {number}</h2>\n<p>{html.escape(field(slide))}</p>\n"
+                         f"</section>\n" for number, slide in enumerate(document.slides, 1))
+        body = about + slides
+    else:
+        body = f"<pre>{html.escape(to_text(document))}</pre>\n"
+    return (f"<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+            f"<title>{title}</title>\n</head>\n<body>\n{body}</body>\n</html>\n")
+
+
+RENDERERS = dict(zip(FORMATS, (to_text, to_markdown, to_html)))
+
+
+def export_document(document, directory, fmt):
+    # Writes one document to <directory>/<id>.<fmt>; returns the path.
+    path = os.path.join(directory, f"{document.id}.{fmt}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(RENDERERS[fmt](document))
+    return path
+
+
+def export_chunk(store, ids, directory, fmt):
+    # The number of documents exported and (id, error) for each one that
+    # could not be, so one bad document does not stop the others.
+    exported, failed = 0, []
+    for doc_id in ids:
+        try:
+            export_document(store.read(doc_id), directory, fmt)
+        except Exception as error:
+            failed.append((doc_id, f"{type(error).__name__}: {error}"))
+        else:
+            exported += 1
+    return exported, failed
+
+
+# Each worker process opens the store once and reads its chunks' documents
+# itself, so only ids go to the workers and only counts and failures come
+# back.
+_worker_store = None
+
+
+def _open_worker_store(store_path):
+    global _worker_store
+    _worker_store = storage.open_store(store_path)
+    _worker_store.load_headers()
+
+
+def _export_chunk(ids, directory, fmt):
+    return export_chunk(_worker_store, ids, directory, fmt)
+
+
+def chunks(ids, size):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def export_documents(directory, fmt="txt", ids=None, processes=None, chunk_size=256,
+                     progress_every=10000, report=print):
+    # Renders the documents with the given ids, or every document in
+    # Document.store, into directory. Chunks of ids are spread over a pool
+    # of processes; their results are collected in submission order, so
+    # progress counts only ever go up. processes=1 exports in this process.
+    # Returns the number exported and (id, error) for each failure.
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format {fmt!r}, use txt, md or html.")
+    store = Document.store
+    ids = [header.id for header in store.headers()] if ids is None else list(ids)
+    missing = [doc_id for doc_id in ids if doc_id not in store]
+    if missing:
+        raise LookupError(f"No document with id {missing[0]!r}.")
+    os.makedirs(directory, exist_ok=True)
+    if Document.writer is not None:
+        # Saves still queued by this session have to be on disk for the workers.
+        Document.writer.flush()
+
+    started = time.perf_counter()
+    exported, failed = 0, []
+    next_report = progress_every
+    if processes is None:
+        processes = min(os.cpu_count() or 1, max(1, len(ids) // chunk_size))
+    if processes <= 1:
+        pool = None
+        results = (export_chunk(store, chunk, directory, fmt) for chunk in chunks(ids, chunk_size))
+    else:
+        pool = ProcessPoolExecutor(processes, initializer=_open_worker_store,
+                                   initargs=(store.path,))
+        results = pool.map(partial(_export_chunk, directory=directory, fmt=fmt),
+                           chunks(ids, chunk_size))
+    try:
+        for count, errors in results:
+            exported += count
+            for doc_id, error in errors:
+                report(f"Could not export {doc_id}: {error}")
+            failed += errors
+            done = exported + len(failed)
+            if progress_every and done >= next_report:
+                rate = done / max(time.perf_counter() - started, 1e-9)
+                report(f"{done} of {len(ids)} documents done ({rate:.0f} documents/s)")
+                next_report = (done // progress_every + 1) * progress_every
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    elapsed = time.perf_counter() - started
+    report(f"Exported {exported} documents in {elapsed:.2f}s "
+           f"({exported / max(elapsed, 1e-9):.0f} documents/s)"
+           + (f", {len(failed)} failed" if failed else ""))
+    return exported, failed
@@ -0,0 +1,85 @@
+import os
+
+import cli
+import export
+from document import Document, Email, Letter, Slideshow, Spreadsheet
+
+
+def test_every_layout_renders_to_each_format(tmp_path, store):
+    email = Email("Invoice", "Ann", "a@b.c", "d@e.f", "Please pay <soon>", "Payment", "Bob")
+    letter = Letter("Thanks", "Ann", "Here", "There", "Thank you", "Gratitude", "Bob", True)
+    deck = Slideshow("Deck", "Ann", "Intro", 2)
+    deck.slides = ["First slide", "Second | slide"]
+    sheet = Spreadsheet("Budget", "Ann", "Numbers", rows=2, cols=2)
+    sheet.table[0][0] = "5"
+    sheet.table[1][1] = "=A1*2"
+    sheet.table[1][0] = "A very long cell value here\nand a second line"
+    store.put_many([email, letter, deck, sheet])
+
+    out = str(tmp_path / "out")
+    assert export.export_documents(out, "txt", processes=1, report=lambda message: None) == (4, [])
+    text = open(os.path.join(out, f"{deck.id}.txt")).read()
+    assert text.startswith(deck.render()) and "Slide 2\nSecond | slide" in text
+    assert open(os.path.join(out, f"{email.id}.txt")).read() == email.render()
+    # Cells are written whole, not cut to the screen width as in render()
+    assert open(os.path.join(out, f"{sheet.id}.txt")).read().endswith(
+        "5\t\nA very long cell value here\\nand a second line\t10\n")
+
+    export.export_documents(out, "md", ids=[deck.id, sheet.id], processes=1, report=lambda message: None)
+    assert "## Slide 1\n\nFirst slide" in open(os.path.join(out, f"{deck.id}.md")).read()
+    table = open(os.path.join(out, f"{sheet.id}.md")).read()
+    assert "| | A | B |" in table and "| 2 | A very long cell value here<br>and a second line | 10 |" in table
+    assert not os.path.exists(os.path.join(out, f"{email.id}.md"))
+
+    export.export_documents(out, "html", processes=1, report=lambda message: None)
+    page = open(os.path.join(out, f"{email.id}.html")).read()
+    assert "Please pay &lt;soon&gt;" in page and "<title>Invoice</title>" in page
+    assert "<td>10</td>" in open(os.path.join(out, f"{sheet.id}.html")).read()
+
+
+def test_export_spreads_chunks_over_processes(tmp_path, store, monkeypatch, capsys):
+    store.put_many(Email(f"Report {n}", "Ann", "a@b.c", "d@e.f", f"Body {n}", "Subject", "Bob")
+                   for n in range(500))
+
+    messages = []
+    out = str(tmp_path / "out")
+    assert export.export_documents(out, "md", processes=3, chunk_size=40, progress_every=100,
+                                   report=messages.append) == (500, [])
+    assert len(os.listdir(out)) == 500
+    # Chunks are reported in order, however the workers finish
+    assert [int(message.split()[0]) for message in messages[:-1]] == [120, 200, 320, 400, 500]
+    assert messages[-1].startswith("Exported 500 documents")
+
+    # The same through the command line, which opens the store itself
+    monkeypatch.setattr(Document, "saved_documents", Document.saved_documents)
+    assert cli.main(["--store", store.path, "export", str(tmp_path / "html"), "--format", "html",
+                     "--processes", "2", "--chunk-size", "100"]) == 0
+    printed = capsys.readouterr().out
+    assert '"exported": 500' in printed and '"failed": []' in printed
+    assert len(os.listdir(tmp_path / "html")) == 500
+
+
+def test_missing_fields_export_empty_and_failures_are_reported(tmp_path, store, monkeypatch):
+    email = Email.from_record({"title": "hi"})
+    deck = Slideshow.from_record({"title": None, "slides": [None]})
+    store.put_many([email, deck])
+
+    out = str(tmp_path / "out")
+    for fmt in export.FORMATS:
+        assert export.export_documents(out, fmt, processes=1, report=lambda message: None) == (2, [])
+    assert "<title>Hi</title>" in open(os.path.join(out, f"{email.id}.html")).read()
+    assert "## Slide 1" in open(os.path.join(out, f"{deck.id}.md")).read()
+
+    # One document that cannot be rendered does not stop the rest
+    monkeypatch.setitem(export.RENDERERS, "txt", lambda document: document.slides[0])
+    messages = []
+    exported, failed = export.export_documents(str(tmp_path / "again"), "txt", processes=1,
+                                               report=messages.append)
+    assert exported == 1 and [doc_id for doc_id, _ in failed] == [email.id]
+    assert messages[0].startswith(f"Could not export {email.id}: AttributeError")
+    assert messages[-1].endswith(", 1 failed")
+
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
@@ -0,0 +1,336 @@
+import re
+
+TOKEN = re.compile(r"""\s*(?:
+    (?P<number>\d+(?:\.\d*)?|\.\d+)
+    |(?P<ref>[A-Za-z]+\d+(?::[A-Za-z]+\d+)?)
+    |(?P<name>[A-Za-z_]+)
+    |(?P<op>\S)
+)""", re.VERBOSE)
+
+FUNCTIONS = {
+    "SUM": lambda numbers: sum(numbers),
+    "AVERAGE": lambda numbers: sum(numbers) / len(numbers) if numbers else _error("#DIV/0!"),
+    "MIN": lambda numbers: min(numbers) if numbers else 0.0,
+    "MAX": lambda numbers: max(numbers) if numbers else 0.0,
+    "COUNT": lambda numbers: float(len(numbers)),
+}
+FUNCTIONS["AVG"] = FUNCTIONS["AVERAGE"]
+
+
+class FormulaError(Exception):
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+def _error(code):
+    raise FormulaError(code)
+
+
+def parse_cell(ref):
+    # "B3" -> (2, 1): rows are numbered from 1, columns lettered from A.
+    match = re.fullmatch(r"([A-Za-z]+)(\d+)", ref)
+    if not match or int(match.group(2)) == 0:
+        raise FormulaError("#REF!")
+    col = 0
+    for letter in match.group(1).upper():
+        col = col * 26 + ord(letter) - ord("A") + 1
+    return int(match.group(2)) - 1, col - 1
+
+
+def cell_name(row, col):
+    letters = ""
+    col += 1
+    while col:
+        col, rest = divmod(col - 1, 26)
+        letters = chr(ord("A") + rest) + letters
+    return f"{letters}{row + 1}"
+
+
+def _tokenize(source):
+    tokens = []
+    pos = 0
+    source = source.rstrip()
+    while pos < len(source):
+        match = TOKEN.match(source, pos)
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        pos = match.end()
+    tokens.append(("end", None))
+    return tokens
+
+
+# Formulas are parsed once into nested tuples:
+#   ("num", value), ("ref", cell), ("range", first, last),
+#   ("neg", expr), ("bin", op, left, right), ("call", name, args)
+class _Parser:
+
+    def __init__(self, source):
+        self._tokens = _tokenize(source)
+        self._pos = 0
+
+    def _peek(self):
+        return self._tokens[self._pos]
+
+    def _take(self, value=None):
+        token = self._tokens[self._pos]
+        if value is not None and token[1] != value:
+            raise FormulaError("#ERROR!")
+        self._pos += 1
+        return token
+
+    def parse(self):
+        expr = self._expr()
+        if self._peek()[0] != "end":
+            raise FormulaError("#ERROR!")
+        return expr
+
+    def _expr(self):
+        expr = self._term()
+        while self._peek()[1] in ("+", "-"):
+            op = self._take()[1]
+            expr = ("bin", op, expr, self._term())
+        return expr
+
+    def _term(self):
+        expr = self._unary()
+        while self._peek()[1] in ("*", "/"):
+            op = self._take()[1]
+            expr = ("bin", op, expr, self._unary())
+        return expr
+
+    def _unary(self):
+        if self._peek()[1] == "-":
+            self._take()
+            return ("neg", self._unary())
+        if self._peek()[1] == "+":
+            self._take()
+            return self._unary()
+        expr = self._atom()
+        if self._peek()[1] == "^":
+            self._take()
+            expr = ("bin", "^", expr, self._unary())
+        return expr
+
+    def _atom(self):
+        kind, value = self._take()
+        if kind == "number":
+            return ("num", float(value))
+        if kind == "ref" and ":" not in value:
+            return ("ref", parse_cell(value))
+        if kind == "name" and value.upper() in FUNCTIONS:
+            self._take("(")
+            args = []
+            if self._peek()[1] != ")":
+                args.append(self._argument())
+                while self._peek()[1] == ",":
+                    self._take()
+                    args.append(self._argument())
+            self._take(")")
+            return ("call", value.upper(), tuple(args))
+        if value == "(":
+            expr = self._expr()
+            self._take(")")
+            return expr
+        raise FormulaError("#ERROR!" if kind != "name" else "#NAME?")
+
+    def _argument(self):
+        kind, value = self._peek()
+        if kind == "ref" and ":" in value:
+            self._take()
+            first, last = value.split(":")
+            return ("range", parse_cell(first), parse_cell(last))
+        return self._expr()
+
+
+def parse(source):
+    return _Parser(source).parse()
+
+
+def _range_cells(first, last):
+    for row in range(min(first[0], last[0]), max(first[0], last[0]) + 1):
+        for col in range(min(first[1], last[1]), max(first[1], last[1]) + 1):
+            yield row, col
+
+
+def references(expr):
+    kind = expr[0]
+    if kind == "ref":
+        return {expr[1]}
+    if kind == "range":
+        return set(_range_cells(expr[1], expr[2]))
+    if kind == "neg":
+        return references(expr[1])
+    if kind == "bin":
+        return references(expr[2]) | references(expr[3])
+    if kind == "call":
+        cells = set()
+        for arg in expr[2]:
+            cells |= references(arg)
+        return cells
+    return set()
+
+
+def evaluate(expr, lookup):
+    kind = expr[0]
+    if kind == "num":
+        return expr[1]
+    if kind == "ref":
+        return _number(lookup(expr[1]))
+    if kind == "neg":
+        return -evaluate(expr[1], lookup)
+    if kind == "bin":
+        left = evaluate(expr[2], lookup)
+        right = evaluate(expr[3], lookup)
+        op = expr[1]
+        if op == "+":
+            return left + right
+        if op == "-":
+            return left - right
+        if op == "*":
+            return left * right
+        if op == "/":
+            if right == 0:
+                raise FormulaError("#DIV/0!")
+            return left / right
+        try:
+            return float(left ** right)
+        except (OverflowError, ZeroDivisionError, TypeError):
+            raise FormulaError("#NUM!") from None
+    if kind == "call":
+        numbers = []
+        for arg in expr[2]:
+            if arg[0] == "range":
+                # Aggregates skip blank and text cells, like other spreadsheets.
+                for cell in _range_cells(arg[1], arg[2]):
+                    value = lookup(cell)
+                    if isinstance(value, float):
+                        numbers.append(value)
+            else:
+                numbers.append(evaluate(arg, lookup))
+        return float(FUNCTIONS[expr[1]](numbers))
+    raise FormulaError("#ERROR!")
+
+
+def _number(value):
+    if value is None:
+        return 0.0
+    if isinstance(value, float):
+        return value
+    raise FormulaError("#VALUE!")
+
+
+# Keeps the parsed formula of every "=..." cell of a SparseTable together
+# with its last value and the dependency graph between cells. A change to
+# one cell only re-evaluates the formulas that transitively depend on it,
+# in topological order; formulas caught in a cycle evaluate to #CYCLE!.
+class FormulaEngine:
+
+    def __init__(self, table):
+        self._table = table
+        self._formulas = {}
+        self._values = {}
+        self._precedents = {}
+        self._dependents = {}
+        self.last_recalculated = 0
+        table.watch(self)
+        self.rebuild()
+
+    def rebuild(self):
+        self._formulas.clear()
+        self._values.clear()
+        self._precedents.clear()
+        self._dependents.clear()
+        cells = [(row, col) for row, col, raw in self._table.cells()
+                 if isinstance(raw, str) and raw.startswith("=")]
+        for cell in cells:
+            self._link(cell, self._table.get(*cell))
+        self._recalculate(cells)
+
+    def is_formula(self, cell):
+        return cell in self._values
+
+    def value(self, cell):
+        return self._values.get(cell)
+
+    def cell_changed(self, row, col):
+        cell = (row, col)
+        self._unlink(cell)
+        raw = self._table.get(row, col)
+        if isinstance(raw, str) and raw.startswith("="):
+            self._link(cell, raw)
+        self._recalculate([cell])
+
+    def column_changed(self, col):
+        self._recalculate([cell for cell in self._dependents if cell[1] == col])
+
+    def _link(self, cell, raw):
+        try:
+            expr = parse(raw[1:])
+        except FormulaError as error:
+            self._values[cell] = error.code
+            return
+        self._formulas[cell] = expr
+        self._values[cell] = None
+        precedents = references(expr)
+        self._precedents[cell] = precedents
+        for precedent in precedents:
+            self._dependents.setdefault(precedent, set()).add(cell)
+
+    def _unlink(self, cell):
+        self._formulas.pop(cell, None)
+        self._values.pop(cell, None)
+        for precedent in self._precedents.pop(cell, ()):
+            dependents = self._dependents.get(precedent)
+            if dependents is not None:
+                dependents.discard(cell)
+                if not dependents:
+                    del self._dependents[precedent]
+
+    def _recalculate(self, changed):
+        affected = {cell for cell in changed if cell in self._formulas}
+        stack = list(changed)
+        while stack:
+            for dependent in self._dependents.get(stack.pop(), ()):
+                if dependent not in affected:
+                    affected.add(dependent)
+                    stack.append(dependent)
+
+        waiting = {cell: len(self._precedents[cell] & affected) for cell in affected}
+        ready = [cell for cell, count in waiting.items() if count == 0]
+        order = []
+        while ready:
+            cell = ready.pop()
+            order.append(cell)
+            for dependent in self._dependents.get(cell, ()):
+                if dependent in waiting:
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        ready.append(dependent)
+
+        for cell in order:
+            try:
+                self._values[cell] = evaluate(self._formulas[cell], self._lookup)
+            except FormulaError as error:
+                self._values[cell] = error.code
+        for cell in affected.difference(order):
+            self._values[cell] = "#CYCLE!"
+        self.last_recalculated = len(affected)
+
+    def _lookup(self, cell):
+        row, col = cell
+        if not (0 <= row < self._table.rows and 0 <= col < self._table.cols):
+            raise FormulaError("#REF!")
+        if cell in self._values:
+            value = self._values[cell]
+            if isinstance(value, str):
+                raise FormulaError(value)
+            return value
+        raw = self._table.get(row, col)
+        if raw == "":
+            return None
+        try:
+            return float(raw)
+        except ValueError:
+            return raw
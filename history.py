@@ -0,0 +1,412 @@
+import os
+import pickle
+import struct
+import zlib
+from collections import namedtuple
+
+from locking import FileLock
+from storage import compression_options, decode_blob, decode_body, encode_blob, encode_body
+
+MAGIC = b"DOCHIST2\n"
+
+FULL = 1
+DELTA = 2
+BLOB = 3
+DROP = 4
+
+# payload length, crc32 of the payload
+FRAME = struct.Struct("<II")
+# A payload is the length of its pickled metadata, the metadata and a body.
+META = struct.Struct("<I")
+
+# Every CHECKPOINT_EVERY-th revision of a document is stored in full, so
+# rebuilding any revision applies fewer than that many deltas.
+CHECKPOINT_EVERY = 16
+
+HistoryEntry = namedtuple("HistoryEntry", "revision kind offset length")
+
+
+def diff_lines(old, new):
+    # (start, end, lines) replacements turning old's lines into new's.
+    import difflib
+    old, new = (old or "").splitlines(True), (new or "").splitlines(True)
+    return [(i1, i2, new[j1:j2])
+            for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes()
+            if tag != "equal"]
+
+
+def patch_lines(old, changes):
+    old = (old or "").splitlines(True)
+    lines, position = [], 0
+    for start, end, replacement in changes:
+        lines.extend(old[position:start])
+        lines.extend(replacement)
+        position = end
+    lines.extend(old[position:])
+    return "".join(lines)
+
+
+def diff_items(old, new):
+    # The new length and the items that differ, by index.
+    old = old or []
+    return len(new), {index: item for index, item in enumerate(new)
+                      if index >= len(old) or old[index] != item}
+
+
+def patch_items(old, changes):
+    length, items = changes
+    new = list((old or [])[:length])
+    new.extend([None] * (length - len(new)))
+    for index, item in items.items():
+        new[index] = item
+    return new
+
+
+def diff_cells(old, new):
+    # Spreadsheet cells by name: the ones set or changed, and the names of
+    # the ones cleared.
+    old = old or {}
+    return ({name: value for name, value in new.items() if old.get(name) != value},
+            [name for name in old if name not in new])
+
+
+def patch_cells(old, changes):
+    changed, cleared = changes
+    new = dict(old or {})
+    for name in cleared:
+        new.pop(name, None)
+    new.update(changed)
+    return new
+
+
+def diff_grid(old, new):
+    # Dense list-of-rows tables, as spreadsheet records held them before
+    # they became sparse: the new shape and the cells that differ.
+    old = old or []
+    cells = {}
+    for row, values in enumerate(new):
+        before = old[row] if row < len(old) else ()
+        for col, value in enumerate(values):
+            if (before[col] if col < len(before) else "") != value:
+                cells[(row, col)] = value
+    return len(new), max((len(values) for values in new), default=0), cells
+
+
+def patch_grid(old, changes):
+    rows, cols, cells = changes
+    old = old or []
+    new = [[(old[row][col] if row < len(old) and col < len(old[row]) else "")
+            for col in range(cols)] for row in range(rows)]
+    for (row, col), value in cells.items():
+        new[row][col] = value
+    return new
+
+
+# How the bulky record fields change between revisions. Anything else is
+# stored whole when it changes.
+DIFFS = {
+    "text": (diff_lines, patch_lines),
+    "slides": (diff_items, patch_items),
+    "cells": (diff_cells, patch_cells),
+    "table": (diff_grid, patch_grid),
+}
+
+
+def diff_records(old, new):
+    delta = {}
+    for name, value in new.items():
+        if old.get(name) == value:
+            continue
+        if name in DIFFS and name in old:
+            delta[name] = (True, DIFFS[name][0](old[name], value))
+        else:
+            delta[name] = (False, value)
+    return delta
+
+
+def patch_record(old, delta):
+    new = dict(old)
+    for name, (diffed, change) in delta.items():
+        new[name] = DIFFS[name][1](old.get(name), change) if diffed else change
+    return new
+
+
+_histories = {}
+
+
+def open_history(store_path, **options):
+    # One History per store, kept next to it in <store path>.history. Codec
+    # options given replace those it was opened with, by default the ones
+    # of compression_options().
+    path = store_path + ".history"
+    if path not in _histories or options:
+        _histories[path] = History(path, **dict(compression_options(), **options))
+    return _histories[path]
+
+
+def _split(payload):
+    # (metadata, body) of a frame's payload.
+    meta_len, = META.unpack_from(payload)
+    return pickle.loads(payload[META.size:META.size + meta_len]), payload[META.size + meta_len:]
+
+
+# Append-only log of document records, one frame per saved revision. Most
+# frames hold only the delta from the revision before: line diffs for the
+# text, changed indices for slides and changed cells for spreadsheets, so
+# the file grows with what was changed rather than with the size of the
+# document. A revision is stored in full when it is the first one known for
+# its document, when the previous revision is missing (e.g. it was bulk
+# imported) or every CHECKPOINT_EVERY revisions.
+#
+# Contents are encoded like the store's records: compressed with the codec,
+# with strings of BLOB_MIN_LENGTH characters or more kept once per file in
+# BLOB frames. A DROP frame forgets a removed document's revisions; compact()
+# rewrites the file without them and without the blobs only they used.
+#
+# Offsets are indexed in memory; appends by other processes are picked up
+# by scanning from where this process last stopped.
+class History:
+
+    def __init__(self, path, checkpoint_every=CHECKPOINT_EVERY, codec="zlib",
+                 compress_min_bytes=512, compact_ratio=0.5, compact_min_bytes=1 << 20):
+        self._path = path
+        self._checkpoint_every = checkpoint_every
+        self._codec = codec
+        self._compress_min_bytes = compress_min_bytes
+        self._compact_ratio = compact_ratio
+        self._compact_min_bytes = compact_min_bytes
+        self._reset()
+        self._lock = FileLock(path + ".lock")
+
+    @property
+    def path(self):
+        return self._path
+
+    def _reset(self):
+        self._entries = {}
+        self._blobs = {}
+        self._end = 0
+        self._dead_bytes = 0
+        self._identity = None
+
+    def _file_identity(self):
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            return None
+        return stat.st_dev, stat.st_ino
+
+    def _catch_up(self):
+        identity = self._file_identity()
+        if identity is None or identity != self._identity:
+            # New, or rewritten by compact() in another process.
+            self._reset()
+            self._identity = identity
+        if identity is None:
+            return
+        size = os.path.getsize(self._path)
+        if size < self._end:
+            self._reset()
+            self._identity = identity
+        if size == self._end:
+            return
+        with open(self._path, "rb") as f:
+            if self._end == 0:
+                if f.read(len(MAGIC)) != MAGIC:
+                    f.seek(0)
+                    self._migrate(f.read())
+                    return
+                self._end = len(MAGIC)
+            f.seek(self._end)
+            while True:
+                frame = f.read(FRAME.size)
+                if len(frame) < FRAME.size:
+                    break
+                length, crc = FRAME.unpack(frame)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    # Torn tail of a write that never finished.
+                    break
+                self._index(_split(payload)[0], self._end + FRAME.size, length)
+                self._end += FRAME.size + length
+
+    def _index(self, meta, offset, length):
+        kind = meta["kind"]
+        if kind == BLOB:
+            self._blobs[meta["digest"]] = (offset, length)
+        elif kind == DROP:
+            dropped = self._entries.pop(meta["id"], ())
+            self._dead_bytes += FRAME.size + length + sum(FRAME.size + entry.length
+                                                          for entry in dropped)
+        else:
+            self._entries.setdefault(meta["id"], []).append(
+                HistoryEntry(meta["revision"], kind, offset, length))
+
+    def _migrate(self, data):
+        # Histories written before payloads were encoded hold one plain
+        # pickle of (doc_id, revision, kind, content) per frame.
+        frames, position, stored = [], 0, {}
+        while position + FRAME.size <= len(data):
+            length, crc = FRAME.unpack_from(data, position)
+            payload = data[position + FRAME.size:position + FRAME.size + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            doc_id, revision, kind, content = pickle.loads(payload)
+            frames += self._frames(doc_id, revision, kind, content, stored)
+            position += FRAME.size + length
+        self._rewrite(frames)
+
+    def _frame(self, meta, body=b""):
+        meta_bytes = pickle.dumps(meta, protocol=pickle.HIGHEST_PROTOCOL)
+        payload = META.pack(len(meta_bytes)) + meta_bytes + body
+        return meta, FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def _frames(self, doc_id, revision, kind, content, stored):
+        # (meta, frame) for content's blobs missing from stored, which they
+        # are added to, then for the revision itself.
+        blobs = {}
+        body, codec = encode_body(content, self._codec, self._compress_min_bytes, blobs)
+        frames = []
+        for digest, text in blobs.items():
+            if digest not in stored:
+                stored[digest] = None
+                data, blob_codec = encode_blob(text, self._codec, self._compress_min_bytes)
+                frames.append(self._frame({"kind": BLOB, "digest": digest, "codec": blob_codec}, data))
+        frames.append(self._frame({"kind": kind, "id": doc_id, "revision": revision,
+                                   "codec": codec, "blobs": list(blobs)}, body))
+        return frames
+
+    def _append(self, frames):
+        with open(self._path, "ab") as f:
+            if f.tell() != self._end:
+                # The tail was torn; start over behind it.
+                f.truncate(self._end)
+            if self._end == 0:
+                f.write(MAGIC)
+                self._end = len(MAGIC)
+            f.write(b"".join(frame for meta, frame in frames))
+        self._identity = self._file_identity()
+        for meta, frame in frames:
+            self._index(meta, self._end + FRAME.size, len(frame) - FRAME.size)
+            self._end += len(frame)
+
+    def _rewrite(self, frames):
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(b"".join(frame for meta, frame in frames))
+        os.replace(tmp_path, self._path)
+        self._reset()
+        self._identity = self._file_identity()
+        self._end = len(MAGIC)
+        for meta, frame in frames:
+            self._index(meta, self._end + FRAME.size, len(frame) - FRAME.size)
+            self._end += len(frame)
+
+    def revisions(self, doc_id):
+        # HistoryEntries of doc_id, oldest first.
+        with self._lock:
+            self._catch_up()
+        return list(self._entries.get(doc_id, ()))
+
+    def record(self, doc_id, revision, record, previous=None):
+        # Stores record as revision of doc_id; previous is the record of the
+        # revision before, if the caller knows it.
+        with self._lock:
+            self._catch_up()
+            entries = self._entries.get(doc_id, [])
+            since_full = 0
+            for entry in reversed(entries):
+                if entry.kind == FULL:
+                    break
+                since_full += 1
+            if (previous is None or not entries or entries[-1].revision != revision - 1
+                    or since_full + 1 >= self._checkpoint_every):
+                kind, content = FULL, record
+            else:
+                kind, content = DELTA, diff_records(previous, record)
+            self._append(self._frames(doc_id, revision, kind, content, dict(self._blobs)))
+            return kind
+
+    def drop(self, doc_id):
+        # Forgets doc_id's revisions once the document is removed.
+        with self._lock:
+            self._catch_up()
+            if doc_id not in self._entries:
+                return
+            self._append([self._frame({"kind": DROP, "id": doc_id})])
+            if (self._dead_bytes >= self._compact_min_bytes
+                    and self._dead_bytes >= self._end * self._compact_ratio):
+                self.compact()
+
+    def compact(self, keep=None, recode=False):
+        # Rewrites the file with the revisions of the documents in keep, by
+        # default every one not dropped, and the blobs they use. Frames are
+        # copied as they are, or with recode encoded again with the current
+        # codec.
+        with self._lock:
+            self._catch_up()
+            if self._end == 0:
+                return
+            frames, used = [], set()
+            with open(self._path, "rb") as f:
+                if recode:
+                    def blob(digest):
+                        meta, data = self._read(f, *self._blobs[digest])
+                        return decode_blob(data, meta["codec"])
+
+                    stored = {}
+                    for doc_id, entries in self._entries.items():
+                        if keep is not None and doc_id not in keep:
+                            continue
+                        for entry in entries:
+                            meta, body = self._read(f, entry.offset, entry.length)
+                            frames += self._frames(doc_id, entry.revision, entry.kind,
+                                                   decode_body(body, meta["codec"], blob), stored)
+                    self._rewrite(frames)
+                    return
+
+                def payload(offset, length):
+                    f.seek(offset)
+                    data = f.read(length)
+                    return _split(data)[0], FRAME.pack(length, zlib.crc32(data)) + data
+
+                for doc_id, entries in self._entries.items():
+                    if keep is not None and doc_id not in keep:
+                        continue
+                    for entry in entries:
+                        meta, frame = payload(entry.offset, entry.length)
+                        used.update(meta.get("blobs", ()))
+                        frames.append((meta, frame))
+                blobs = [payload(*self._blobs[digest]) for digest in self._blobs if digest in used]
+            self._rewrite(blobs + frames)
+
+    def _read(self, f, offset, length):
+        f.seek(offset)
+        return _split(f.read(length))
+
+    def load(self, doc_id, revision):
+        # The record doc_id had at revision, rebuilt from the nearest full
+        # copy at or before it. None if that revision is not in the history.
+        with self._lock:
+            entries = [entry for entry in self.revisions(doc_id) if entry.revision <= revision]
+            start = next((position for position in range(len(entries) - 1, -1, -1)
+                          if entries[position].kind == FULL), None)
+            if start is None or entries[-1].revision != revision:
+                return None
+            chain = entries[start:]
+            if any(b.revision != a.revision + 1 for a, b in zip(chain, chain[1:])):
+                return None
+            record = None
+            with open(self._path, "rb") as f:
+                def blob(digest):
+                    if digest not in self._blobs:
+                        return None
+                    meta, data = self._read(f, *self._blobs[digest])
+                    return decode_blob(data, meta["codec"])
+
+                for entry in chain:
+                    meta, body = self._read(f, entry.offset, entry.length)
+                    content = decode_body(body, meta["codec"], blob)
+                    record = content if entry.kind == FULL else patch_record(record, content)
+            return record
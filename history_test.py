@@ -0,0 +1,118 @@
+import os
+import pickle
+import zlib
+
+from document import Document, Email, Slideshow, Spreadsheet
+from history import DELTA, FRAME, FULL, MAGIC, History, diff_records, open_history, patch_record
+
+
+def test_deltas_round_trip():
+    old = {"title": "Deck", "text": "one\ntwo\nthree\n", "slides": ["a", "b", "c"],
+           "cells": {"A1": "1", "B1": "2", "B2": "4"}, "rows": 2,
+           "table": [["1", "2"], ["3", "4"]]}
+    new = {"title": "Deck", "text": "one\n2\nthree\nfour\n", "slides": ["a", "B"],
+           "cells": {"A1": "1", "B2": "5", "B3": "6"}, "rows": 3,
+           "table": [["1", "2"], ["3", "5"], ["", "6"]]}
+    delta = diff_records(old, new)
+    assert set(delta) == {"text", "slides", "cells", "rows", "table"}
+    assert delta["slides"] == (True, (2, {1: "B"}))
+    assert delta["cells"] == (True, ({"B2": "5", "B3": "6"}, ["B1"]))
+    assert delta["table"] == (True, (3, 2, {(1, 1): "5", (2, 1): "6"}))
+    assert patch_record(old, delta) == new
+
+
+def test_history_stores_what_changed(store):
+    sheet = Spreadsheet("Budget", "Ann", "Numbers", rows=200, cols=20)
+    for row in range(200):
+        sheet.table[row] = [f"r{row}c{col}" for col in range(20)]
+    sheet.persist()
+    for revision in range(2, 20):
+        sheet.table[revision][3] = f"edit {revision}"
+        sheet.persist()
+
+    entries = History(store.path + ".history").revisions(sheet.id)
+    assert [entry.revision for entry in entries] == list(range(1, 20))
+    kinds = [entry.kind for entry in entries]
+    assert kinds[0] == kinds[16] == FULL and kinds.count(DELTA) == 17
+    full, delta = entries[0].length, entries[1].length
+    assert delta * 50 < full
+
+    # Any revision comes back exactly as it was saved
+    assert sheet.revision_record(1)["cells"]["D6"] == "r5c3"
+    assert sheet.revision_record(7)["cells"]["D8"] == "edit 7"
+    assert sheet.revision_record(7)["cells"]["D9"] == "r8c3"
+    assert sheet.revision_record(19) == sheet.to_record()
+    assert sheet.revision_record(20) is None
+
+
+def test_undo_steps_back_through_saved_revisions(store):
+    email = Email("Invoice", "Ann", "a@b.c", "d@e.f", "Please pay", "Payment", "Bob")
+    email.persist()
+    email.text = "Please pay soon"
+    email.persist()
+    email._subject = "Reminder"
+    email.persist()
+
+    # Unsaved edits go first, then one saved revision per call
+    email.title = "Scratch"
+    assert email.undo() and (email.title, email._subject) == ("Invoice", "Reminder")
+    assert email.undo() and (email.text, email._subject) == ("Please pay soon", "Payment")
+    assert email.undo() and email.text == "Please pay"
+    assert not email.undo()
+
+    # Saving the undone state is just another revision
+    email.persist()
+    assert email._revision == 4
+    assert email.revision_record(4)["text"] == "Please pay"
+
+    deck = Slideshow("Deck", "Ann", "Intro", 3)
+    deck.slides = ["a", "b", "c"]
+    deck.persist()
+    deck.slides[1] = "changed"
+    deck.persist()
+    assert deck.undo() and deck.slides == ["a", "b", "c"]
+
+
+def test_history_shares_text_and_forgets_removed_documents(store):
+    boilerplate = " ".join(f"clause {n}" for n in range(2000))
+    emails = [Email(f"Notice {n}", "Ann", "a@b.c", "d@e.f", boilerplate, "Terms", "Bob")
+              for n in range(50)]
+    for email in emails:
+        email.persist()
+    history = open_history(store.path)
+    size = os.path.getsize(history.path)
+    assert size < len(boilerplate)
+    assert emails[7].revision_record(1)["text"] == emails[7].text
+
+    for email in emails[:40]:
+        Document.saved_documents.remove(email.id)
+        Document.discard(email.id)
+    assert history.revisions(emails[0].id) == []
+    history.compact()
+    assert os.path.getsize(history.path) < size / 2
+    assert emails[45].revision_record(1)["text"] == emails[45].text
+
+    # Removing the last user of the text frees it at the next compaction
+    for email in emails[40:]:
+        Document.saved_documents.remove(email.id)
+        Document.discard(email.id)
+    history.compact()
+    assert os.path.getsize(history.path) < 1000
+
+
+def test_history_written_before_encoding_is_migrated(tmp_path):
+    path = str(tmp_path / "docs.history")
+    records = [{"title": "Hi", "text": "one"}, {"title": "Hi", "text": "two"}]
+    with open(path, "wb") as f:
+        for revision, (kind, content) in enumerate(
+                [(FULL, records[0]), (DELTA, diff_records(*records))], 1):
+            payload = pickle.dumps(("doc", revision, kind, content))
+            f.write(FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+    history = History(path)
+    assert history.load("doc", 2) == records[1]
+    with open(path, "rb") as f:
+        assert f.read(len(MAGIC)) == MAGIC
+
+
+if __name__ == "__main__":
+    test_deltas_round_trip()
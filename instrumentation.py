@@ -0,0 +1,133 @@
+import atexit
+import functools
+import os
+import sys
+import time
+
+# Opt-in counters and timings for the hot paths. Set DOCUMENT_MANAGER_PROFILE
+# before starting the program to turn them on:
+#
+#   DOCUMENT_MANAGER_PROFILE=1            text report on stderr at exit
+#   DOCUMENT_MANAGER_PROFILE=profile.txt  text report written to the file
+#   DOCUMENT_MANAGER_PROFILE=profile.json JSON report written to the file
+#
+# On platforms with SIGUSR1 the report is also written whenever the process
+# receives it. When the variable is unset timed() hands back the function it
+# was given, so disabled instrumentation costs nothing per call.
+ENVIRONMENT_VARIABLE = "DOCUMENT_MANAGER_PROFILE"
+
+
+class Stat:
+    # Keeps a fixed-size random sample of the timings for the percentiles,
+    # so a long session does not grow without bound.
+    SAMPLES = 10000
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        if len(self.samples) < self.SAMPLES:
+            self.samples.append(elapsed)
+        else:
+            import random
+            slot = random.randrange(self.count)
+            if slot < self.SAMPLES:
+                self.samples[slot] = elapsed
+
+    def summary(self):
+        ordered = sorted(self.samples)
+
+        def percentile(p):
+            return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000 if ordered else 0.0
+
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": percentile(50),
+            "p90_ms": percentile(90),
+            "p99_ms": percentile(99),
+            "max_ms": self.max * 1000,
+        }
+
+
+class Recorder:
+
+    def __init__(self):
+        self.stats = {}
+
+    def record(self, name, elapsed):
+        stat = self.stats.get(name)
+        if stat is None:
+            stat = self.stats[name] = Stat()
+        stat.add(elapsed)
+
+    def timed(self, name):
+        def decorator(function):
+            clock = time.perf_counter
+            record = self.record
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                started = clock()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    record(name, clock() - started)
+
+            return wrapper
+        return decorator
+
+    def report(self):
+        return {name: self.stats[name].summary() for name in sorted(self.stats)}
+
+    def format_text(self):
+        lines = [f"{'operation':<24}{'count':>9}{'total ms':>12}{'mean ms':>10}"
+                 f"{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for name, stat in self.report().items():
+            lines.append(f"{name:<24}{stat['count']:>9}{stat['total_ms']:>12.2f}{stat['mean_ms']:>10.3f}"
+                         f"{stat['p50_ms']:>10.3f}{stat['p90_ms']:>10.3f}{stat['p99_ms']:>10.3f}"
+                         f"{stat['max_ms']:>10.3f}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, target):
+        if target in ("1", "-", "stderr"):
+            sys.stderr.write(self.format_text())
+            return
+        if target.endswith(".json"):
+            import json
+            text = json.dumps(self.report(), indent=2)
+        else:
+            text = self.format_text()
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+target = os.environ.get(ENVIRONMENT_VARIABLE)
+recorder = Recorder() if target else None
+
+
+def timed(name):
+    # Decorator recording every call under name, or nothing when disabled.
+    if recorder is None:
+        return lambda function: function
+    return recorder.timed(name)
+
+
+def dump():
+    if recorder is not None:
+        recorder.dump(target)
+
+
+if recorder is not None:
+    import signal
+    atexit.register(dump)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: dump())
@@ -0,0 +1,43 @@
+import json
+
+import instrumentation
+
+
+def test_recorder_counts_and_times_calls(tmp_path):
+    recorder = instrumentation.Recorder()
+
+    @recorder.timed("double")
+    def double(value):
+        """Doubles value."""
+        if value < 0:
+            raise ValueError(value)
+        return value * 2
+
+    assert [double(n) for n in range(5)] == [0, 2, 4, 6, 8]
+    try:
+        double(-1)
+    except ValueError:
+        pass
+    assert double.__name__ == "double" and double.__doc__ == "Doubles value."
+
+    stats = recorder.report()["double"]
+    assert stats["count"] == 6
+    assert 0 <= stats["p50_ms"] <= stats["p99_ms"] <= stats["max_ms"]
+
+    path = tmp_path / "profile.json"
+    recorder.dump(str(path))
+    assert json.loads(path.read_text())["double"]["count"] == 6
+    recorder.dump(str(tmp_path / "profile.txt"))
+    assert (tmp_path / "profile.txt").read_text().splitlines()[1].startswith("double")
+
+
+def test_disabled_instrumentation_returns_the_function_itself():
+    if instrumentation.recorder is None:
+        function = len
+        assert instrumentation.timed("len")(function) is function
+
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    test_recorder_counts_and_times_calls(pathlib.Path(tempfile.mkdtemp()))
+    test_disabled_instrumentation_returns_the_function_itself()
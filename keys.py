@@ -0,0 +1,51 @@
+# Every navigation screen reads its keys through this module. read_key()
+# blocks until a key is pressed, so an idle screen costs no CPU, and tests
+# can swap the keyboard for a ScriptedKeySource with use().
+
+
+class KeyboardKeySource:
+
+    def read(self):
+        import keyboard
+        while True:
+            event = keyboard.read_event()
+            if event.event_type == keyboard.KEY_DOWN:
+                return event.name
+
+
+class ScriptedKeySource:
+
+    def __init__(self, keys):
+        self._keys = iter(keys)
+
+    def read(self):
+        # Once the script runs out every screen is sent back with esc.
+        return next(self._keys, "esc")
+
+
+source = KeyboardKeySource()
+
+
+def use(key_source):
+    global source
+    previous = source
+    source = key_source
+    return previous
+
+
+def read_key():
+    return source.read()
+
+
+# Calls handlers[key] for every key pressed until a handler returns True.
+# Keys without a handler go to default(key) if there is one, and are
+# ignored otherwise.
+def dispatch(handlers, default=None):
+    while True:
+        key = read_key()
+        handler = handlers.get(key)
+        if handler is not None:
+            if handler():
+                return
+        elif default is not None and default(key):
+            return
@@ -0,0 +1,66 @@
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+# Exclusive lock on a file shared by every process using the same store.
+# It is reentrant within a process, and threads of one process also
+# exclude each other.
+class FileLock:
+
+    def __init__(self, path):
+        self._path = path
+        self._file = None
+        self._depth = 0
+        self._thread_lock = threading.RLock()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def threads(self):
+        # Excludes the other threads of this process, but not other
+        # processes: for reads that must not overlap this process's writes.
+        return self._thread_lock
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                self._file = open(self._path, "a+b")
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+                else:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,213 @@
+import bisect
+import sys
+
+import keys
+from auxilliary_functions import clear_console
+
+CLEAR = "\033[K"
+HIGHLIGHT = "\033[7m"
+RESET = "\033[0m"
+
+HINT = ("Up/down to move, page up/page down to jump a page, type to filter by title. "
+        "Press 'esc' to exit.")
+
+
+# Document ids sorted by lowercase title. A prefix is two binary searches
+# and comes back as a range of positions; a query that is not a prefix of
+# any title falls back to a fuzzy match, titles containing the query's
+# characters in order.
+class TitleIndex:
+
+    def __init__(self, entries=()):
+        # entries are (title, id) pairs.
+        self._titles = {doc_id: str(title or "").lower() for title, doc_id in entries}
+        self._keys = sorted((title, doc_id) for doc_id, title in self._titles.items())
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __getitem__(self, position):
+        return self._keys[position][1]
+
+    def position(self, doc_id):
+        return bisect.bisect_left(self._keys, (self._titles[doc_id], doc_id))
+
+    def add(self, title, doc_id):
+        self.remove(doc_id)
+        self._titles[doc_id] = str(title or "").lower()
+        bisect.insort(self._keys, (self._titles[doc_id], doc_id))
+
+    def remove(self, doc_id):
+        if doc_id in self._titles:
+            del self._keys[self.position(doc_id)]
+            del self._titles[doc_id]
+
+    def prefix(self, prefix):
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._keys, (prefix,))
+        end = bisect.bisect_left(self._keys, (prefix + "\U0010ffff",))
+        return range(start, end)
+
+    def fuzzy(self, query):
+        query = query.lower()
+        matches = []
+        for position, (title, _) in enumerate(self._keys):
+            characters = iter(title)
+            if all(character in characters for character in query):
+                matches.append(position)
+        return matches
+
+    def search(self, query):
+        # Positions of the matching titles, in title order.
+        matches = self.prefix(query)
+        if not matches:
+            matches = self.fuzzy(query)
+        return matches
+
+
+# Arrow-key list of documents over a TitleIndex. Only the page around the
+# selection is ever drawn, so a store of any size costs one page of labels
+# per keypress, and typing narrows the list to the matching titles.
+#
+# on_enter(doc_id) runs for the selected document with the screen to
+# itself; the picker closes if it returns True and is drawn again otherwise.
+class Picker:
+
+    def __init__(self, headers, heading=(), page_size=None, stream=None):
+        # headers: anything with id, title and type_name, e.g. the
+        # registry's entries. Only the visible ones are ever labelled.
+        self._headers = {header.id: header for header in headers}
+        self._index = TitleIndex((header.title, header.id) for header in self._headers.values())
+        self._heading = list(heading)
+        self._page_size = page_size
+        self._stream = stream or sys.stdout
+        self.query = ""
+        self._matches = range(len(self._index))
+        self.selected = 0
+        self._top = 0
+
+    def __len__(self):
+        return len(self._matches)
+
+    @property
+    def page_size(self):
+        if self._page_size is not None:
+            return self._page_size
+        # The heading, the filter line and the hint take up the rest.
+        import shutil
+        return max(1, shutil.get_terminal_size().lines - len(self._heading) - 3)
+
+    def current(self):
+        if not self._matches:
+            return None
+        return self._index[self._matches[self.selected]]
+
+    def _search(self):
+        self._matches = self._index.search(self.query) if self.query else range(len(self._index))
+
+    def remove(self, doc_id):
+        del self._headers[doc_id]
+        self._index.remove(doc_id)
+        self._search()
+        self.move_to(self.selected)
+
+    def update(self, header):
+        # After an edit, which may have changed the title.
+        self._headers[header.id] = header
+        self._index.add(header.title, header.id)
+        self._search()
+        self.move_to(self._index.position(header.id) if not self.query else self.selected)
+
+    def filter(self, query):
+        doc_id = self.current()
+        self.query = query
+        self._search()
+        if query or doc_id is None:
+            self.move_to(0)
+        else:
+            # Clearing the filter stays on the document that was selected.
+            self.move_to(self._index.position(doc_id))
+
+    def move_to(self, position):
+        self.selected = max(0, min(position, len(self._matches) - 1))
+        if self.selected < self._top:
+            self._top = self.selected
+        elif self.selected >= self._top + self.page_size:
+            self._top = self.selected - self.page_size + 1
+
+    def move(self, steps):
+        self.move_to(self.selected + steps)
+
+    def label(self, doc_id):
+        header = self._headers[doc_id]
+        return f"{header.title} Type: {header.type_name}"
+
+    def page(self):
+        # (doc_id, selected) for the entries on screen.
+        end = min(self._top + self.page_size, len(self._matches))
+        return [(self._index[self._matches[position]], position == self.selected)
+                for position in range(self._top, end)]
+
+    def draw(self):
+        # Redraws the filter line and the page below the heading in place.
+        write = self._stream.write
+        line = len(self._heading) + 1
+        write(f"\033[{line};1H{CLEAR}Filter: {self.query}  "
+              f"({self.selected + 1 if self._matches else 0} of {len(self._matches)})")
+        entries = self.page()
+        for offset in range(self.page_size):
+            write(f"\033[{line + 1 + offset};1H{CLEAR}")
+            if offset < len(entries):
+                doc_id, selected = entries[offset]
+                label = self.label(doc_id)
+                write(f"{HIGHLIGHT}> {label}{RESET}" if selected else f"  {label}")
+        write(f"\033[{line + 1 + self.page_size};1H{CLEAR}{HINT}")
+        self._stream.flush()
+
+    def redraw(self):
+        clear_console()
+        for text in self._heading:
+            self._stream.write(text + "\n")
+        self.draw()
+
+    def run(self, on_enter):
+        def step(action):
+            def handler():
+                action()
+                self.draw()
+            return handler
+
+        def enter():
+            doc_id = self.current()
+            if doc_id is None:
+                return False
+            if on_enter(doc_id):
+                return True
+            if not self._headers:
+                return True
+            self.redraw()
+
+        def typed(key):
+            if key == "space":
+                key = " "
+            if len(key) == 1:
+                self.filter(self.query + key)
+                self.draw()
+
+        handlers = {
+            "up": step(lambda: self.move(-1)),
+            "down": step(lambda: self.move(1)),
+            "left": step(lambda: self.move(-1)),
+            "right": step(lambda: self.move(1)),
+            "page up": step(lambda: self.move(-self.page_size)),
+            "page down": step(lambda: self.move(self.page_size)),
+            "home": step(lambda: self.move_to(0)),
+            "end": step(lambda: self.move_to(len(self._matches) - 1)),
+            "backspace": step(lambda: self.filter(self.query[:-1])),
+            "enter": enter,
+            "esc": lambda: True,
+        }
+        self.redraw()
+        keys.dispatch(handlers, default=typed)
+        self._stream.write(f"\033[{len(self._heading) + self.page_size + 3};1H\n")
+        self._stream.flush()
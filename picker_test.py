@@ -0,0 +1,68 @@
+import io
+
+import keys
+from picker import Picker, TitleIndex
+from storage import DocumentHeader
+
+
+def headers(count):
+    return [DocumentHeader(f"id{n}", "Email", f"Report {n:05d}", "Ann", 0, 0)
+            for n in range(count)]
+
+
+def test_title_index_prefix_and_fuzzy():
+    index = TitleIndex([("Budget", "b"), ("budget 2025", "c"), ("Agenda", "a"), ("Minutes", "m")])
+    assert [index[p] for p in index.prefix("BUD")] == ["b", "c"]
+    assert [index[p] for p in index.search("mnts")] == ["m"]
+    assert index.search("zzz") == []
+    index.add("Zebra", "c")
+    assert [index[p] for p in index.prefix("bud")] == ["b"]
+    index.remove("b")
+    assert [index[p] for p in range(len(index))] == ["a", "m", "c"]
+
+
+def test_any_document_is_a_few_keys_away(monkeypatch):
+    monkeypatch.setattr("auxilliary_functions.os.system", lambda command: 0)
+    out = io.StringIO()
+    picker = Picker(headers(50000), ["Choose a document."], page_size=10, stream=out)
+    chosen = []
+
+    def enter(doc_id):
+        chosen.append(doc_id)
+        return True
+
+    script = ["page down", "page down", "down", "enter"]
+    previous = keys.use(keys.ScriptedKeySource(script))
+    try:
+        picker.run(enter)
+        assert chosen == ["id21"]
+
+        # Typing jumps straight to the matching titles
+        chosen.clear()
+        picker.filter("")
+        keys.use(keys.ScriptedKeySource(list("report") + ["space"] + list("42137") + ["enter"]))
+        picker.run(enter)
+        assert chosen == ["id42137"]
+    finally:
+        keys.use(previous)
+
+    # Every draw writes one page, however long the list is
+    out.seek(0)
+    out.truncate()
+    picker.filter("")
+    picker.move_to(len(picker) - 1)
+    picker.draw()
+    assert out.getvalue().count("Report ") == 10
+    assert "> Report 49999" in out.getvalue()
+
+    # Clearing the filter keeps the selection; removing moves on to the next
+    picker.filter("rep 49998")
+    assert picker.current() == "id49998"
+    picker.filter("")
+    assert picker.current() == "id49998"
+    picker.remove("id49998")
+    assert picker.current() == "id49999" and len(picker) == 49999
+
+
+if __name__ == "__main__":
+    test_title_index_prefix_and_fuzzy()
@@ -0,0 +1,89 @@
+from storage import DocumentHeader
+
+
+# Ordered, id-keyed collection of documents. Upserts, lookups and deletes by
+# id are dict operations; positional access (used by the arrow-key pickers)
+# goes through a list of ids that is only rebuilt after a removal.
+#
+# Entries may be DocumentHeaders instead of documents. Those are loaded from
+# the store the first time the document itself is asked for, and release()
+# turns a document that is no longer needed back into its header.
+class DocumentRegistry:
+
+    def __init__(self, documents=(), store=None):
+        self._documents = {}
+        self._order = []
+        self._store = store
+        for document in documents:
+            self.put(document)
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __iter__(self):
+        return iter([self._load(doc_id) for doc_id in list(self._documents)])
+
+    def __contains__(self, item):
+        doc_id = item if isinstance(item, str) else getattr(item, "id", None)
+        return doc_id in self._documents
+
+    def __getitem__(self, index):
+        return self._load(self._ids()[index])
+
+    def __repr__(self):
+        return f"DocumentRegistry({list(self._documents.values())!r})"
+
+    def _ids(self):
+        if self._order is None:
+            self._order = list(self._documents)
+        return self._order
+
+    def _load(self, doc_id):
+        document = self._documents[doc_id]
+        if isinstance(document, DocumentHeader):
+            document = self._store.read(doc_id)
+            document.opened()
+            self._documents[doc_id] = document
+        return document
+
+    def header(self, index):
+        # Either a DocumentHeader or the loaded document; both have id,
+        # title, author and type_name.
+        return self._documents[self._ids()[index]]
+
+    def ids(self):
+        return list(self._documents)
+
+    def header_for(self, doc_id):
+        return self._documents[doc_id]
+
+    def get(self, doc_id, default=None):
+        if doc_id not in self._documents:
+            return default
+        return self._load(doc_id)
+
+    def put(self, document):
+        if document.id not in self._documents and self._order is not None:
+            self._order.append(document.id)
+        self._documents[document.id] = document
+
+    append = put
+
+    def release(self, doc_id):
+        if self._store is not None and doc_id in self._store:
+            self._documents[doc_id] = self._store.header(doc_id)
+
+    def remove(self, doc_id):
+        document = self._documents.pop(doc_id)
+        self._order = None
+        return document
+
+    def pop(self, index=-1):
+        order = self._ids()
+        document = self._documents.pop(order[index])
+        del order[index]
+        return document
+
+    def clear(self):
+        self._documents.clear()
+        self._order = []
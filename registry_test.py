@@ -0,0 +1,31 @@
+from document import Email
+from registry import DocumentRegistry
+
+
+def test_registry_upsert_lookup_and_positional_access():
+    docs = [Email(f"Email {i}", "Codyaxe") for i in range(5)]
+    registry = DocumentRegistry(docs)
+
+    # Saving an existing document replaces it in place
+    docs[2].title = "Edited"
+    registry.put(docs[2])
+    assert len(registry) == 5
+    assert registry[2].title == "Edited"
+    assert registry.get(docs[4].id) is docs[4]
+
+    # Documents are hashable by id
+    assert len({docs[0], registry[0]}) == 1
+
+    removed = registry.pop(1)
+    assert removed is docs[1]
+    assert docs[1] not in registry
+    assert [doc.title for doc in registry] == ["Email 0", "Edited", "Email 3", "Email 4"]
+
+    registry.remove(docs[3].id)
+    registry.put(Email("Late", "Codyaxe"))
+    assert [doc.title for doc in registry] == ["Email 0", "Edited", "Email 4", "Late"]
+    assert registry[-1].title == "Late"
+
+
+if __name__ == "__main__":
+    test_registry_upsert_lookup_and_positional_access()
@@ -0,0 +1,65 @@
+import pickle
+
+import document
+import keys
+from document import Document, Email, Letter, Slideshow, Spreadsheet
+
+
+def test_render_is_cached_until_the_document_changes():
+    email = Email("Invoice", "Codyaxe", "cody@mail.com", "bob@corp.com", "Please pay", "Payment", "Bob")
+    rendered = email.render()
+    assert "Subject: Payment" in rendered and rendered.endswith("Codyaxe\n")
+    assert email.render() is rendered
+
+    email.title = "Reminder"
+    assert "Reminder" in email.render()
+    email._subject = "Overdue"
+    email.changed()
+    assert "Subject: Overdue" in email.render()
+
+    # Cell edits bypass the document's setters but still invalidate it
+    sheet = Spreadsheet("Budget", "Codyaxe", "", rows=2, cols=2)
+    sheet.table[0][0] = "5"
+    sheet.table[1][0] = "=A1*2"
+    assert "|10        |" in sheet.render()
+    sheet.table[0][0] = "7"
+    assert "|14        |" in sheet.render()
+
+    deck = Slideshow("Deck", "Codyaxe", "Intro", 1)
+    letter = Letter("Thanks", "Codyaxe", "Here", "There", "Thank you", "Gratitude", "Aleckxa", True)
+    for doc in (deck, letter, sheet):
+        doc.render()
+        loaded = pickle.loads(pickle.dumps(doc))
+        assert loaded._rendered is None
+        assert loaded.render() == doc.render()
+
+
+def test_reading_an_unchanged_document_again_skips_the_store(store, monkeypatch, capsys):
+    monkeypatch.setattr(document, "_recent_renders", type(document._recent_renders)())
+    email = Email("Invoice", "Codyaxe", "cody@mail.com", "bob@corp.com", "Please pay", "Payment", "Bob")
+    email.persist()
+    Document.saved_documents.release(email.id)
+
+    reads = []
+    read = store.read
+    monkeypatch.setattr(store, "read", lambda doc_id: reads.append(doc_id) or read(doc_id))
+    previous = keys.use(keys.ScriptedKeySource(["esc"] * 4))
+    try:
+        for _ in range(3):
+            document.show_document(email.id)
+        assert reads == [email.id]
+        assert capsys.readouterr().out == (email.render() + "Press 'esc' to exit.\n") * 3
+
+        # A new revision is rendered again
+        changed = Document.saved_documents.get(email.id)
+        changed.text = "Please pay now"
+        changed.persist()
+        Document.saved_documents.release(email.id)
+        document.show_document(email.id)
+    finally:
+        keys.use(previous)
+    assert "Please pay now" in capsys.readouterr().out and len(reads) == 3
+
+
+if __name__ == "__main__":
+    test_render_is_cached_until_the_document_changes()
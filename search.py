@@ -0,0 +1,103 @@
+import bisect
+import os
+import pickle
+import re
+
+WORD = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return WORD.findall(str(text).lower())
+
+
+# Inverted index from lowercase words to the ids of the documents containing
+# them. Documents are indexed through their search_fields(), so a query
+# never has to load a document body. A query matches documents containing
+# every word; a word ending in * matches any word with that prefix.
+class SearchIndex:
+
+    def __init__(self):
+        self._postings = {}
+        self._words = {}
+        self._vocabulary = None
+        self.position = (0, None)
+
+    def __len__(self):
+        return len(self._words)
+
+    def add(self, document):
+        self.remove(document.id)
+        words = set()
+        for field in document.search_fields():
+            if field:
+                words.update(tokenize(field))
+        self._words[document.id] = frozenset(words)
+        for word in words:
+            postings = self._postings.get(word)
+            if postings is None:
+                self._postings[word] = {document.id}
+                self._vocabulary = None
+            else:
+                postings.add(document.id)
+
+    def remove(self, doc_id):
+        for word in self._words.pop(doc_id, ()):
+            postings = self._postings[word]
+            postings.discard(doc_id)
+            if not postings:
+                del self._postings[word]
+                self._vocabulary = None
+
+    def clear(self):
+        self._postings.clear()
+        self._words.clear()
+        self._vocabulary = None
+
+    def _matching(self, term):
+        if not term.endswith("*"):
+            return self._postings.get(term, set())
+        prefix = term[:-1]
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        matches = set()
+        i = bisect.bisect_left(self._vocabulary, prefix)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(prefix):
+            matches |= self._postings[self._vocabulary[i]]
+            i += 1
+        return matches
+
+    def search(self, query):
+        terms = [word + "*" if term.endswith("*") else word
+                 for term in query.lower().split()
+                 for word in tokenize(term)]
+        if not terms:
+            return set()
+        # Intersect starting from the rarest term.
+        postings = sorted((self._matching(term) for term in terms), key=len)
+        result = set(postings[0])
+        for other in postings[1:]:
+            result &= other
+            if not result:
+                break
+        return result
+
+    def save(self, path, position):
+        self.position = position
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"position": position, "postings": self._postings,
+                         "words": self._words}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        self.clear()
+        self.position = (0, None)
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False
+        self._postings = state["postings"]
+        self._words = state["words"]
+        self.position = state["position"]
+        return True
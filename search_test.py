@@ -0,0 +1,42 @@
+from document import Email, Letter, Slideshow, Spreadsheet
+from search import SearchIndex
+
+
+def test_search_index_covers_all_document_fields(tmp_path):
+    email = Email("Quarterly invoice", "Codyaxe", "cody@mail.com", "bob@corp.com",
+                  "Please settle the invoice", "Payment due", "Bob")
+    letter = Letter("Thanks", "Codyaxe", "Batangas City", "Alangilan", "Thank you", "Gratitude", "Aleckxa")
+    deck = Slideshow("Deck", "Codyaxe", "", 2)
+    deck.slides = ["Roadmap for the invoice system", None]
+    sheet = Spreadsheet("Inventory", "Codyaxe", "", rows=2, cols=2)
+    sheet.table[1][1] = "Widgets"
+
+    index = SearchIndex()
+    for document in (email, letter, deck, sheet):
+        index.add(document)
+
+    assert index.search("invoice") == {email.id, deck.id}
+    assert index.search("Payment bob") == {email.id}
+    assert index.search("aleckxa") == {letter.id}
+    assert index.search("widg*") == {sheet.id}
+    assert index.search("invoice gratitude") == set()
+
+    # Re-indexing replaces the old words, removal drops the document
+    email.title = "Receipt"
+    email.text = "Paid in full"
+    index.add(email)
+    assert index.search("invoice") == {deck.id}
+    index.remove(deck.id)
+    assert index.search("invoice") == set()
+
+    path = str(tmp_path / "docs.search")
+    index.save(path, (10, 1234))
+    loaded = SearchIndex()
+    assert loaded.load(path)
+    assert loaded.position == (10, 1234)
+    assert loaded.search("receipt") == {email.id}
+
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    test_search_index_covers_all_document_fields(pathlib.Path(tempfile.mkdtemp()))
@@ -0,0 +1,47 @@
+import csv
+import time
+
+
+# Spreadsheet <-> CSV in a single pass over the rows. Neither direction
+# builds the file's rows as a list, so memory stays at the size of the
+# spreadsheet itself however large the file is.
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.reader(f)
+
+
+def write_rows(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(rows)
+
+
+def _reporting(rows, progress_every, report, started):
+    for number, row in enumerate(rows, 1):
+        if progress_every and number % progress_every == 0:
+            rate = number / max(time.perf_counter() - started, 1e-9)
+            report(f"{number} rows ({rate:.0f} rows/s)")
+        yield row
+
+
+def import_csv(sheet, path, replace=True, progress_every=100000, report=print):
+    started = time.perf_counter()
+    count = sheet.import_rows(_reporting(read_rows(path), progress_every, report, started), replace)
+    elapsed = time.perf_counter() - started
+    report(f"Imported {count} rows in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} rows/s)")
+    return count
+
+
+def export_csv(sheet, path, values=False, progress_every=100000, report=print):
+    started = time.perf_counter()
+    count = 0
+
+    def rows():
+        nonlocal count
+        for count, row in enumerate(_reporting(sheet.export_rows(values), progress_every,
+                                               report, started), 1):
+            yield row
+
+    write_rows(path, rows())
+    elapsed = time.perf_counter() - started
+    report(f"Exported {count} rows in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} rows/s)")
+    return count
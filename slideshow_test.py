@@ -1,38 +1,37 @@
-from document import Slideshow, Document
-import pickle
+from document import Slideshow
+from storage import LogStore
+import keys
 import os
 
-def test_slideshow_save_and_structure():
-    # Cleanup previous save if exists
-    if os.path.exists("files/docs"):
-        os.remove("files/docs")
-
-    # Garbage Collector
-    Document.saved_documents.clear()
-
+def test_slideshow_save_and_structure(store):
     # Create a SlideShow
     ss = Slideshow("My Presentation", "Codyaxe", "Some content", 3)
 
     ss.slides = ["Hello", "BOI", None]
 
-    ss.print()
+    # Page through the slides and leave with esc
+    previous = keys.use(keys.ScriptedKeySource(["right", "right", "left", "esc"]))
+    try:
+        ss.print()
+    finally:
+        keys.use(previous)
 
     # Check size and slides
     assert ss._size == 3
     assert len(ss._slides) == 3
 
     # Call save and verify file creation
-    os.makedirs("files", exist_ok=True)
     ss.save()
-    assert os.path.exists("files/docs")
+    assert os.path.exists(store.path)
 
     # Load and verify contents
-    with open("files/docs", "rb") as f:
-        loaded_docs = pickle.load(f)
-        print(loaded_docs)
-        assert ss in loaded_docs
-        assert isinstance(loaded_docs[-1], Slideshow)
+    loaded_docs = LogStore(store.path).load()
+    print(loaded_docs)
+    assert ss in loaded_docs
+    assert isinstance(loaded_docs[-1], Slideshow)
 
     print("SlideShow test passed.")
 
-test_slideshow_save_and_structure()
\ No newline at end of file
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
@@ -0,0 +1,30 @@
+import pickle
+
+from document import Email, Letter, Slideshow, Spreadsheet
+from spreadsheet_test import Legacy
+
+
+def test_documents_have_fixed_slots_and_load_older_records():
+    letter = Letter("Thanks", "Codyaxe", "Here", "There", "Thank you", "Gratitude", "Aleckxa")
+    assert letter._date is None
+    assert "Thank you" in letter.render()
+    for document in (letter, Email("Hi", "Codyaxe"), Slideshow("Deck", "Codyaxe", "", 1),
+                     Spreadsheet("Sheet", "Codyaxe", "", rows=1, cols=1)):
+        assert not hasattr(document, "__dict__")
+        loaded = pickle.loads(pickle.dumps(document))
+        assert loaded == document and loaded.title == document.title
+
+    # Records from before the slots: plain attribute dicts, and no _version
+    old = Legacy(Email, _title="Old", _author="Codyaxe", _text="Body", _id="old-id",
+                 _s_from="a@b.c", _r_to="d@e.f", _subject="Hi", _recipient="Bob", _cc="")
+    email = pickle.loads(pickle.dumps(old))
+    assert (email.id, email.text, email._version) == ("old-id", "Body", 0)
+    assert "Subject: Hi" in email.render()
+
+    dateless = pickle.loads(pickle.dumps(Legacy(Letter, _title="Old", _author="Codyaxe",
+                                                _text="", _id="old-letter")))
+    assert dateless._date is None and dateless.to_record()["date"] is None
+
+
+if __name__ == "__main__":
+    test_documents_have_fixed_slots_and_load_older_records()
@@ -0,0 +1,181 @@
+from document import Spreadsheet
+import copyreg
+import pickle
+import pytest
+
+
+def test_spreadsheet_sparse_rectangular_table():
+    sheet = Spreadsheet("Budget", "Codyaxe", "Monthly budget", rows=3, cols=10000)
+
+    sheet.table[2][9999] = "Total"
+    sheet.table = [["Rent", "500"], None, None]
+    assert list(sheet.table[0])[:3] == ["Rent", "500", ""]
+    assert sheet.table[2][9999] == "Total"
+    assert sheet.table.populated == 3
+
+    # Clearing a cell drops it from the store
+    sheet.table[0][1] = ""
+    assert sheet.table.populated == 2
+
+    loaded = pickle.loads(pickle.dumps(sheet))
+    assert loaded.table == sheet.table
+    assert (loaded.table.rows, loaded.table.cols) == (3, 10000)
+
+
+def test_spreadsheet_record_holds_only_populated_cells():
+    sheet = Spreadsheet("Big", "Codyaxe", "", rows=3000, cols=3000)
+    sheet.table[0][0] = "5"
+    sheet.table[2999][2999] = "=A1*2"
+    record = sheet.to_record()
+    assert record["cells"] == {"A1": "5", "DKJ3000": "=A1*2"}
+    assert (record["rows"], record["cols"]) == (3000, 3000)
+
+    copy = Spreadsheet.from_record(dict(record, id=None))
+    assert copy.table == sheet.table and copy.table.value(2999, 2999) == "10"
+    copy.apply_record({"cells": {"B2": "x"}})
+    assert copy.table.populated == 1 and copy.table[1][1] == "x"
+    assert Spreadsheet.from_record({"cells": '{"C2": "7"}'}).table.rows == 2
+
+
+class Legacy:
+    # Pickles the way documents did before __slots__: the class plus a dict
+    # of attributes.
+    def __init__(self, cls, **state):
+        self.cls = cls
+        self.state = state
+
+    def __reduce__(self):
+        return copyreg._reconstructor, (self.cls, object, None), self.state
+
+
+def test_spreadsheet_loads_dense_grid_from_older_saves():
+    old = Legacy(Spreadsheet, _title="Old", _author="Codyaxe", _text="", _id="old-id",
+                 _size=2, _table=[["1", ""], ["", "2"]])
+
+    loaded = pickle.loads(pickle.dumps(old))
+    assert (loaded._rows, loaded._cols) == (2, 2)
+    assert loaded.table == [["1", ""], ["", "2"]]
+    assert loaded.table.populated == 2
+
+
+def test_spreadsheet_numeric_columns_and_aggregates():
+    sheet = Spreadsheet("Sales", "Codyaxe", "", rows=4, cols=3)
+    sheet.table = [["10", "2", ""], ["20", "3", ""], ["", "4", ""], ["30", "x", ""]]
+
+    sheet.set_column_type(0, "number")
+    assert sheet.column_type(0) == "number"
+    assert sheet.column_stat(0, "sum") == 60
+    assert sheet.column_stat(0, "mean") == 20
+    assert sheet.column_stat(0, "count") == 3
+    assert sheet.column_stat(0, "max") == 30
+
+    # Text columns are parsed on the fly, skipping non-numbers
+    assert sheet.column_stat(1, "sum") == 9
+
+    try:
+        sheet.table[0][0] = "ten"
+        assert False, "non-numeric value accepted in a numeric column"
+    except ValueError:
+        pass
+
+    sheet.combine_columns(0, "*", 1, 2)
+    assert [sheet.table[row][2] for row in range(4)] == ["20", "60", "", ""]
+    assert list(sheet.row_stats("sum")) == [30, 80, 0, 30]
+
+    sheet.set_column_type(0, "text")
+    assert sheet.table[1][0] == "20"
+
+    # combine_columns left column C a NUMBER column; a row with text for it
+    # is rejected before any cell of the row changes
+    with pytest.raises(ValueError):
+        sheet.table[1] = ["5", "6", "ten"]
+    assert list(sheet.table[1]) == ["20", "3", "60"]
+
+    # Formulas over a column are evaluated again when its type changes
+    sheet.table[0][1] = "=COUNT(A1:A4)"
+    sheet.table[2][0] = "nan"
+    assert sheet.table.value(0, 1) == "4"
+    sheet.set_column_type(0, "number")
+    assert sheet._formulas.last_recalculated == 1
+    assert sheet.table.value(0, 1) == "3"
+
+
+def test_spreadsheet_formulas_recalculate_only_dependents():
+    sheet = Spreadsheet("Totals", "Codyaxe", "", rows=5, cols=3)
+    for row in range(5):
+        sheet.table[row][0] = str(row + 1)
+    sheet.table[0][1] = "=A1*2"
+    sheet.table[1][1] = "=B1+A2"
+    sheet.table[0][2] = "=SUM(A1:A5)"
+    sheet.table[1][2] = "=C1/0"
+    assert [sheet.table.value(0, 1), sheet.table.value(1, 1)] == ["2", "4"]
+    assert sheet.table.value(0, 2) == "15"
+    assert sheet.table.value(1, 2) == "#DIV/0!"
+
+    # Editing A1 re-evaluates B1, B2, C1 and C2 and nothing else
+    sheet.table[4][0] = "100"
+    assert sheet._formulas.last_recalculated == 2
+    sheet.table[0][0] = "10"
+    assert sheet._formulas.last_recalculated == 4
+    assert [sheet.table.value(0, 1), sheet.table.value(1, 1)] == ["20", "22"]
+    assert sheet.table.value(0, 2) == "119"
+
+    sheet.table[3][2] = "=C5+1"
+    sheet.table[4][2] = "=C4+1"
+    assert sheet.table.value(3, 2) == sheet.table.value(4, 2) == "#CYCLE!"
+    sheet.table[4][2] = "1"
+    assert sheet.table.value(3, 2) == "2"
+
+    # Only the cells are stored; formulas are evaluated again on load
+    data = pickle.dumps(sheet)
+    assert b"FormulaEngine" not in data
+    loaded = pickle.loads(data)
+    assert loaded.table.value(0, 2) == "119" and loaded.table.value(3, 2) == "2"
+    loaded.table[1][0] = "0"
+    assert loaded.table.value(1, 1) == "20"
+
+
+def test_spreadsheet_csv_round_trip(tmp_path):
+    import sheet_csv
+    source = tmp_path / "in.csv"
+    source.write_text("name,qty\nbolts,4\nnuts,\"1,000\"\ntotal,=SUM(B2:B3)\n", encoding="utf-8")
+    sheet = Spreadsheet("Stock", "Codyaxe", "", rows=1, cols=1)
+    sheet.table[0][0] = "old"
+
+    messages = []
+    assert sheet_csv.import_csv(sheet, str(source), progress_every=2, report=messages.append) == 4
+    assert (sheet._rows, sheet._cols) == (4, 2)
+    assert sheet.table[2][1] == "1,000"
+    assert sheet.table.value(3, 1) == "4"
+    assert len(messages) == 3 and messages[-1].startswith("Imported 4 rows")
+
+    sheet.table[2][1] = "1000"
+    assert sheet.table.value(3, 1) == "1004"
+    sheet_csv.import_csv(sheet, str(source), replace=False, report=messages.append)
+    assert sheet._rows == 8 and sheet.table[4][0] == "name"
+
+    target = tmp_path / "out.csv"
+    assert sheet_csv.export_csv(sheet, str(target), values=True, report=messages.append) == 8
+    rows = list(sheet_csv.read_rows(str(target)))
+    assert rows[3] == ["total", "1004"] and rows[2] == ["nuts", "1000"]
+
+    # Numeric columns stay numeric, and a bad value leaves the table as it was
+    sheet = Spreadsheet("Counts", "Codyaxe", "", rows=1, cols=2)
+    sheet.set_column_type(1, "number")
+    good, bad = tmp_path / "good.csv", tmp_path / "bad.csv"
+    good.write_text("a,1\nb,2.5\n", encoding="utf-8")
+    bad.write_text("c,3\nd,x\n", encoding="utf-8")
+    sheet_csv.import_csv(sheet, str(good), report=messages.append)
+    assert sheet.column_stat(1, "sum") == 3.5
+    with pytest.raises(ValueError):
+        sheet_csv.import_csv(sheet, str(bad), replace=False, report=messages.append)
+    assert sheet.table.rows == 2 and sheet.table.populated == 4
+    assert sheet.column_values(1).shape == (2,)
+
+if __name__ == "__main__":
+    test_spreadsheet_sparse_rectangular_table()
+    test_spreadsheet_loads_dense_grid_from_older_saves()
+    test_spreadsheet_numeric_columns_and_aggregates()
+    test_spreadsheet_formulas_recalculate_only_dependents()
+    import tempfile, pathlib
+    test_spreadsheet_csv_round_trip(pathlib.Path(tempfile.mkdtemp()))
@@ -0,0 +1,396 @@
+import contextlib
+import functools
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import instrumentation
+from storage import (DELETE, PUT, DocumentHeader, StaleWriteError, check_codec, decode_blob,
+                     decode_body, encode_blob, encode_body)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    title TEXT,
+    author TEXT,
+    created REAL NOT NULL,
+    modified REAL NOT NULL,
+    codec TEXT,
+    body BLOB NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 0,
+    blobs TEXT
+);
+CREATE INDEX IF NOT EXISTS documents_type ON documents (type);
+CREATE INDEX IF NOT EXISTS documents_title ON documents (title);
+CREATE INDEX IF NOT EXISTS documents_author ON documents (author);
+CREATE INDEX IF NOT EXISTS documents_created ON documents (created);
+CREATE INDEX IF NOT EXISTS documents_modified ON documents (modified);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op INTEGER NOT NULL,
+    id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    digest BLOB PRIMARY KEY,
+    codec TEXT,
+    data BLOB NOT NULL,
+    refs INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+UPSERT = """
+INSERT INTO documents (id, type, title, author, created, modified, codec, body, blobs, revision)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+ON CONFLICT (id) DO UPDATE SET
+    type = excluded.type, title = excluded.title, author = excluded.author,
+    modified = excluded.modified, codec = excluded.codec, body = excluded.body,
+    blobs = excluded.blobs, revision = documents.revision + 1
+"""
+
+HEADER_COLUMNS = "id, type, title, author, rowid, length(body), revision"
+
+
+def _locked(method):
+    # One connection serves every thread of the process, e.g. the menu and
+    # the WriteBehind thread; their calls take turns on it.
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+
+# The same operations as LogStore, backed by one SQLite row per document.
+# Listing and filtering are indexed queries and a save rewrites one row.
+# Header offsets are rowids and lengths are body sizes.
+#
+# Every write also appends to the changes table, which is what position()
+# and changes_since() read; compact() clears it and starts a new generation.
+#
+# Several processes can share the database: writes are IMMEDIATE
+# transactions, and the revision column gives the same optimistic checks
+# as LogStore's.
+#
+# Long strings are kept once in the blobs table, like LogStore's blobs; the
+# documents that use a blob are counted in its refs column and the blobs
+# column of each document lists its digests in hex.
+class SqliteStore:
+
+    def __init__(self, path, codec="zlib", compress_min_bytes=512):
+        check_codec(codec)
+        self._path = path
+        self._codec = codec
+        self._compress_min_bytes = compress_min_bytes
+        self._connection = None
+        self._lock = threading.RLock()
+        self._headers = {}
+        self._revisions = {}
+        # The position() the headers are up to date with.
+        self._position = None
+        self._blob_cache = {}
+        self.recovered_bytes = 0
+
+    @property
+    def path(self):
+        return self._path
+
+    def __len__(self):
+        return len(self._headers)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._headers
+
+    def headers(self):
+        return list(self._headers.values())
+
+    def header(self, doc_id):
+        return self._headers[doc_id]
+
+    def revision(self, doc_id):
+        return self._revisions.get(doc_id, 0)
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self._path, timeout=60, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.execute("PRAGMA synchronous = NORMAL")
+            self._connection.executescript(SCHEMA)
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(documents)")]
+            if "revision" not in columns:
+                self._connection.execute(
+                    "ALTER TABLE documents ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+            if "blobs" not in columns:
+                self._connection.execute("ALTER TABLE documents ADD COLUMN blobs TEXT")
+            self._connection.execute(
+                "INSERT OR IGNORE INTO settings VALUES ('generation', ?)", (uuid.uuid4().hex,))
+            self._connection.commit()
+        return self._connection
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # Takes the write lock up front, so that checking a revision and
+        # writing the row cannot interleave with another process.
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+
+    def _add_headers(self, rows):
+        headers = []
+        for row in rows:
+            headers.append(DocumentHeader(*row[:6]))
+            self._headers[row[0]] = headers[-1]
+            self._revisions[row[0]] = row[6]
+        return headers
+
+    @_locked
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    @instrumentation.timed("store.load_headers")
+    @_locked
+    def load_headers(self):
+        self._headers = {}
+        self._revisions = {}
+        self._position = None
+        if not os.path.exists(self._path):
+            return []
+        # Taken first: a change made while the headers are read is read
+        # again by the next refresh().
+        self._position = self.position()
+        self._add_headers(self._connect().execute(
+            f"SELECT {HEADER_COLUMNS} FROM documents ORDER BY rowid"))
+        return self.headers()
+
+    @_locked
+    def refresh(self):
+        # Catches up with what other processes wrote since the headers were
+        # read, through the changes table: only the rows of changed
+        # documents are read again. After a compact() elsewhere, or before
+        # the first load, every header is. Returns whether anything changed.
+        if self._position is None or self._position[1] != self.position()[1]:
+            old = self._revisions
+            self.load_headers()
+            return self._revisions != old
+        changes = self._connect().execute(
+            "SELECT seq, id FROM changes WHERE seq > ? ORDER BY seq", (self._position[0],)).fetchall()
+        if not changes:
+            return False
+        self._position = (changes[-1][0], self._position[1])
+        ids = list(dict.fromkeys(doc_id for seq, doc_id in changes))
+        old = {doc_id: self._revisions.get(doc_id) for doc_id in ids}
+        found = set()
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            found.update(header.id for header in self._add_headers(self._connect().execute(
+                f"SELECT {HEADER_COLUMNS} FROM documents "
+                f"WHERE id IN ({', '.join('?' * len(chunk))}) ORDER BY rowid", chunk)))
+        for doc_id in ids:
+            if doc_id not in found:
+                self._headers.pop(doc_id, None)
+                self._revisions.pop(doc_id, None)
+        return any(self._revisions.get(doc_id) != revision for doc_id, revision in old.items())
+
+    def load(self):
+        return [self.read(header.id) for header in self.load_headers()]
+
+    @_locked
+    def query(self, type_name=None, author=None, title_prefix=None, modified_since=None):
+        # Same filters as LogStore.query(), answered from the indexes.
+        clauses, arguments = [], []
+        if type_name is not None:
+            clauses.append("type = ?")
+            arguments.append(type_name)
+        if author is not None:
+            clauses.append("author = ?")
+            arguments.append(author)
+        if title_prefix:
+            clauses.append("title >= ? AND title < ?")
+            arguments += [title_prefix, title_prefix[:-1] + chr(ord(title_prefix[-1]) + 1)]
+        if modified_since is not None:
+            clauses.append("modified >= ?")
+            arguments.append(modified_since)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        rows = self._connect().execute(
+            f"SELECT {HEADER_COLUMNS} FROM documents{where} ORDER BY rowid", arguments)
+        return [DocumentHeader(*row[:6]) for row in rows]
+
+    @_locked
+    def read(self, doc_id):
+        row = self._connect().execute(
+            "SELECT codec, body, revision FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        if row is None:
+            raise KeyError(doc_id)
+        document = decode_body(row[1], row[0], self._blob)
+        document._revision = row[2]
+        return document
+
+    def _blob(self, digest):
+        text = self._blob_cache.get(digest)
+        if text is None:
+            row = self._connect().execute(
+                "SELECT codec, data FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                return None
+            text = decode_blob(row[1], row[0])
+            if len(self._blob_cache) >= 4096:
+                self._blob_cache.clear()
+            self._blob_cache[digest] = text
+        return text
+
+    @property
+    @_locked
+    def blob_count(self):
+        return self._connect().execute("SELECT count(*) FROM blobs").fetchone()[0]
+
+    def _check_revision(self, connection, doc_id, expected):
+        row = connection.execute("SELECT revision FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        current = row[0] if row else 0
+        if expected is not None and expected != current:
+            raise StaleWriteError(doc_id, expected, current)
+
+    def _row(self, document, now, blobs):
+        # The document's row; its blobs are added to blobs.
+        used = {}
+        body, codec = encode_body(document, self._codec, self._compress_min_bytes, used)
+        blobs.update(used)
+        return (document.id, type(document).__name__, document.title, document.author,
+                now, now, codec, body, " ".join(digest.hex() for digest in used) or None)
+
+    def _store_blobs(self, connection, blobs):
+        for digest, text in blobs.items():
+            if connection.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone() is None:
+                data, codec = encode_blob(text, self._codec, self._compress_min_bytes)
+                connection.execute("INSERT INTO blobs (digest, codec, data) VALUES (?, ?, ?)",
+                                   (digest, codec, data))
+
+    def _reference(self, connection, doc_id, digests):
+        # Moves doc_id's references from the blobs it has stored to digests
+        # (the blobs column format, None when it is removed). Blobs left
+        # without references are freed by _free_blobs().
+        row = connection.execute("SELECT blobs FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        changes = [(1, bytes.fromhex(digest)) for digest in (digests or "").split()]
+        changes += [(-1, bytes.fromhex(digest)) for digest in ((row[0] or "").split() if row else ())]
+        connection.executemany("UPDATE blobs SET refs = refs + ? WHERE digest = ?", changes)
+
+    def _free_blobs(self, connection):
+        connection.execute("DELETE FROM blobs WHERE refs <= 0")
+
+    def _write(self, rows, expected=None, blobs=None):
+        with self._transaction() as connection:
+            if expected is not None:
+                self._check_revision(connection, rows[0][0], expected)
+            self._store_blobs(connection, blobs or {})
+            for row in rows:
+                self._reference(connection, row[0], row[8])
+                connection.execute(UPSERT, row)
+            self._free_blobs(connection)
+            connection.executemany("INSERT INTO changes (op, id) VALUES (?, ?)",
+                                   [(PUT, row[0]) for row in rows])
+            written = []
+            for start in range(0, len(rows), 500):
+                ids = [row[0] for row in rows[start:start + 500]]
+                written += connection.execute(
+                    f"SELECT {HEADER_COLUMNS} FROM documents "
+                    f"WHERE id IN ({', '.join('?' * len(ids))})", ids).fetchall()
+        return self._add_headers(written)
+
+    @_locked
+    def put(self, document, expected=None):
+        # Same contract as LogStore.put(): returns the new revision.
+        blobs = {}
+        self._write([self._row(document, time.time(), blobs)], expected, blobs)
+        document._revision = self._revisions[document.id]
+        return document._revision
+
+    @_locked
+    def put_many(self, documents):
+        # One transaction for the whole batch.
+        now = time.time()
+        blobs = {}
+        rows = [self._row(document, now, blobs) for document in documents]
+        if not rows:
+            return []
+        headers = {header.id: header for header in self._write(rows, blobs=blobs)}
+        return [headers[row[0]] for row in rows]
+
+    @instrumentation.timed("store.delete")
+    @_locked
+    def delete(self, document_id, expected=None):
+        with self._transaction() as connection:
+            self._check_revision(connection, document_id, expected)
+            self._reference(connection, document_id, None)
+            self._free_blobs(connection)
+            if connection.execute("DELETE FROM documents WHERE id = ?", (document_id,)).rowcount:
+                connection.execute("INSERT INTO changes (op, id) VALUES (?, ?)",
+                                   (DELETE, document_id))
+        self._headers.pop(document_id, None)
+        self._revisions.pop(document_id, None)
+
+    @instrumentation.timed("store.rewrite")
+    @_locked
+    def compact(self, recode=False):
+        with self._transaction() as connection:
+            if recode:
+                for header in self.headers():
+                    blobs = {}
+                    row = self._row(self.read(header.id), None, blobs)
+                    self._store_blobs(connection, blobs)
+                    self._reference(connection, header.id, row[8])
+                    connection.execute(
+                        "UPDATE documents SET codec = ?, body = ?, blobs = ? WHERE id = ?",
+                        (row[6], row[7], row[8], header.id))
+                self._free_blobs(connection)
+                for digest, codec, data in connection.execute(
+                        "SELECT digest, codec, data FROM blobs").fetchall():
+                    data, codec = encode_blob(decode_blob(data, codec), self._codec,
+                                              self._compress_min_bytes)
+                    connection.execute("UPDATE blobs SET codec = ?, data = ? WHERE digest = ?",
+                                       (codec, data, digest))
+            connection.execute("DELETE FROM changes")
+            connection.execute("UPDATE settings SET value = ? WHERE name = 'generation'",
+                               (uuid.uuid4().hex,))
+        connection.execute("VACUUM")
+        self.load_headers()
+
+    @_locked
+    def position(self):
+        # Marks the latest change for changes_since().
+        connection = self._connect()
+        seq = connection.execute("SELECT max(seq) FROM changes").fetchone()[0] or 0
+        generation = connection.execute(
+            "SELECT value FROM settings WHERE name = 'generation'").fetchone()[0]
+        return seq, generation
+
+    @_locked
+    def changes_since(self, position):
+        # (op, doc_id) for each change after position, or None when the
+        # position is from another generation, i.e. from before compact()
+        # cleared the changes, or from no store at all.
+        seq, generation = position
+        if generation != self.position()[1]:
+            return None
+        return list(self._connect().execute(
+            "SELECT op, id FROM changes WHERE seq > ? ORDER BY seq", (seq,)))
+
+    @_locked
+    def checkpoint(self):
+        if self._connection is not None:
+            self._connection.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def maybe_checkpoint(self, min_tail_bytes=1 << 20):
+        # SQLite checkpoints its write-ahead log by itself.
+        pass
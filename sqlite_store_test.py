@@ -0,0 +1,71 @@
+from document import Email, Letter, Slideshow
+from sqlite_store import SqliteStore
+from storage import DELETE, PUT, open_store
+
+
+def test_sqlite_store_matches_log_store_operations(tmp_path):
+    path = str(tmp_path / "docs.db")
+    store = open_store(path)
+    assert isinstance(store, SqliteStore)
+    assert store.load_headers() == []
+
+    email = Email("Budget", "Ann", "a@b.c", "d@e.f", "Quarterly numbers " * 100, "Review", "Team")
+    letter = Letter("Thanks", "Bo", "Here", "There", "Thank you", "Gratitude", "Aleckxa", True)
+    deck = Slideshow("Budget deck", "Ann", "", 2)
+    store.put(email)
+    start = store.position()
+    assert store.put_many([letter, deck])[1].title == "Budget deck"
+
+    email.title = "Budget 2"
+    store.put(email)
+    assert store.changes_since(start) == [(PUT, letter.id), (PUT, deck.id), (PUT, email.id)]
+
+    reopened = SqliteStore(path)
+    assert [header.title for header in reopened.load_headers()] == ["Budget 2", "Thanks", "Budget deck"]
+    assert reopened.read(email.id).text == email.text
+    assert reopened.read(letter.id)._date == letter._date
+    assert [h.id for h in reopened.query(author="Ann")] == [email.id, deck.id]
+    assert [h.id for h in reopened.query(type_name="Slideshow", title_prefix="Bud")] == [deck.id]
+    assert [h.id for h in reopened.query(title_prefix="Budget ")] == [email.id, deck.id]
+
+    position = reopened.position()
+    reopened.delete(letter.id)
+    assert letter.id not in reopened
+    assert reopened.changes_since(position) == [(DELETE, letter.id)]
+
+    reopened.compact(recode=True)
+    assert reopened.changes_since(position) is None
+    assert [doc.title for doc in SqliteStore(path).load()] == ["Budget 2", "Budget deck"]
+
+
+def test_sqlite_refresh_reads_only_changed_rows(tmp_path, monkeypatch):
+    path = str(tmp_path / "docs.db")
+    mine, theirs = SqliteStore(path), SqliteStore(path)
+    emails = [Email(f"Report {n}", "Ann", "a@b.c", "d@e.f", "", "", "") for n in range(5)]
+    theirs.put_many(emails)
+    mine.load_headers()
+    assert not mine.refresh()
+
+    emails[1].title = "Renamed"
+    theirs.put(emails[1])
+    theirs.delete(emails[3].id)
+    added = Email("New", "Ann", "a@b.c", "d@e.f", "", "", "")
+    theirs.put(added)
+    reloads = []
+    load_headers = mine.load_headers
+    monkeypatch.setattr(mine, "load_headers", lambda: reloads.append(1) or load_headers())
+    assert mine.refresh() and not reloads
+    assert [header.title for header in mine.headers()] == ["Report 0", "Renamed", "Report 2",
+                                                           "Report 4", "New"]
+    assert mine.revision(emails[1].id) == 2 and emails[3].id not in mine
+
+    # After a compact() elsewhere the changes are gone; everything is read
+    theirs.compact()
+    theirs.delete(emails[0].id)
+    assert mine.refresh() and reloads == [1]
+    assert emails[0].id not in mine and len(mine) == 4
+
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    test_sqlite_store_matches_log_store_operations(pathlib.Path(tempfile.mkdtemp()))
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+import time
+
+from document import Email
+from storage import LogStore
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Generous enough for a slow CI machine; a start that loads every document
+# or imports the interactive dependencies up front is well over these.
+STARTUP_BUDGET_COLD = 2.0
+STARTUP_BUDGET_WARM = 1.0
+
+# Only needed once the matching feature is used.
+DEFERRED_MODULES = ("keyboard", "difflib", "platform", "shutil", "hashlib", "sqlite3",
+                    "json", "random", "textwrap", "uuid", "datetime")
+
+
+def python(*args):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, *args], cwd=HERE, capture_output=True,
+                            text=True, check=True)
+    return result.stdout, time.perf_counter() - started
+
+
+def test_importing_document_skips_optional_modules():
+    modules = ",".join(repr(name) for name in DEFERRED_MODULES)
+    out, _ = python("-c", f"import sys, document; print([m for m in ({modules}) if m in sys.modules])")
+    assert out.strip() == "[]"
+
+
+def test_listing_starts_within_budget(tmp_path):
+    path = str(tmp_path / "docs")
+    store = LogStore(path)
+    store.put_many([Email(f"Report {n}", "Ann", "a@b.c", "d@e.f", "text " * 40, "Subject", "Bob")
+                    for n in range(2000)])
+
+    # Cold: no checkpoint, every header is scanned from the log
+    out, cold = python("document.py", "--store", path, "list", "--title", "Report 1999")
+    assert '"Report 1999"' in out
+    assert cold < STARTUP_BUDGET_COLD
+
+    store.checkpoint()
+    out, warm = python("document.py", "--store", path, "list", "--title", "Report 1999")
+    assert '"Report 1999"' in out
+    assert warm < STARTUP_BUDGET_WARM
+
+
+if __name__ == "__main__":
+    test_importing_document_skips_optional_modules()
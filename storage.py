@@ -0,0 +1,758 @@
+import instrumentation
+import io
+import mmap
+import os
+import pickle
+import struct
+import zlib
+from collections import ChainMap, namedtuple
+
+from locking import FileLock
+
+MAGIC = b"DOCLOG1\n"
+
+PUT = 1
+DELETE = 2
+BLOB = 3
+
+# op, metadata length, body length, crc32 of metadata + body
+FRAME = struct.Struct("<BIII")
+
+# Strings at least this long (document text, slides, long cells) are stored
+# once per store as content-addressed blobs instead of inside every record
+# that contains them. Shorter ones cost more in references than they save.
+BLOB_MIN_LENGTH = 512
+
+# Codecs for compressed record bodies; a record names its codec in its
+# metadata, so records with different codecs (or none) can share a log.
+CODECS = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "lzma": (lambda data: _lzma().compress(data), lambda data: _lzma().decompress(data)),
+}
+
+
+def _lzma():
+    import lzma
+    return lzma
+
+
+def check_codec(codec):
+    if codec is not None and codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec!r}, expected one of {', '.join(CODECS)}.")
+
+
+def compression_options(codec=None, compress_min_bytes=None):
+    # codec and compress_min_bytes for stores and their history, taken from
+    # the arguments or else from DOCUMENT_MANAGER_CODEC ("zlib", "lzma" or
+    # "none") and DOCUMENT_MANAGER_COMPRESS_MIN_BYTES. Left out when neither
+    # gives one, so the defaults apply.
+    options = {}
+    codec = codec or os.environ.get("DOCUMENT_MANAGER_CODEC")
+    if codec:
+        options["codec"] = None if codec.lower() == "none" else codec.lower()
+        check_codec(options["codec"])
+    if compress_min_bytes is None:
+        compress_min_bytes = os.environ.get("DOCUMENT_MANAGER_COMPRESS_MIN_BYTES")
+    if compress_min_bytes not in (None, ""):
+        try:
+            options["compress_min_bytes"] = int(compress_min_bytes)
+        except ValueError:
+            raise ValueError(f"compress_min_bytes must be a whole number, got {compress_min_bytes!r}.") from None
+    return options
+
+
+def open_store(path, **options):
+    # Paths ending in .db, .sqlite or .sqlite3 get the SQLite backend, any
+    # other path the append-only log.
+    if path.endswith((".db", ".sqlite", ".sqlite3")):
+        from sqlite_store import SqliteStore
+        return SqliteStore(path, **options)
+    return LogStore(path, **options)
+
+
+# Everything the pickers need to list a document without loading its body.
+# offset and length locate the document's record in the log.
+DocumentHeader = namedtuple(
+    "DocumentHeader", "id type_name title author offset length")
+
+
+def blob_digest(text):
+    # 128 bits of SHA-256; digests are repeated in every record using them.
+    import hashlib
+    return hashlib.sha256(text.encode("utf-8", "surrogatepass")).digest()[:16]
+
+
+class _BlobPickler(pickle.Pickler):
+    # Pickles long strings as references to blobs, collected in blobs.
+
+    def __init__(self, file, blobs):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._blobs = blobs
+
+    def persistent_id(self, obj):
+        if type(obj) is str and len(obj) >= BLOB_MIN_LENGTH:
+            digest = blob_digest(obj)
+            self._blobs[digest] = obj
+            return digest
+        return None
+
+
+class _DocumentUnpickler(pickle.Unpickler):
+
+    def find_class(self, module, name):
+        # Documents saved while document.py ran as a script were pickled as
+        # __main__.Email and so on.
+        if module == "__main__":
+            module = "document"
+        return super().find_class(module, name)
+
+
+class _BlobUnpickler(_DocumentUnpickler):
+
+    def __init__(self, file, blob):
+        super().__init__(file)
+        self._blob = blob
+
+    def persistent_load(self, digest):
+        text = self._blob(digest)
+        if text is None:
+            raise pickle.UnpicklingError(f"Blob {digest.hex()} is missing.")
+        return text
+
+
+@instrumentation.timed("pickle.dump")
+def dump_document(document, blobs=None):
+    # With a blobs dict, long strings are left out of the pickle and added
+    # to blobs by digest instead.
+    if blobs is None:
+        return pickle.dumps(document, protocol=pickle.HIGHEST_PROTOCOL)
+    data = io.BytesIO()
+    _BlobPickler(data, blobs).dump(document)
+    return data.getvalue()
+
+
+@instrumentation.timed("pickle.load")
+def load_document(data, blob=None):
+    # blob(digest) returns the text of a blob the pickle refers to.
+    if blob is None:
+        return _DocumentUnpickler(io.BytesIO(data)).load()
+    return _BlobUnpickler(io.BytesIO(data), blob).load()
+
+
+def compress(data, codec=None, compress_min_bytes=512):
+    # data compressed if that makes it smaller, and the codec actually used.
+    if codec is not None and len(data) >= compress_min_bytes:
+        packed = CODECS[codec][0](data)
+        if len(packed) < len(data):
+            return packed, codec
+    return data, None
+
+
+def decompress(data, codec=None):
+    return CODECS[codec][1](data) if codec is not None else data
+
+
+def encode_body(document, codec=None, compress_min_bytes=512, blobs=None):
+    # The pickled document, compressed if that makes it smaller. Returns the
+    # body and the codec actually used (None for plain pickle).
+    return compress(dump_document(document, blobs), codec, compress_min_bytes)
+
+
+def decode_body(body, codec=None, blob=None):
+    return load_document(decompress(body, codec), blob)
+
+
+def encode_blob(text, codec=None, compress_min_bytes=512):
+    return compress(text.encode("utf-8", "surrogatepass"), codec, compress_min_bytes)
+
+
+def decode_blob(data, codec=None):
+    return bytes(decompress(data, codec)).decode("utf-8", "surrogatepass")
+
+
+class StaleWriteError(Exception):
+    # Raised for a write based on an older revision of a document than the
+    # stored one, i.e. another session saved it in the meantime.
+
+    def __init__(self, doc_id, expected, current):
+        super().__init__(f"Document {doc_id!r} is at revision {current}, not {expected}.")
+        self.doc_id = doc_id
+        self.expected = expected
+        self.current = current
+
+
+def document_meta(document):
+    return {
+        "id": document.id,
+        "type": type(document).__name__,
+        "title": document.title,
+        "author": document.author,
+    }
+
+
+# Every save appends one record and every removal appends a delete marker,
+# so a write costs as much as the document being written. Superseded records
+# are dropped by compact() once they make up enough of the file.
+#
+# Only the small metadata part of each record is read at startup, and
+# <path>.idx checkpoints those headers so that only records appended since
+# the last checkpoint have to be scanned. Bodies are unpickled from a memory
+# map when a document is actually opened.
+#
+# Bodies of at least compress_min_bytes are compressed one record at a time
+# with codec ("zlib", "lzma" or None), so opening a document still only
+# decodes that document.
+#
+# Several processes can share one log. Writers take an exclusive lock on
+# <path>.lock and first catch up with whatever the others appended (or
+# reload, if one of them compacted). Every record carries the document's
+# revision; a write may name the revision it expects to replace and fails
+# with StaleWriteError if the stored one has moved on. Reads take no lock.
+#
+# Long strings inside documents are written once as BLOB records keyed by
+# their SHA-256 and shared by every record that contains them; a document
+# record lists the blobs it uses in its metadata. Blobs are reference
+# counted, and one no document uses any more is dead space for compact().
+class LogStore:
+
+    def __init__(self, path, compact_ratio=0.5, compact_min_bytes=1 << 20,
+                 codec="zlib", compress_min_bytes=512):
+        check_codec(codec)
+        self._path = path
+        self._index_path = path + ".idx"
+        self._compact_ratio = compact_ratio
+        self._compact_min_bytes = compact_min_bytes
+        self._codec = codec
+        self._compress_min_bytes = compress_min_bytes
+        self._headers = {}
+        self._end = 0
+        self._dead_bytes = 0
+        self._map = None
+        self._checkpoint_end = 0
+        self._revisions = {}
+        self._identity = None
+        self._blobs = {}
+        self._blob_refs = {}
+        self._doc_blobs = {}
+        self._blob_cache = {}
+        self._lock = FileLock(path + ".lock")
+        self.recovered_bytes = 0
+
+    @property
+    def path(self):
+        return self._path
+
+    def __len__(self):
+        return len(self._headers)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._headers
+
+    def headers(self):
+        return list(self._headers.values())
+
+    def header(self, doc_id):
+        return self._headers[doc_id]
+
+    def revision(self, doc_id):
+        # 0 for documents that were never stored.
+        return self._revisions.get(doc_id, 0)
+
+    def query(self, type_name=None, author=None, title_prefix=None):
+        # Headers matching every given filter, in store order.
+        with self._lock.threads:
+            return [header for header in self._headers.values()
+                    if (type_name is None or header.type_name == type_name)
+                    and (author is None or header.author == author)
+                    and (title_prefix is None or (header.title or "").startswith(title_prefix))]
+
+    def _reset(self):
+        self._close_map()
+        self._headers = {}
+        self._end = 0
+        self._dead_bytes = 0
+        self._checkpoint_end = 0
+        self._revisions = {}
+        self._identity = None
+        self._blobs = {}
+        self._blob_refs = {}
+        self._doc_blobs = {}
+
+    def _file_identity(self):
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            return None
+        return stat.st_dev, stat.st_ino
+
+    @instrumentation.timed("store.load_headers")
+    def load_headers(self):
+        # Under the lock, so that a record another process is still writing
+        # is not mistaken for a torn tail.
+        with self._lock:
+            self._reset()
+            self.recovered_bytes = 0
+            if not os.path.exists(self._path):
+                return []
+
+            with open(self._path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    f.seek(0)
+                    self._migrate(f.read())
+                    return self.headers()
+
+            self._scan(self._load_index())
+            self._identity = self._file_identity()
+            return self.headers()
+
+    def refresh(self):
+        # Catches up with records other processes appended since this store
+        # last looked, or reloads if the log was rewritten underneath it.
+        # Returns whether anything changed.
+        with self._lock:
+            identity = self._file_identity()
+            if identity is None:
+                changed = bool(self._headers)
+                if self._end:
+                    self._reset()
+                return changed
+            if identity != self._identity or os.path.getsize(self._path) < self._end:
+                self.load_headers()
+                return True
+            if os.path.getsize(self._path) > self._end:
+                self._scan(self._end)
+                return True
+            return False
+
+    def load(self):
+        return [self.read(header.id) for header in self.load_headers()]
+
+    def _tail_crc(self, end):
+        with open(self._path, "rb") as f:
+            f.seek(max(end - 64, 0))
+            tail = f.read(end - max(end - 64, 0))
+        if len(tail) != min(end, 64):
+            return None
+        return zlib.crc32(tail)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, "rb") as f:
+                index = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return len(MAGIC)
+
+        # The checkpoint is only trusted if the log still ends the same way
+        # it did when the checkpoint was written. Checkpoints from before
+        # revisions existed are rebuilt from the log.
+        if self._tail_crc(index["end"]) != index["end_crc"] or "revisions" not in index:
+            return len(MAGIC)
+
+        self._headers = {row[0]: DocumentHeader(*row) for row in index["headers"]}
+        self._revisions = index["revisions"]
+        self._blobs = index.get("blobs", {})
+        self._doc_blobs = index.get("doc_blobs", {})
+        self._count_blob_refs()
+        self._dead_bytes = index["dead"]
+        self._checkpoint_end = index["end"]
+        return index["end"]
+
+    def _scan(self, offset):
+        size = os.path.getsize(self._path)
+        if offset < size:
+            with open(self._path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    offset = self._scan_records(data, offset, size)
+            # Blobs of a save that never finished.
+            for digest in [digest for digest in self._blobs if digest not in self._blob_refs]:
+                self._dead_bytes += self._blobs.pop(digest)[1]
+
+        if offset < size:
+            # A torn write at the tail, e.g. the process died mid-save.
+            self.recovered_bytes = size - offset
+            with open(self._path, "r+b") as f:
+                f.truncate(offset)
+        self._end = offset
+
+    def _records(self, data, offset, size):
+        # Yields (op, meta, start, end) for every intact record from offset.
+        while offset + FRAME.size <= size:
+            op, meta_len, body_len, crc = FRAME.unpack_from(data, offset)
+            start = offset + FRAME.size
+            end = start + meta_len + body_len
+            if op not in (PUT, DELETE, BLOB) or end > size:
+                return
+            if zlib.crc32(data[start:end]) != crc:
+                return
+            meta = pickle.loads(data[start:start + meta_len])
+            if op == PUT and "type" not in meta:
+                meta = document_meta(load_document(data[start + meta_len:end]))
+            yield op, meta, offset, end
+            offset = end
+
+    def _scan_records(self, data, offset, size):
+        for op, meta, start, end in self._records(data, offset, size):
+            self._apply(op, meta, start, end - start)
+            offset = end
+        return offset
+
+    def _apply(self, op, meta, offset, length):
+        # Updates headers, revisions, blob references and dead space for a
+        # record that is on disk at offset.
+        if op == BLOB:
+            self._blobs[meta["digest"]] = (offset, length)
+            return
+        doc_id = meta["id"]
+        old = self._headers.get(doc_id)
+        if old is not None:
+            self._dead_bytes += old.length
+        released = self._doc_blobs.pop(doc_id, ())
+        if op == PUT:
+            self._headers[doc_id] = DocumentHeader(
+                doc_id, meta["type"], meta["title"], meta["author"], offset, length)
+            self._revisions[doc_id] = meta.get("revision", 0)
+            blobs = tuple(meta.get("blobs", ()))
+            if blobs:
+                self._doc_blobs[doc_id] = blobs
+            for digest in blobs:
+                self._blob_refs[digest] = self._blob_refs.get(digest, 0) + 1
+        else:
+            self._headers.pop(doc_id, None)
+            self._revisions.pop(doc_id, None)
+            self._dead_bytes += length
+        # Only after the new references, so blobs kept by a save stay.
+        for digest in released:
+            self._blob_refs[digest] -= 1
+            if not self._blob_refs[digest]:
+                del self._blob_refs[digest]
+                if digest in self._blobs:
+                    self._dead_bytes += self._blobs.pop(digest)[1]
+
+    def _count_blob_refs(self):
+        self._blob_refs = {}
+        for digests in self._doc_blobs.values():
+            for digest in digests:
+                self._blob_refs[digest] = self._blob_refs.get(digest, 0) + 1
+
+    @property
+    def blob_count(self):
+        return len(self._blobs)
+
+    def _migrate(self, data):
+        # Stores written before the log format are a single pickled list.
+        documents = load_document(data) if data else []
+        stored = {}
+        self._rewrite([frame for doc in documents
+                       for frame in self._document_frames(document_meta(doc), doc, stored)])
+
+    def _document_frames(self, meta, document, stored):
+        # (meta, frame) for each of document's blobs missing from stored,
+        # which they are added to, then for the document itself.
+        blobs = {}
+        body, codec = encode_body(document, self._codec, self._compress_min_bytes, blobs)
+        frames = []
+        for digest, text in blobs.items():
+            if digest not in stored:
+                stored[digest] = None
+                frames.append(self._blob_frame(digest, text))
+        if blobs:
+            meta["blobs"] = list(blobs)
+        if codec is not None:
+            meta["codec"] = codec
+        frames.append((meta, self._pack(PUT, meta, body)))
+        return frames
+
+    def _blob_frame(self, digest, text):
+        data, codec = encode_blob(text, self._codec, self._compress_min_bytes)
+        meta = {"digest": digest}
+        if codec is not None:
+            meta["codec"] = codec
+        return meta, self._pack(BLOB, meta, data)
+
+    def _frame(self, op, meta, document=None):
+        body = b""
+        if document is not None:
+            body, codec = encode_body(document, self._codec, self._compress_min_bytes)
+            if codec is not None:
+                meta["codec"] = codec
+        return self._pack(op, meta, body)
+
+    def _pack(self, op, meta, body):
+        meta_bytes = pickle.dumps(meta, protocol=pickle.HIGHEST_PROTOCOL)
+        payload = meta_bytes + body
+        header = FRAME.pack(op, len(meta_bytes), len(body), zlib.crc32(payload))
+        return header + payload
+
+    def _open_map(self):
+        if self._map is not None and len(self._map) >= self._end:
+            return self._map
+        self._close_map()
+        with open(self._path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _read(self, header):
+        # None if the record is not where the header says, e.g. because
+        # another process compacted the log since the headers were read.
+        data = self._open_map()
+        if header.offset + header.length > len(data):
+            return None
+        op, meta_len, body_len, crc = FRAME.unpack_from(data, header.offset)
+        start = header.offset + FRAME.size
+        end = start + meta_len + body_len
+        if op != PUT or end - header.offset != header.length or zlib.crc32(data[start:end]) != crc:
+            return None
+        codec = pickle.loads(data[start:start + meta_len]).get("codec")
+        try:
+            return decode_body(data[start + meta_len:end], codec, self._blob)
+        except pickle.UnpicklingError:
+            return None
+
+    def _blob(self, digest):
+        # A blob's text, or None if it is not where the index says.
+        text = self._blob_cache.get(digest)
+        if text is not None:
+            return text
+        if digest not in self._blobs:
+            return None
+        offset, length = self._blobs[digest]
+        data = self._open_map()
+        if offset + length > len(data):
+            return None
+        op, meta_len, body_len, crc = FRAME.unpack_from(data, offset)
+        start = offset + FRAME.size
+        end = start + meta_len + body_len
+        if op != BLOB or end - offset != length or zlib.crc32(data[start:end]) != crc:
+            return None
+        meta = pickle.loads(data[start:start + meta_len])
+        if meta["digest"] != digest:
+            return None
+        text = decode_blob(data[start + meta_len:end], meta.get("codec"))
+        if len(self._blob_cache) >= 4096:
+            self._blob_cache.clear()
+        self._blob_cache[digest] = text
+        return text
+
+    def read(self, doc_id):
+        # Another thread of this process, e.g. the WriteBehind one, may be
+        # writing and remapping the log; other processes never touch the map.
+        with self._lock.threads:
+            document = self._read(self._headers[doc_id])
+            if document is None:
+                self.refresh()
+                document = self._read(self._headers[doc_id])
+                if document is None:
+                    raise KeyError(doc_id)
+            document._revision = self._revisions.get(doc_id, 0)
+            return document
+
+    def _check_revision(self, doc_id, expected):
+        current = self._revisions.get(doc_id, 0)
+        if expected is not None and expected != current:
+            raise StaleWriteError(doc_id, expected, current)
+        return current
+
+    def _append(self, frame):
+        with open(self._path, "ab") as f:
+            start = f.tell()
+            if start < self._end:
+                # The file was removed or truncated underneath us.
+                self._reset()
+            if start == 0:
+                f.write(MAGIC)
+                start = len(MAGIC)
+            f.write(frame)
+        self._end = start + len(frame)
+        self._identity = self._file_identity()
+        return start
+
+    def put(self, document, expected=None):
+        # Stores document as its next revision and returns that revision.
+        # With expected, only if the stored revision is still expected.
+        with self._lock:
+            self.refresh()
+            revision = self._check_revision(document.id, expected) + 1
+            meta = document_meta(document)
+            meta["revision"] = revision
+            frames = self._document_frames(meta, document, ChainMap({}, self._blobs))
+            offset = self._append(b"".join(frame for _, frame in frames))
+            for frame_meta, frame in frames:
+                self._apply(BLOB if "digest" in frame_meta else PUT, frame_meta, offset, len(frame))
+                offset += len(frame)
+            document._revision = revision
+            self._maybe_compact()
+        return revision
+
+    def put_many(self, documents):
+        # Streams a whole batch into the log through one open file and a
+        # single fsync. The headers only change once every record is on
+        # disk; if anything fails the partial batch is cut off again.
+        headers = []
+        revisions = {}
+        with self._lock:
+            self.refresh()
+            with open(self._path, "ab") as f:
+                start = f.tell()
+                if start == 0:
+                    f.write(MAGIC)
+                    start = len(MAGIC)
+                offset = start
+                written = []
+                stored = ChainMap({}, self._blobs)
+                try:
+                    for document in documents:
+                        meta = document_meta(document)
+                        meta["revision"] = revisions.get(
+                            document.id, self._revisions.get(document.id, 0)) + 1
+                        for frame_meta, frame in self._document_frames(meta, document, stored):
+                            f.write(frame)
+                            written.append((frame_meta, offset, len(frame)))
+                            offset += len(frame)
+                        headers.append(DocumentHeader(
+                            document.id, meta["type"], meta["title"], meta["author"],
+                            offset - written[-1][2], written[-1][2]))
+                        revisions[document.id] = meta["revision"]
+                    f.flush()
+                    os.fsync(f.fileno())
+                except BaseException:
+                    f.truncate(start)
+                    raise
+
+            for frame_meta, frame_offset, length in written:
+                self._apply(BLOB if "digest" in frame_meta else PUT, frame_meta, frame_offset, length)
+            self._end = offset
+            self._identity = self._file_identity()
+            self._maybe_compact()
+        return headers
+
+    @instrumentation.timed("store.delete")
+    def delete(self, document_id, expected=None):
+        with self._lock:
+            self.refresh()
+            if document_id not in self._headers:
+                return
+            self._check_revision(document_id, expected)
+            frame = self._frame(DELETE, {"id": document_id})
+            self._apply(DELETE, {"id": document_id}, self._append(frame), len(frame))
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self._dead_bytes < self._compact_min_bytes:
+            return
+        if self._dead_bytes >= self._end * self._compact_ratio:
+            self.compact()
+
+    def compact(self, recode=False):
+        # Live records are copied verbatim, nothing gets unpickled. With
+        # recode every body is written again with the current codec, e.g.
+        # to compress a store saved before compression was turned on, or to
+        # move the long strings of records saved before blobs into blobs.
+        # Blobs no document uses any more are dropped.
+        with self._lock:
+            self.refresh()
+            data = self._open_map()
+
+            def frames():
+                stored = {}
+                for digest, (offset, length) in list(self._blobs.items()):
+                    if self._blob_refs.get(digest):
+                        stored[digest] = None
+                        if recode:
+                            yield self._blob_frame(digest, self._blob(digest))
+                        else:
+                            yield {"digest": digest}, data[offset:offset + length]
+                for header in list(self._headers.values()):
+                    meta = {"id": header.id, "type": header.type_name,
+                            "title": header.title, "author": header.author}
+                    if recode:
+                        yield from self._document_frames(
+                            dict(meta, revision=self._revisions.get(header.id, 0)),
+                            self.read(header.id), stored)
+                    else:
+                        yield (dict(meta, blobs=self._doc_blobs.get(header.id, ())),
+                               data[header.offset:header.offset + header.length])
+
+            self._rewrite(frames())
+
+    @instrumentation.timed("store.rewrite")
+    def _rewrite(self, frames):
+        # frames are (meta, frame) pairs; blobs come before the documents
+        # using them.
+        tmp_path = self._path + ".tmp"
+        headers = {}
+        blobs = {}
+        doc_blobs = {}
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            for meta, frame in frames:
+                if "digest" in meta:
+                    blobs[meta["digest"]] = (f.tell(), len(frame))
+                else:
+                    headers[meta["id"]] = DocumentHeader(
+                        meta["id"], meta["type"], meta["title"], meta["author"],
+                        f.tell(), len(frame))
+                    if meta.get("blobs"):
+                        doc_blobs[meta["id"]] = tuple(meta["blobs"])
+                f.write(frame)
+            end = f.tell()
+            f.flush()
+            os.fsync(f.fileno())
+        self._close_map()
+        os.replace(tmp_path, self._path)
+        self._headers = headers
+        self._blobs = blobs
+        self._doc_blobs = doc_blobs
+        self._count_blob_refs()
+        self._end = end
+        self._dead_bytes = 0
+        self._identity = self._file_identity()
+        self.checkpoint()
+
+    def position(self):
+        # Marks the current end of the log for changes_since().
+        return self._end, self._tail_crc(self._end) if self._end else None
+
+    def changes_since(self, position):
+        # (op, doc_id) for each record appended after position, or None when
+        # the log has been rewritten since and position means nothing.
+        end, end_crc = position
+        if not end:
+            end = len(MAGIC)
+        elif end > self._end or self._tail_crc(end) != end_crc:
+            return None
+        if end >= self._end:
+            return []
+        data = self._open_map()
+        return [(op, meta["id"]) for op, meta, start, stop
+                in self._records(data, end, self._end) if op != BLOB]
+
+    def checkpoint(self):
+        with self._lock:
+            self.refresh()
+            if not self._end or not os.path.exists(self._path):
+                return
+            index = {
+                "end": self._end,
+                "end_crc": self._tail_crc(self._end),
+                "dead": self._dead_bytes,
+                "headers": [tuple(header) for header in self._headers.values()],
+                "revisions": self._revisions,
+                "blobs": self._blobs,
+                "doc_blobs": self._doc_blobs,
+            }
+            tmp_path = self._index_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._index_path)
+            self._checkpoint_end = self._end
+
+    def maybe_checkpoint(self, min_tail_bytes=1 << 20):
+        # Writing the index costs O(documents), so short sessions only do it
+        # once enough records have piled up behind the last checkpoint.
+        if self._end - self._checkpoint_end >= min_tail_bytes:
+            self.checkpoint()
@@ -0,0 +1,86 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from document import Email
+from storage import StaleWriteError, open_store
+
+
+# Many processes writing to one store at once. Each worker saves documents
+# of its own and also appends a token to one shared document through
+# read-modify-write with an expected revision, retrying on StaleWriteError.
+# With no lost updates the shared document ends up with every token.
+def worker(path, number, writes, shared_id, results):
+    store = open_store(path)
+    store.load_headers()
+    conflicts = 0
+    started = time.perf_counter()
+    for n in range(writes):
+        store.put(Email(f"Worker {number} #{n}", f"worker{number}", text="x" * 200))
+        while True:
+            shared = store.read(shared_id)
+            shared.text = f"{shared.text} {number}:{n}"
+            try:
+                store.put(shared, expected=shared._revision)
+                break
+            except StaleWriteError:
+                conflicts += 1
+                store.refresh()
+    results.put({"worker": number, "seconds": time.perf_counter() - started,
+                 "conflicts": conflicts})
+
+
+def run(path, processes=8, writes=50):
+    store = open_store(path)
+    store.load_headers()
+    shared = Email("Shared", "stress")
+    store.put(shared)
+
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=worker, args=(path, number, writes, shared.id, results))
+               for number in range(processes)]
+    started = time.perf_counter()
+    for process in workers:
+        process.start()
+    reports = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    store = open_store(path)
+    store.load_headers()
+    tokens = store.read(shared.id).text.split()
+    expected = {f"{number}:{n}" for number in range(processes) for n in range(writes)}
+    writes_done = processes * writes * 2
+    return {
+        "processes": processes,
+        "writes_per_process": writes,
+        "seconds": elapsed,
+        "writes_per_second": writes_done / elapsed,
+        "conflicts": sum(report["conflicts"] for report in reports),
+        "documents": len(store),
+        "lost_updates": len(expected - set(tokens)),
+        "duplicated_updates": len(tokens) - len(set(tokens)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent writers against one document store.")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=50, help="writes per process and kind")
+    parser.add_argument("--backend", choices=("log", "sqlite"), default="log")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "docs.db" if args.backend == "sqlite" else "docs")
+        report = run(path, args.processes, args.writes)
+    json.dump(dict(report, backend=args.backend), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import pytest
+
+import stress
+from document import Email, Spreadsheet
+from registry import DocumentRegistry
+from storage import LogStore, StaleWriteError
+
+
+@pytest.mark.parametrize("name", ["docs", "docs.db"])
+def test_concurrent_writers_lose_no_updates(tmp_path, name):
+    report = stress.run(str(tmp_path / name), processes=4, writes=25)
+    assert report["lost_updates"] == report["duplicated_updates"] == 0
+    assert report["documents"] == 4 * 25 + 1
+    assert report["writes_per_second"] > 0
+
+
+def test_stale_saves_are_merged_or_rejected(tmp_path, use_store):
+    path = str(tmp_path / "docs")
+    email = Email("Budget", "Ann", "a@b.c", "d@e.f", "Numbers", "Review", "Team")
+    LogStore(path).put(email)
+
+    # Two sessions open the same document
+    sessions = []
+    for _ in range(2):
+        store = LogStore(path)
+        registry = DocumentRegistry(store.load_headers(), store)
+        sessions.append((store, registry, registry.get(email.id)))
+
+    def save(session, document):
+        use_store(session[0], session[1])
+        document.persist()
+
+    first, second = sessions[0][2], sessions[1][2]
+    first.title = "Budget 2025"
+    save(sessions[0], first)
+    second._subject = "Final review"
+    save(sessions[1], second)
+    assert (second.title, second._subject) == ("Budget 2025", "Final review")
+
+    # Both sessions changed the subject: rejected, nothing is written
+    first.text = "Other numbers"
+    first._subject = "Draft"
+    with pytest.raises(StaleWriteError):
+        save(sessions[0], first)
+
+    stored = LogStore(path)
+    stored.load_headers()
+    stored = stored.read(email.id)
+    assert (stored.title, stored._subject, stored.text) == ("Budget 2025", "Final review", "Numbers")
+    assert stored._revision == 3
+
+
+def test_edits_to_different_cells_of_a_sheet_are_merged(tmp_path, use_store):
+    path = str(tmp_path / "docs")
+    sheet = Spreadsheet("Budget", "Ann", "", rows=3, cols=3)
+    sheet.table[0][0] = "1"
+    sheet.table[1][1] = "2"
+    LogStore(path).put(sheet)
+
+    sessions = []
+    for _ in range(2):
+        store = LogStore(path)
+        registry = DocumentRegistry(store.load_headers(), store)
+        sessions.append((store, registry, registry.get(sheet.id)))
+
+    def save(session, document):
+        use_store(session[0], session[1])
+        document.persist()
+
+    first, second = sessions[0][2], sessions[1][2]
+    first.table[0][0] = "10"
+    first.table[2][2] = "=A1*2"
+    save(sessions[0], first)
+    second.table[1][1] = ""
+    second.table[0][1] = "3"
+    save(sessions[1], second)
+    assert sorted(second.to_record()["cells"].items()) == [("A1", "10"), ("B1", "3"), ("C3", "=A1*2")]
+    assert second.table.value(2, 2) == "20"
+
+    # Both sessions changed A1: rejected
+    second.table[0][0] = "5"
+    save(sessions[1], second)
+    first.table[0][0] = "7"
+    with pytest.raises(StaleWriteError):
+        save(sessions[0], first)
+
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    test_concurrent_writers_lose_no_updates(pathlib.Path(tempfile.mkdtemp()), "docs")
@@ -0,0 +1,364 @@
+import warnings
+
+TEXT = "text"
+NUMBER = "number"
+
+STATS = ("sum", "mean", "min", "max", "count")
+
+
+def _format_number(value):
+    if value != value:
+        return ""
+    if float(value).is_integer() and abs(value) < 1e16:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _parse_number(value):
+    if value is None or value == "":
+        return float("nan")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{value!r} is not a number.") from None
+
+
+def aggregate(values, stat, axis=None):
+    # NaN-aware reductions over a column, a row or a whole block of cells.
+    import numpy
+    if stat not in STATS:
+        raise ValueError(f"Unknown statistic {stat!r}, expected one of {', '.join(STATS)}.")
+    if stat == "count":
+        return numpy.count_nonzero(~numpy.isnan(values), axis=axis)
+    if stat == "sum":
+        return numpy.nansum(values, axis=axis)
+    with warnings.catch_warnings():
+        # All-empty slices come back as NaN instead of warning.
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return getattr(numpy, "nan" + stat)(values, axis=axis)
+
+
+# Spreadsheet cells keyed by (row, column). Only cells holding something are
+# stored, so memory follows the populated cells rather than rows * columns.
+# Indexing by row returns a view, so table[row][col] reads and writes work
+# the same way they did on the old list-of-lists grid.
+#
+# Columns switched to NUMBER are kept out of the dict in a contiguous
+# float64 NumPy array instead (NaN marks an empty cell), which is what the
+# vectorized aggregates in Spreadsheet run on. NumPy is only imported once
+# a sheet actually has numeric columns.
+class SparseTable:
+
+    def __init__(self, rows=0, cols=0):
+        self._rows = rows
+        self._cols = cols
+        self._cells = {}
+        self._numeric = {}
+        self._engine = None
+        self._version = 0
+
+    def __getstate__(self):
+        # The formula engine watching the table is rebuilt by its owner.
+        return dict(self.__dict__, _engine=None)
+
+    def __setstate__(self, state):
+        state.setdefault("_numeric", {})
+        state.setdefault("_engine", None)
+        state.setdefault("_version", 0)
+        self.__dict__.update(state)
+
+    def watch(self, engine):
+        # engine.cell_changed(row, col) is called after every write.
+        self._engine = engine
+
+    @classmethod
+    def from_rows(cls, rows, cols=None):
+        rows = list(rows)
+        if cols is None:
+            cols = max((len(row) for row in rows), default=0)
+        table = cls(len(rows), cols)
+        for r, row in enumerate(rows):
+            table[r] = row
+        return table
+
+    @property
+    def rows(self):
+        return self._rows
+
+    @property
+    def cols(self):
+        return self._cols
+
+    @property
+    def version(self):
+        # Bumped by every change to the cells or the shape of the table.
+        return self._version
+
+    def __len__(self):
+        return self._rows
+
+    def __iter__(self):
+        return (_Row(self, r) for r in range(self._rows))
+
+    def __getitem__(self, row):
+        return _Row(self, self._check_row(row))
+
+    def __setitem__(self, row, values):
+        row = self._check_row(row)
+        values = list(values)
+        if len(values) > self._cols:
+            raise ValueError(f"Row must have at most {self._cols} cells.")
+        # Raises before anything changes if a NUMBER column gets text.
+        numbers = {col: _parse_number(values[col] if col < len(values) else None)
+                   for col in self._numeric}
+        # Whichever is fewer: a lookup per column of the row, or a pass over
+        # the populated cells. Filling a sheet row by row stays linear.
+        if self._cols <= len(self._cells):
+            cleared = [(row, col) for col in range(self._cols)
+                       if self._cells.pop((row, col), None) is not None]
+        else:
+            cleared = [key for key in self._cells if key[0] == row]
+            for key in cleared:
+                del self._cells[key]
+        for col, number in numbers.items():
+            self._numeric[col][row] = number
+        self._version += 1
+        for col, value in enumerate(values):
+            if col not in numbers:
+                self.set(row, col, value)
+        if self._engine is not None:
+            for col in numbers:
+                self._engine.cell_changed(row, col)
+            for key in cleared:
+                if key[1] >= len(values):
+                    self._engine.cell_changed(*key)
+
+    def append_rows(self, rows):
+        # Consumes rows one at a time, so a reader over a huge file is never
+        # held in memory as a whole. The table widens to the longest row.
+        # NUMBER columns are collected per column and become arrays at the
+        # end; formulas are linked once, after the last row.
+        start, cols = self._rows, self._cols
+        pending = {col: [] for col in self._numeric}
+        try:
+            for values in rows:
+                row = self._rows
+                self._rows += 1
+                self._cols = max(self._cols, len(values))
+                for col, value in enumerate(values):
+                    if col in pending:
+                        continue
+                    if value != "" and value is not None:
+                        self._cells[(row, col)] = value
+                for col, column in pending.items():
+                    column.append(_parse_number(values[col] if col < len(values) else None))
+        except BaseException:
+            self._cells = {key: value for key, value in self._cells.items() if key[0] < start}
+            self._rows, self._cols = start, cols
+            raise
+        if pending:
+            import numpy
+            for col, column in pending.items():
+                self._numeric[col] = numpy.concatenate([self._numeric[col], column])
+        self._version += 1
+        if self._engine is not None:
+            self._engine.rebuild()
+        return self._rows - start
+
+    def iter_rows(self, values=False):
+        # Rows as lists of strings, one row at a time. With values=True
+        # formulas are replaced by their results.
+        read = self.value if values else self.get
+        for row in range(self._rows):
+            yield [read(row, col) for col in range(self._cols)]
+
+    def __eq__(self, other):
+        if isinstance(other, SparseTable):
+            return ((self._rows, self._cols, {(r, c): v for r, c, v in self.cells()})
+                    == (other._rows, other._cols, {(r, c): v for r, c, v in other.cells()}))
+        return [list(row) for row in self] == other
+
+    def __repr__(self):
+        return f"SparseTable({self._rows}x{self._cols}, {self.populated} cells)"
+
+    def _check_row(self, row):
+        if row < 0:
+            row += self._rows
+        if not 0 <= row < self._rows:
+            raise IndexError("table row out of range")
+        return row
+
+    def _check_col(self, col):
+        if col < 0:
+            col += self._cols
+        if not 0 <= col < self._cols:
+            raise IndexError("table column out of range")
+        return col
+
+    def get(self, row, col, default=""):
+        column = self._numeric.get(col)
+        if column is not None:
+            return _format_number(column[row]) or default
+        return self._cells.get((row, col), default)
+
+    def set(self, row, col, value):
+        row, col = self._check_row(row), self._check_col(col)
+        column = self._numeric.get(col)
+        if column is not None:
+            column[row] = _parse_number(value)
+        elif value == "" or value is None:
+            self._cells.pop((row, col), None)
+        else:
+            self._cells[(row, col)] = value
+        self._version += 1
+        if self._engine is not None:
+            self._engine.cell_changed(row, col)
+
+    def value(self, row, col):
+        # What the cell shows: the result for formulas, the content otherwise.
+        if self._engine is not None and self._engine.is_formula((row, col)):
+            value = self._engine.value((row, col))
+            if value is None or isinstance(value, str):
+                return value or ""
+            return _format_number(value)
+        return self.get(row, col)
+
+    def cells(self):
+        # Populated cells only, in no particular order.
+        for (row, col), value in self._cells.items():
+            yield row, col, value
+        if self._numeric:
+            import numpy
+            for col, column in self._numeric.items():
+                for row in numpy.flatnonzero(~numpy.isnan(column)):
+                    yield int(row), col, _format_number(column[row])
+
+    @property
+    def populated(self):
+        count = len(self._cells)
+        if self._numeric:
+            import numpy
+            count += sum(int(numpy.count_nonzero(~numpy.isnan(column)))
+                         for column in self._numeric.values())
+        return count
+
+    def resize(self, rows, cols):
+        self._cells = {(r, c): value for (r, c), value in self._cells.items()
+                       if r < rows and c < cols}
+        if self._numeric:
+            import numpy
+            numeric = {}
+            for col, column in self._numeric.items():
+                if col < cols:
+                    resized = numpy.full(rows, numpy.nan)
+                    keep = min(rows, self._rows)
+                    resized[:keep] = column[:keep]
+                    numeric[col] = resized
+            self._numeric = numeric
+        self._rows = rows
+        self._cols = cols
+        self._version += 1
+        if self._engine is not None:
+            self._engine.rebuild()
+
+    def column_type(self, col):
+        return NUMBER if self._check_col(col) in self._numeric else TEXT
+
+    def set_column_type(self, col, kind):
+        col = self._check_col(col)
+        if kind not in (TEXT, NUMBER):
+            raise ValueError(f"Unknown column type {kind!r}.")
+        if kind == self.column_type(col):
+            return
+        if kind == NUMBER:
+            import numpy
+            column = numpy.full(self._rows, numpy.nan)
+            keys = [key for key in self._cells if key[1] == col]
+            for key in keys:
+                # Raises before anything changes if a cell is not numeric.
+                column[key[0]] = _parse_number(self._cells[key])
+            for key in keys:
+                del self._cells[key]
+            self._numeric[col] = column
+        else:
+            column = self._numeric.pop(col)
+            for row, value in enumerate(column):
+                if value == value:
+                    self._cells[(row, col)] = _format_number(value)
+        self._version += 1
+        if self._engine is not None:
+            self._engine.column_changed(col)
+
+    def column_array(self, col):
+        # The backing array itself for NUMBER columns; text columns are
+        # parsed into a new array with NaN wherever a cell is not a number.
+        import numpy
+        col = self._check_col(col)
+        if col in self._numeric:
+            return self._numeric[col]
+        column = numpy.full(self._rows, numpy.nan)
+        for (row, c) in self._cells:
+            if c == col:
+                try:
+                    column[row] = float(self.value(row, c))
+                except ValueError:
+                    pass
+        return column
+
+    def set_column_array(self, col, values):
+        import numpy
+        col = self._check_col(col)
+        values = numpy.asarray(values, dtype=float)
+        if values.shape != (self._rows,):
+            raise ValueError(f"Column must have {self._rows} values.")
+        cleared = [key for key in self._cells if key[1] == col]
+        for key in cleared:
+            del self._cells[key]
+        self._numeric[col] = values.copy()
+        self._version += 1
+        if self._engine is not None:
+            for key in cleared:
+                self._engine.cell_changed(*key)
+            self._engine.column_changed(col)
+
+    def row_array(self, row):
+        # The row's values in the NUMBER columns, in numeric_columns() order.
+        import numpy
+        row = self._check_row(row)
+        return numpy.array([self._numeric[col][row] for col in self.numeric_columns()])
+
+    def numeric_columns(self):
+        return sorted(self._numeric)
+
+    def numeric_block(self):
+        # rows x len(numeric_columns()) view over the NUMBER columns.
+        import numpy
+        columns = [self._numeric[col] for col in self.numeric_columns()]
+        if not columns:
+            return numpy.empty((self._rows, 0))
+        return numpy.column_stack(columns)
+
+
+class _Row:
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    def __len__(self):
+        return self._table.cols
+
+    def __iter__(self):
+        return (self._table.get(self._row, col) for col in range(self._table.cols))
+
+    def __getitem__(self, col):
+        return self._table.get(self._row, self._table._check_col(col))
+
+    def __setitem__(self, col, value):
+        self._table.set(self._row, col, value)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
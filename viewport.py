@@ -0,0 +1,114 @@
+import sys
+
+# Cells are drawn the way Spreadsheet._render lays them out: ten characters
+# between two bars.
+CELL_WIDTH = 12
+HIGHLIGHT = "\033[7m"
+RESET = "\033[0m"
+
+
+def cell_text(value):
+    if len(value) > 10:
+        import textwrap
+        value = textwrap.shorten(value, width=10, placeholder="...")
+    return f"|{value:<10}|"
+
+
+# The part of a table that fits the terminal, drawn with absolute cursor
+# positioning from screen line `top` down. `reserved` lines below the grid
+# are left for status messages and prompts.
+#
+# follow() scrolls the window so a cell is on screen, and draw() only writes
+# the screen cells whose text differs from what was drawn last, so moving
+# the cursor or editing a cell costs a handful of writes and even a scroll
+# never costs more than one screenful, however large the table is.
+class Viewport:
+
+    def __init__(self, table, top=1, reserved=3, stream=None, size=None):
+        self._table = table
+        self._top = top
+        self._reserved = reserved
+        self._stream = stream or sys.stdout
+        self._size = size
+        self._screen = None
+        self._drawn = {}
+        self.row = 0
+        self.col = 0
+
+    def _terminal(self):
+        if self._size is not None:
+            return self._size
+        import shutil
+        return tuple(shutil.get_terminal_size())
+
+    @property
+    def rows(self):
+        # Table rows in the window.
+        columns, lines = self._terminal()
+        return max(1, min(self._table.rows, lines - self._top - self._reserved + 1))
+
+    @property
+    def cols(self):
+        columns, lines = self._terminal()
+        return max(1, min(self._table.cols, columns // CELL_WIDTH))
+
+    def follow(self, row, col):
+        # Moves the window as little as possible to bring (row, col) in.
+        if row < self.row:
+            self.row = row
+        elif row >= self.row + self.rows:
+            self.row = row - self.rows + 1
+        if col < self.col:
+            self.col = col
+        elif col >= self.col + self.cols:
+            self.col = col - self.cols + 1
+
+    def invalidate(self):
+        # Everything is drawn again on the next draw().
+        self._drawn = {}
+
+    def draw(self, cursor=None):
+        # Returns how many cells were written.
+        screen = (self._terminal(), self._table.rows, self._table.cols)
+        if screen != self._screen:
+            self._screen = screen
+            self.row = min(self.row, max(self._table.rows - self.rows, 0))
+            self.col = min(self.col, max(self._table.cols - self.cols, 0))
+            if cursor is not None:
+                self.follow(*cursor)
+            if self._drawn:
+                self._clear()
+        written = 0
+        for line in range(min(self.rows, self._table.rows - self.row)):
+            row = self.row + line
+            for slot in range(min(self.cols, self._table.cols - self.col)):
+                col = self.col + slot
+                text = cell_text(self._table.value(row, col))
+                if (row, col) == cursor:
+                    text = HIGHLIGHT + text + RESET
+                if self._drawn.get((line, slot)) != text:
+                    self._drawn[(line, slot)] = text
+                    self._move(self._top + line, slot * CELL_WIDTH + 1)
+                    self._stream.write(text)
+                    written += 1
+        self._stream.flush()
+        return written
+
+    def _clear(self):
+        # The window changed shape, e.g. the terminal was resized.
+        self._drawn = {}
+        self._move(self._top, 1)
+        self._stream.write("\033[J")
+
+    def _move(self, line, column):
+        self._stream.write(f"\033[{line};{column}H")
+
+    def status_line(self, offset=0):
+        # Puts the cursor at the start of a reserved line and clears it.
+        self._move(self._top + self.rows + offset, 1)
+        self._stream.write("\033[K")
+
+    def status(self, text, offset=0):
+        self.status_line(offset)
+        self._stream.write(text)
+        self._stream.flush()
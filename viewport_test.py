@@ -0,0 +1,59 @@
+import io
+
+import keys
+import viewport
+from document import Spreadsheet
+from table import SparseTable
+from viewport import CELL_WIDTH, Viewport
+
+
+def test_only_the_visible_cells_are_drawn():
+    table = SparseTable(100000, 500)
+    table[0][0] = "first"
+    table[99999][499] = "last"
+    out = io.StringIO()
+    # 5 columns and 10 rows fit, with 3 lines left for the prompts
+    view = Viewport(table, top=1, stream=out, size=(5 * CELL_WIDTH + 3, 13))
+    assert (view.rows, view.cols) == (10, 5)
+
+    assert view.draw(cursor=(0, 0)) == 50
+    assert "first" in out.getvalue()
+
+    # Moving the cursor redraws the old and the new cursor cell only
+    assert view.draw(cursor=(0, 1)) == 2
+    table[3][2] = "edited"
+    assert view.draw(cursor=(0, 1)) == 1
+    assert view.draw(cursor=(0, 1)) == 0
+
+    # Walking off the window scrolls it by one
+    view.follow(10, 1)
+    assert (view.row, view.col) == (1, 0)
+    view.follow(99999, 499)
+    assert (view.row, view.col) == (99990, 495)
+    out.truncate(0)
+    assert view.draw(cursor=(99999, 499)) <= 50
+    assert "last" in out.getvalue() and "first" not in out.getvalue()
+
+
+def test_navigating_a_sheet_follows_the_cursor(monkeypatch, capsys):
+    sheet = Spreadsheet("Budget", "Ann", "", rows=1000, cols=50)
+    sheet.table[999][49] = "corner"
+    monkeypatch.setattr("shutil.get_terminal_size", lambda *args: (80, 24))
+    written = []
+    draw = Viewport.draw
+    monkeypatch.setattr(viewport.Viewport, "draw",
+                        lambda self, cursor=None: written.append(draw(self, cursor)))
+    previous = keys.use(keys.ScriptedKeySource(["down"] * 999 + ["right"] * 49))
+    try:
+        sheet._navigate_cells()
+    finally:
+        keys.use(previous)
+    output = capsys.readouterr().out
+    assert "Currently at cell (999, 49): corner" in output
+    # 6 columns by 21 rows fit; no step draws more than that
+    assert len(written) == 1 + 999 + 49
+    assert max(written) == 6 * 21
+
+
+if __name__ == "__main__":
+    test_only_the_visible_cells_are_drawn()
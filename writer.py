@@ -0,0 +1,110 @@
+import threading
+import time
+
+
+# Saves documents on a background thread so the interactive loop never waits
+# on disk. submit() only takes note of the document; saving the same
+# document again before the thread got to it replaces the earlier save
+# instead of queueing a second one. The thread waits until saves have been
+# quiet for `delay` seconds, or `max_delay` seconds have passed since the
+# oldest pending one, and then writes everything pending in one go.
+#
+# At most `max_pending` documents wait at a time; past that submit() blocks
+# until the thread has caught up. Failed writes are kept in errors as
+# (document, exception) pairs for the caller to report.
+class WriteBehind:
+
+    def __init__(self, write, delay=0.2, max_delay=2.0, max_pending=64):
+        self._write = write
+        self._delay = delay
+        self._max_delay = max_delay
+        self._max_pending = max_pending
+        self._pending = {}
+        self._writing = {}
+        self._first = self._last = 0.0
+        self._waiters = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self.errors = []
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._pending) + len(self._writing)
+
+    def pending(self, doc_id):
+        with self._condition:
+            return doc_id in self._pending or doc_id in self._writing
+
+    def submit(self, document):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The writer has been closed.")
+            while document.id not in self._pending and len(self._pending) >= self._max_pending:
+                self._condition.wait()
+            now = time.monotonic()
+            if not self._pending:
+                self._first = now
+            self._last = now
+            self._pending[document.id] = document
+            self._condition.notify_all()
+
+    def wait(self, doc_id):
+        # Blocks while doc_id is still waiting to be written, e.g. before
+        # the document is changed again. Returns at once otherwise.
+        with self._condition:
+            if doc_id not in self._pending and doc_id not in self._writing:
+                return
+            self._waiters += 1
+            self._condition.notify_all()
+            try:
+                while doc_id in self._pending or doc_id in self._writing:
+                    self._condition.wait()
+            finally:
+                self._waiters -= 1
+
+    def flush(self):
+        # Writes everything pending right away and returns once it is done.
+        with self._condition:
+            self._waiters += 1
+            self._condition.notify_all()
+            try:
+                while self._pending or self._writing:
+                    self._condition.wait()
+            finally:
+                self._waiters -= 1
+
+    def close(self):
+        # Final flush, then the thread stops. Safe to call more than once.
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _due(self):
+        if self._closed or self._waiters:
+            return 0.0
+        return min(self._last + self._delay, self._first + self._max_delay) - time.monotonic()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                remaining = self._due()
+                while remaining > 0:
+                    self._condition.wait(remaining)
+                    remaining = self._due()
+                self._writing, self._pending = self._pending, {}
+                self._condition.notify_all()
+            for document in self._writing.values():
+                try:
+                    self._write(document)
+                except Exception as error:
+                    self.errors.append((document, error))
+            with self._condition:
+                self._writing = {}
+                self._condition.notify_all()
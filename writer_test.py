@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from document import Document, Email, refresh_documents
+from storage import DocumentHeader, open_store
+from writer import WriteBehind
+
+
+def test_bursts_are_coalesced_into_one_flush():
+    written = []
+    gate = threading.Event()
+
+    def write(document):
+        gate.wait()
+        written.append(document.title)
+
+    writer = WriteBehind(write, delay=0.05, max_delay=5.0)
+    first = Email("Draft 1", "Ann", "a@b.c", "d@e.f", "Body", "Subject", "Bob")
+    second = Email("Other", "Ann", "a@b.c", "d@e.f", "Body", "Subject", "Bob")
+    for title in ("Draft 1", "Draft 2", "Draft 3"):
+        first.title = title
+        writer.submit(first)
+    writer.submit(second)
+    assert len(writer) == 2 and writer.pending(first.id)
+
+    gate.set()
+    writer.flush()
+    assert sorted(written) == ["Draft 3", "Other"]
+    assert not writer.pending(first.id)
+
+    # Nothing is written until saves have been quiet for the delay
+    written.clear()
+    writer.submit(first)
+    time.sleep(0.01)
+    assert written == []
+    writer.close()
+    assert written == ["Draft 3"]
+
+
+def test_interactive_saves_return_before_the_write(store, monkeypatch):
+    writer = WriteBehind(lambda document: document.write_to(store), delay=60)
+    monkeypatch.setattr(Document, "writer", writer)
+
+    email = Email("Invoice", "Ann", "a@b.c", "d@e.f", "Please pay", "Payment", "Bob")
+    email.persist()
+    assert email.id not in store
+    assert email.id in Document.saved_documents
+    assert Document.search_index.search("invoice") == {email.id}
+
+    # Still pending, so it stays loaded instead of going back to a header
+    Document.release(email.id)
+    assert Document.saved_documents.header_for(email.id) is email
+
+    # and is released once the writer has saved it
+    writer.flush()
+    refresh_documents()
+    assert isinstance(Document.saved_documents.header_for(email.id), DocumentHeader)
+    assert Document.deferred_releases == set()
+
+    # Removing a document writes everything pending first
+    other = Email("Reminder", "Ann", "a@b.c", "d@e.f", "Overdue", "Payment", "Bob")
+    other.persist()
+    Document.discard(email.id)
+    assert email.id not in store and other.id in store
+    assert store.read(other.id).title == "Reminder"
+    writer.close()
+    assert writer.errors == []
+
+
+@pytest.mark.parametrize("name", ["docs", "docs.db"])
+def test_reads_during_background_writes(tmp_path, name):
+    # Compacting after every write keeps remapping the log under the reader.
+    options = {"compact_min_bytes": 0} if name == "docs" else {}
+    store = open_store(str(tmp_path / name), **options)
+    emails = [Email(f"Report {n}", "Ann", "a@b.c", "d@e.f", "x" * 300, "", "") for n in range(10)]
+    store.put_many(emails)
+
+    def write():
+        for n in range(300):
+            email = Email(f"Report {n}", "Ann", "a@b.c", "d@e.f", "y" * (300 + n), "", "")
+            email._id = emails[n % 10].id
+            store.put(email)
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    while thread.is_alive():
+        for email in emails:
+            store.read(email.id)
+    thread.join()
+    assert store.read(emails[9].id).text.count("y") == 599
+
+
+def test_failed_saves_at_exit_are_reported(store, monkeypatch, capsys):
+    import document
+    monkeypatch.setattr(Document, "writer", None)
+    hooks = []
+    monkeypatch.setattr(document.atexit, "register", hooks.append)
+    document.init()
+
+    def fail(document):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(Document.writer, "_write", fail)
+    Email("Invoice", "Ann", "a@b.c", "d@e.f", "Please pay", "Payment", "Bob").persist()
+    capsys.readouterr()
+    for hook in reversed(hooks):
+        hook()
+    assert "Could not save 'Invoice': disk full" in capsys.readouterr().out
+
+
+if __name__ == "__main__":
+    test_bursts_are_coalesced_into_one_flush()